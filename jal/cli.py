@@ -0,0 +1,203 @@
+import os
+import sys
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+from jal.db.helpers import get_app_path, init_and_check_db, LedgerInitError
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Command line interface that runs heavy operations (ledger rebuild, statement import, quotes update and tax reports
+# export) without GUI. Every operation is executed for one or several database files, different files are processed
+# in parallel by separate processes. Progress is reported to stdout, exit status is non-zero if any error was logged.
+#   jal-cli --db jal.sqlite rebuild --full
+#   jal-cli --db a.sqlite --db b.sqlite quotes --begin 2022-01-01
+#   jal-cli --db jal.sqlite import ibkr statement.xml
+#   jal-cli --db jal.sqlite taxes --account 1 --year 2021 --folder reports
+# ----------------------------------------------------------------------------------------------------------------------
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Replacement of GUI progress bar (and main window that shows it) for Ledger.rebuild()
+class ConsoleProgress:
+    STEP = 5    # percents between progress messages
+
+    def __init__(self, name):
+        self._name = name
+        self._maximum = 0
+        self._reported = -self.STEP
+
+    def showProgressBar(self, visible):
+        if not visible and self._reported < 100:
+            self._report(100)
+
+    def setRange(self, _minimum, maximum):
+        self._maximum = maximum
+        self._reported = -self.STEP
+
+    def setValue(self, value):
+        if self._maximum > 0:
+            percent = int(100 * value / self._maximum)
+            if percent >= self._reported + self.STEP:
+                self._report(percent)
+
+    def _report(self, percent):
+        self._reported = percent
+        print(f"{self._name}: {percent}%", flush=True)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Returns UTC timestamp of the start of given date 'YYYY-MM-DD'
+def date_timestamp(text):
+    try:
+        return int(datetime.strptime(text, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{text}', YYYY-MM-DD is expected")
+
+
+def rebuild(db_file, args):
+    from jal.db.ledger import Ledger
+    ledger = Ledger()
+    progress = ConsoleProgress(os.path.basename(db_file))
+    ledger.setProgressBar(progress, progress)
+    from_timestamp = 0 if args.full else (-1 if args.begin is None else args.begin)
+    return ledger.rebuild(from_timestamp=from_timestamp, parallel=args.parallel, confirm=False)
+
+
+def import_statement(db_file, args):
+    from jal.data_import.statements import Statements
+    statements = Statements(None)
+    statement_loader = statements.find(args.format)
+    if statement_loader is None:
+        logging.error(f"Unknown statement format '{args.format}', known formats are: " +
+                      ", ".join([x['module'].split('.')[-1] for x in statements.items]))
+        return False
+    if not statements.import_statement(statement_loader, args.file, interactive=False):
+        return False
+    return rebuild(db_file, argparse.Namespace(full=False, begin=None, parallel=False)) if args.rebuild else True
+
+
+def update_quotes(_db_file, args):
+    from jal.net.downloader import QuoteDownloader
+    end = args.end if args.end is not None else int(datetime.now(tz=timezone.utc).timestamp())
+    QuoteDownloader().UpdateQuotes(args.begin, end)
+    return True
+
+
+def export_taxes(db_file, args):
+    from jal.data_export.tax_batch import export_tax_reports
+    folder = args.folder
+    if len(args.db) > 1:     # Reports of different databases would have the same names
+        folder = folder + os.sep + os.path.splitext(os.path.basename(db_file))[0]
+    os.makedirs(folder, exist_ok=True)
+    saved = export_tax_reports(db_file, args.account, args.year, folder, use_settlement=not args.no_settlement,
+                               max_workers=args.workers)
+    for file_name in sorted(saved.values()):
+        logging.info(f"Tax report saved: {file_name}")
+    return len(saved) == len(args.account) * len(args.year)
+
+
+COMMANDS = {
+    'rebuild': rebuild,
+    'import': import_statement,
+    'quotes': update_quotes,
+    'taxes': export_taxes
+}
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Runs command given in 'args' for one database file. Returns True if it was completed without errors
+def run_command(db_file, args):
+    name = os.path.basename(db_file)
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, force=True,
+                        format=f"%(asctime)s {name}: %(levelname)s %(message)s")
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+    db_file = os.path.abspath(db_file)
+    if not os.path.isfile(db_file):
+        logging.error(f"Database file doesn't exist: {db_file}")
+        return False
+    error = init_and_check_db(get_app_path(), db_file=db_file)
+    if error.code == LedgerInitError.EmptyDbInitialized:
+        error = init_and_check_db(get_app_path(), db_file=db_file)
+    if error.code != LedgerInitError.DbInitSuccess:
+        logging.error(f"{error.message} {error.details}")
+        return False
+    try:
+        result = COMMANDS[args.command](db_file, args)
+    except Exception as e:
+        logging.exception(f"Command '{args.command}' failed: {e}")
+        return False
+    return result is not False and errors.count == 0
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog="jal-cli", description="Runs JAL operations without graphical interface")
+    parser.add_argument("--db", action="append", required=True, metavar="FILE",
+                        help="database file (may be given several times to process files in parallel)")
+    parser.add_argument("--jobs", type=int, default=None, help="number of databases to process simultaneously")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild_parser = commands.add_parser("rebuild", help="rebuild ledger")
+    rebuild_range = rebuild_parser.add_mutually_exclusive_group()
+    rebuild_range.add_argument("--full", action="store_true", help="rebuild ledger from scratch")
+    rebuild_range.add_argument("--begin", type=date_timestamp, default=None, metavar="YYYY-MM-DD",
+                               help="rebuild ledger from given date (default: from ledger frontier)")
+    rebuild_parser.add_argument("--parallel", action="store_true", help="process accounts in parallel")
+
+    import_parser = commands.add_parser("import", help="import broker statement")
+    import_parser.add_argument("format", help="statement plugin (i.e. 'ibkr' or 'StatementIBKR')")
+    import_parser.add_argument("file", help="statement file")
+    import_parser.add_argument("--rebuild", action="store_true", help="rebuild ledger after import")
+
+    quotes_parser = commands.add_parser("quotes", help="download quotes")
+    quotes_parser.add_argument("--begin", type=date_timestamp, required=True, metavar="YYYY-MM-DD")
+    quotes_parser.add_argument("--end", type=date_timestamp, default=None, metavar="YYYY-MM-DD",
+                               help="default: now")
+
+    taxes_parser = commands.add_parser("taxes", help="export russian tax reports")
+    taxes_parser.add_argument("--account", type=int, action="append", required=True, help="account id")
+    taxes_parser.add_argument("--year", type=int, action="append", required=True)
+    taxes_parser.add_argument("--folder", required=True, help="folder for report files")
+    taxes_parser.add_argument("--no-settlement", action="store_true", help="use trade date instead of settlement")
+    taxes_parser.add_argument("--workers", type=int, default=None, help="number of processes per database")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(sys.argv[1:] if argv is None else argv)
+    if len(args.db) == 1:
+        failed = [] if run_command(args.db[0], args) else args.db
+    else:
+        failed = []
+        # Every database is processed in a separate process as DB connection is global for a process.
+        # Processes are spawned as fork isn't safe for a process that has Qt objects
+        with ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {pool.submit(run_command, db_file, args): db_file for db_file in args.db}
+            for future in as_completed(futures):
+                try:
+                    success = future.result()
+                except Exception as e:
+                    print(f"{futures[future]}: {e}", flush=True)
+                    success = False
+                if not success:
+                    failed.append(futures[future])
+    if failed:
+        print(f"Failed: {', '.join(failed)}", flush=True)
+        return 1
+    return 0
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(main())
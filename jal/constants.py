@@ -14,8 +14,19 @@ class Setup:
     REPORT_PATH = "reports"
     STATEMENT_PATH = "broker_statements"
     TEMPLATE_PATH = "templates"
+    PLUGINS_MANIFEST = "plugins.json"
+    STARTUP_TIME_TARGET = 2.0      # Seconds from application start till main window is shown
     UPDATE_PREFIX = 'jal_delta_'
-    TARGET_SCHEMA = 31
+    CATEGORY_MODEL = 'jal_categories.npz'
+    CATEGORY_MODEL_TF = 'jal_categories.keras'
+    TARGET_SCHEMA = 38
+    SQL_SLOW_QUERY_TIME = 0.1      # Seconds, SQL queries that run longer are logged if SQL profiling is enabled
+    REBUILD_CHUNK_SIZE = 1000      # Number of operations that are committed together during ledger rebuild
+    DB_CACHE_SIZE = -65536         # SQLite page cache size per connection, negative value is a size in KiB
+    DB_MMAP_SIZE = 268435456       # Bytes of database file that SQLite accesses via memory mapping
+    REPORT_THREADS = 2             # Number of threads that calculate reports in background
+    REPORT_CHUNK_SIZE = 500        # Report rows are displayed by portions of this size while report is calculated
+    MOEX_INFO_REFRESH = 2592000    # Seconds, MOEX board of an asset is resolved again when its stored value is older
     CALC_TOLERANCE = 1e-10
     DISP_TOLERANCE = 1e-4
 
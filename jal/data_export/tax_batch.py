@@ -0,0 +1,82 @@
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from jal.db.helpers import init_readonly_db
+from jal.data_export.taxes import TaxesRus
+from jal.data_export.xlsx import XLSX
+
+
+TAX_REPORT_TEMPLATES = {
+    "Дивиденды": "tax_rus_dividends.json",
+    "Акции": "tax_rus_trades.json",
+    "Облигации": "tax_rus_bonds.json",
+    "ПФИ": "tax_rus_derivatives.json",
+    "Корп.события": "tax_rus_corporate_actions.json",
+    "Комиссии": "tax_rus_fees.json",
+    "Проценты": "tax_rus_interests.json"
+}
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Returns parameters that are used in headers of tax report sheets for given prepared 'taxes' object
+def tax_report_parameters(taxes):
+    return {
+        "period": f"{datetime.utcfromtimestamp(taxes.year_begin).strftime('%d.%m.%Y')}"
+                  f" - {datetime.utcfromtimestamp(taxes.year_end - 1).strftime('%d.%m.%Y')}",
+        "account": f"{taxes.account_number} ({taxes.account_currency})",
+        "currency": taxes.account_currency,
+        "broker_name": taxes.broker_name,
+        "broker_iso_country": taxes.broker_iso_cc
+    }
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Puts all sections of 'tax_report' into xlsx-file 'xls_filename' with help of report templates
+def save_tax_report(xls_filename, tax_report, parameters, constant_memory=False):
+    reports_xls = XLSX(xls_filename, constant_memory=constant_memory)
+    for section in tax_report:
+        if section not in TAX_REPORT_TEMPLATES:
+            continue
+        reports_xls.output_data(tax_report[section], TAX_REPORT_TEMPLATES[section], parameters)
+    reports_xls.save()
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Worker process initializer - every worker keeps its own read-only connection to the database
+def _init_worker(db_file):
+    if not init_readonly_db(db_file):
+        raise RuntimeError(f"Can't open DB file '{db_file}'")
+
+
+# Prepares tax report for one account and one year and saves it into xlsx-file. Returns name of the file
+def _export_tax_report(account_id, year, xls_filename, use_settlement):
+    taxes = TaxesRus()
+    tax_report = taxes.prepare_tax_report(year, account_id, use_settlement=use_settlement)
+    save_tax_report(xls_filename, tax_report, tax_report_parameters(taxes), constant_memory=True)
+    return xls_filename
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Generates tax reports for every combination of accounts and years from the lists given.
+# Reports are prepared in parallel by a pool of 'max_workers' processes (number of CPUs by default) and
+# each report is saved into separate file '<folder>/taxes_<account_id>_<year>.xlsx'.
+# Returns dictionary (account_id, year) -> file name for reports that were saved successfully
+def export_tax_reports(db_file, accounts, years, folder, use_settlement=True, max_workers=None):
+    jobs = {}
+    for account_id in accounts:
+        for year in years:
+            jobs[(account_id, year)] = folder + os.sep + f"taxes_{account_id}_{year}.xlsx"
+    saved = {}
+    # Workers are spawned as fork isn't safe for a process that has Qt objects
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(db_file,)) as pool:
+        futures = {pool.submit(_export_tax_report, job[0], job[1], jobs[job], use_settlement): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                saved[futures[future]] = future.result()
+            except Exception as e:
+                logging.error(f"Tax report failed for account {futures[future][0]}, year {futures[future][1]}: {e}")
+    return saved
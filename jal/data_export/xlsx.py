@@ -30,9 +30,12 @@ class XLSX:
     COL_DESCR = -1
     START_ROW = 9
 
-    def __init__(self, xlsx_filename):
+    # constant_memory=True makes xlsxwriter flush every row to disk as soon as next row is started,
+    # so all cells should be written in row order (see add_data_row() for merged cells)
+    def __init__(self, xlsx_filename, constant_memory=False):
         self.filename = xlsx_filename
-        self.workbook = xlsxwriter.Workbook(filename=xlsx_filename)
+        self.constant_memory = constant_memory
+        self.workbook = xlsxwriter.Workbook(filename=xlsx_filename, options={'constant_memory': constant_memory})
         self.formats = xslxFormat(self.workbook)
 
     def tr(self, text):
@@ -44,14 +47,16 @@ class XLSX:
         except:
             logging.error(self.tr("Can't save report into file ") + f"'{self.filename}'")
 
-    def load_template(self, file):
+    @staticmethod
+    def load_template(file):
         template = None
         file_path = get_app_path() + Setup.EXPORT_PATH + os.sep + Setup.TEMPLATE_PATH + os.sep + file
         try:
             with open(file_path, 'r', encoding='utf-8') as json_file:
                 template = json.load(json_file)
         except Exception as e:
-            logging.error(self.tr("Can't load report template from file ") + f"'{file_path}' ({e})")
+            logging.error(QApplication.translate("XLSX", "Can't load report template from file ") +
+                          f"'{file_path}' ({e})")
         return template
 
     def output_data(self, data, template_file, parameters):
@@ -95,14 +100,22 @@ class XLSX:
             title = column['name'].format(parameters=parameters)
             sheet.write(start_row, i, title, self.formats.ColumnHeader())
             sheet.set_column(i, i, column['width'])
-            if numbered:
+        if numbered:
+            for i, column in enumerate(columns):
                 sheet.write(start_row + 1, i,  f"({i + 1})", self.formats.ColumnHeader())
         last_row = start_row+2 if numbered else start_row+1
         return last_row
 
+    # Cells are written in row order, cells of merged ranges are padded with blanks row by row and
+    # ranges are merged after all rows of the template are written
     def add_data_row(self, sheet, start_row, values, template, even_odd=1):
+        spans = []
+        covered = {}    # (row, col) -> format of blank cells that belong to merged ranges
         for row, row_template in enumerate(template['rows']):
             for col, column_key in enumerate(row_template):
+                if (row, col) in covered:
+                    sheet.write_blank(start_row+row, col, None, covered.pop((row, col)))
+                    continue
                 if column_key is None:
                     continue
                 try:
@@ -114,11 +127,21 @@ class XLSX:
                 except KeyError:
                     logging.warning(self.tr("Format is missing for report field: ") + column_key)
                     value_format = self.formats.Text(even_odd)
+                sheet.write(start_row+row, col, value, value_format)
                 if 'span' in template and not template['span'][row][col] is None:
                     span = template['span'][row][col]
-                    sheet.merge_range(start_row+row, col, start_row+row+span['v'], col+span['h'], value, value_format)
-                else:
-                    sheet.write(start_row+row, col, value, value_format)
+                    spans.append([start_row+row, col, start_row+row+span['v'], col+span['h'], value, value_format])
+                    for i in range(row, row + span['v'] + 1):
+                        for j in range(col, col + span['h'] + 1):
+                            if (i, j) != (row, col):
+                                covered[(i, j)] = value_format
+            for col in sorted(x[1] for x in covered if x[0] == row):   # Blanks beyond the end of row template
+                sheet.write_blank(start_row+row, col, None, covered.pop((row, col)))
+        for first_row, first_col, last_row, last_col, value, value_format in spans:
+            if self.constant_memory:   # merge_range() refuses ranges that start in rows already flushed to disk
+                sheet.merge.append([first_row, first_col, last_row, last_col])
+            else:
+                sheet.merge_range(first_row, first_col, last_row, last_col, value, value_format)
         return len(template['rows'])
 
     def apply_format(self, value, format_string, even_odd=1):
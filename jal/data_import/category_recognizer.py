@@ -1,6 +1,11 @@
+import os
 import re
-import pandas as pd
-from jal.db.helpers import executeSQL, readSQLrecord
+import json
+import hashlib
+import logging
+import numpy as np
+from jal.constants import Setup
+from jal.db.helpers import db_connection, executeSQL, readSQLrecord
 
 #----------------------------------------------------------------------------------------------------------------------
 
@@ -22,67 +27,205 @@ def clean_text(text):
 #----------------------------------------------------------------------------------------------------------------------
 
 
-def recognize_categories(purchases):
+# Text classifier that is a multinomial naive Bayes model over bag of words of cleaned slip item names.
+# Words of classified item are weighted by TF-IDF so rare (i.e. more specific) words have more influence.
+# Model keeps only occurrence counts so it may be trained incrementally by new samples.
+class CategoryClassifier:
+    ALPHA = 0.1     # Additive (Lidstone) smoothing of word probabilities
+
+    def __init__(self):
+        self.signature = ''                             # hash of map_category records used for training
+        self.last_id = 0                                # id of last map_category record used for training
+        self.categories = []                            # category id for every class
+        self.vocabulary = {}                            # word -> column index
+        self.counts = np.zeros((0, 0))                  # [class, word] -> number of word occurrences
+        self.samples = np.zeros(0)                      # [class] -> number of samples
+        self.frequency = np.zeros(0)                    # [word] -> number of samples that contain the word
+
+    # Adds samples 'texts' with categories 'category_ids' to the model. Vocabulary and list of categories are
+    # extended first so count matrices are resized only once and then all occurrences are added at once
+    def train(self, texts, category_ids):
+        samples = [clean_text(text).split() for text in texts]
+        category_ids = list(category_ids)
+        for words, category_id in zip(samples, category_ids):
+            if category_id not in self.categories:
+                self.categories.append(category_id)
+            for word in words:
+                if word not in self.vocabulary:
+                    self.vocabulary[word] = len(self.vocabulary)
+        new_classes = len(self.categories) - self.counts.shape[0]
+        new_words = len(self.vocabulary) - self.counts.shape[1]
+        self.counts = np.pad(self.counts, ((0, new_classes), (0, new_words)))
+        self.samples = np.pad(self.samples, (0, new_classes))
+        self.frequency = np.pad(self.frequency, (0, new_words))
+        class_index = {category_id: i for i, category_id in enumerate(self.categories)}
+        classes = np.array([class_index[x] for x in category_ids], dtype=np.int64)
+        rows = np.repeat(classes, [len(words) for words in samples])
+        columns = np.array([self.vocabulary[word] for words in samples for word in words], dtype=np.int64)
+        np.add.at(self.counts, (rows, columns), 1)
+        unique_columns = np.array([self.vocabulary[word] for words in samples for word in set(words)], dtype=np.int64)
+        np.add.at(self.frequency, unique_columns, 1)
+        np.add.at(self.samples, classes, 1)
+
+    # Returns lists of predicted category ids and probabilities of these predictions for given texts
+    def predict(self, texts):
+        if not self.categories:
+            return [0] * len(texts), [0.0] * len(texts)
+        X = np.zeros((len(texts), len(self.vocabulary)))
+        for i, text in enumerate(texts):
+            columns = [self.vocabulary[x] for x in clean_text(text).split() if x in self.vocabulary]
+            np.add.at(X[i], columns, 1)
+        total = self.samples.sum()
+        idf = np.log((total + 1) / (self.frequency + 1)) + 1
+        log_prior = np.log(self.samples / total)
+        log_likelihood = np.log((self.counts + self.ALPHA) /
+                                (self.counts.sum(axis=1, keepdims=True) + self.ALPHA * len(self.vocabulary)))
+        scores = log_prior + (X * idf) @ log_likelihood.T
+        scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+        probability = scores / scores.sum(axis=1, keepdims=True)
+        result_idx = probability.argmax(axis=1)
+        return [self.categories[i] for i in result_idx], probability.max(axis=1).tolist()
+
+    def save(self, filename):
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        try:
+            with open(filename, 'wb') as model_file:
+                np.savez(model_file, signature=np.array(self.signature), last_id=np.array(self.last_id),
+                         categories=np.array(self.categories, dtype=np.int64), terms=np.array(terms, dtype=str),
+                         counts=self.counts, samples=self.samples, frequency=self.frequency)
+        except OSError as e:
+            logging.warning(f"Can't save category model into '{filename}': {e}")
+
+    # Returns classifier loaded from file or None if there is no valid model in the file
+    @classmethod
+    def load(cls, filename):
+        if not os.path.isfile(filename):
+            return None
+        model = cls()
+        try:
+            with np.load(filename, allow_pickle=False) as data:
+                model.signature = str(data['signature'])
+                model.last_id = int(data['last_id'])
+                model.categories = data['categories'].tolist()
+                model.vocabulary = {term: i for i, term in enumerate(data['terms'].tolist())}
+                model.counts = data['counts']
+                model.samples = data['samples']
+                model.frequency = data['frequency']
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Can't load category model from '{filename}': {e}")
+            return None
+        return model
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Returns path for a model file that is kept in the same folder as the database
+def model_path(file_name):
+    return os.path.dirname(os.path.abspath(db_connection().databaseName())) + os.sep + file_name
+
+
+# Reads 'map_category' table and returns list of (id, value, mapped_to) records together with list of
+# table content hashes - i-th hash is calculated for records from the first one up to i-th record
+def read_category_mappings():
+    records = []
+    hashes = []
+    content_hash = hashlib.sha1()
+    query = executeSQL("SELECT id, value, mapped_to FROM map_category ORDER BY id")
+    while query.next():
+        record_id, value, mapped_to = readSQLrecord(query)
+        records.append((record_id, value, mapped_to))
+        content_hash.update(f"{record_id}\t{value}\t{mapped_to}\n".encode('utf-8'))
+        hashes.append(content_hash.hexdigest())
+    return records, hashes
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Returns classifier that is trained on the current content of 'map_category' table.
+# Model is kept in a file and it is re-used if table wasn't changed. If new records were only appended to the table
+# since last training then model is trained incrementally by these records. Otherwise model is trained from scratch.
+def category_classifier():
+    filename = model_path(Setup.CATEGORY_MODEL)
+    records, hashes = read_category_mappings()
+    model = CategoryClassifier.load(filename)
+    if model is not None:
+        trained = [i for i, record in enumerate(records) if record[0] == model.last_id]
+        if not trained or hashes[trained[0]] != model.signature:
+            model = None
+        else:
+            records = records[trained[0] + 1:]
+    if model is None:
+        model = CategoryClassifier()
+    if records:
+        model.train([x[1] for x in records], [x[2] for x in records])
+        model.last_id = records[-1][0]
+        model.signature = hashes[-1]
+        model.save(filename)
+    return model
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Returns lists of category ids and probabilities of recognition for every item name in 'purchases'
+# Naive Bayes classifier is used by default. TensorFlow neural network may be used as an alternative if it is installed
+def recognize_categories(purchases, use_tensorflow=False):
+    if use_tensorflow:
+        return recognize_categories_tf(purchases)
+    return category_classifier().predict(purchases)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Neural network classifier. Trained model and tokenizer are saved next to the database together with a hash of
+# 'map_category' table content and are re-used until table is modified.
+def recognize_categories_tf(purchases):
     import tensorflow as tf
     import tensorflow.keras as keras
     tf.get_logger().setLevel('WARNING')
 
-    # Load only categories that were used for import
-    query = executeSQL("SELECT DISTINCT mapped_to AS category FROM map_category")
-    table = []
-    classes_number = 0
-    while query.next():
-        category = readSQLrecord(query)
-        table.append({
-            'idx': classes_number,
-            'category': category
-        })
-        classes_number += 1
-    categories = pd.DataFrame(table)
-
-    # Load data from DB into pandas dataframe
-    query = executeSQL("SELECT value, mapped_to FROM map_category")
-    table = []
-    while query.next():
-        value, mapped_to = readSQLrecord(query)
-        table.append({
-            'value': value,
-            'mapped_to': mapped_to
-        })
-    data = pd.DataFrame(table)
-    data = data.merge(categories, left_on="mapped_to", right_on='category')
-    data = data.drop(columns=['mapped_to', 'category'])     # we don't need this column as we will use custom 'idx'
-
-    data['cleaned_value'] = data.value.apply(clean_text)
-
-    # prepare X values
-    descriptions = data.cleaned_value
-    tokenizer = keras.preprocessing.text.Tokenizer(num_words=5000, oov_token='UNKNOWN', lower=False)
-    tokenizer.fit_on_texts(descriptions)
-    dictionary_size = len(tokenizer.word_index)
-    descriptions_sequenced = tokenizer.texts_to_sequences(descriptions)
-    max_desc_len = len(max(descriptions_sequenced, key=len))
-    X = keras.preprocessing.sequence.pad_sequences(descriptions_sequenced, padding='post', maxlen=max_desc_len)
-
-    # prepare Y values
-    Y = keras.utils.to_categorical(data.idx)
-
-    # prepare and train model
-    nn_model = keras.Sequential(
-        [keras.layers.Embedding(input_length=max_desc_len, input_dim=dictionary_size + 1, output_dim=classes_number * 2),
-         keras.layers.Flatten(),
-         keras.layers.Dense(classes_number * 4, activation='relu'),
-         keras.layers.Dense(classes_number, activation='softmax')
-         ])
-    nn_model.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
-    nn_model.fit(X, Y, epochs=40, batch_size=50, verbose=0)
-
-    # predict categories
-    purchases_sequenced = tokenizer.texts_to_sequences(purchases)
-    NewX = keras.preprocessing.sequence.pad_sequences(purchases_sequenced, padding='post', maxlen=max_desc_len)
-    NewY = nn_model.predict(NewX)
-    result_idx = keras.backend.argmax(NewY, axis=1)
-    result = categories.take(result_idx.numpy().tolist()).category
-    probability = NewY.max(axis=1)
+    records, hashes = read_category_mappings()
+    if not records:
+        return [0] * len(purchases), [0.0] * len(purchases)
+    model_file = model_path(Setup.CATEGORY_MODEL_TF)
+    meta_file = model_file + ".json"
+    meta = None
+    if os.path.isfile(model_file) and os.path.isfile(meta_file):
+        try:
+            with open(meta_file, 'r', encoding='utf-8') as json_file:
+                meta = json.load(json_file)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Can't load category model from '{meta_file}': {e}")
+    if meta is not None and meta['signature'] == hashes[-1]:
+        nn_model = keras.models.load_model(model_file)
+        tokenizer = keras.preprocessing.text.tokenizer_from_json(meta['tokenizer'])
+    else:
+        categories = sorted(set([x[2] for x in records]))
+        descriptions = [clean_text(x[1]) for x in records]
+        tokenizer = keras.preprocessing.text.Tokenizer(num_words=5000, oov_token='UNKNOWN', lower=False)
+        tokenizer.fit_on_texts(descriptions)
+        dictionary_size = len(tokenizer.word_index)
+        descriptions_sequenced = tokenizer.texts_to_sequences(descriptions)
+        max_desc_len = len(max(descriptions_sequenced, key=len))
+        X = keras.preprocessing.sequence.pad_sequences(descriptions_sequenced, padding='post', maxlen=max_desc_len)
+        Y = keras.utils.to_categorical([categories.index(x[2]) for x in records], num_classes=len(categories))
 
-    return result.tolist(), probability.tolist()
\ No newline at end of file
+        classes_number = len(categories)
+        nn_model = keras.Sequential(
+            [keras.layers.Embedding(input_length=max_desc_len, input_dim=dictionary_size + 1,
+                                    output_dim=classes_number * 2),
+             keras.layers.Flatten(),
+             keras.layers.Dense(classes_number * 4, activation='relu'),
+             keras.layers.Dense(classes_number, activation='softmax')
+             ])
+        nn_model.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
+        nn_model.fit(X, Y, epochs=40, batch_size=50, verbose=0)
+        meta = {'signature': hashes[-1], 'categories': categories, 'max_desc_len': max_desc_len,
+                'tokenizer': tokenizer.to_json()}
+        try:
+            nn_model.save(model_file)
+            with open(meta_file, 'w', encoding='utf-8') as json_file:
+                json.dump(meta, json_file)
+        except OSError as e:
+            logging.warning(f"Can't save category model into '{model_file}': {e}")
+
+    purchases_sequenced = tokenizer.texts_to_sequences([clean_text(x) for x in purchases])
+    NewX = keras.preprocessing.sequence.pad_sequences(purchases_sequenced, padding='post', maxlen=meta['max_desc_len'])
+    NewY = nn_model.predict(NewX)
+    result_idx = NewY.argmax(axis=1)
+    return [meta['categories'][i] for i in result_idx], NewY.max(axis=1).tolist()
@@ -17,7 +17,6 @@ except ImportError:
 
 from PySide6.QtCore import Qt, Slot, Signal, QDateTime, QBuffer, QThread, QAbstractTableModel
 from PySide6.QtWidgets import QApplication, QDialog, QFileDialog, QHeaderView
-from jal.widgets.helpers import dependency_present
 from jal.db.helpers import executeSQL, readSQL
 from jal.data_import.slips_tax import SlipsTaxAPI
 from jal.ui.ui_slip_import_dlg import Ui_ImportSlipDlg
@@ -141,7 +140,6 @@ class ImportSlipDialog(QDialog, Ui_ImportSlipDlg):
         self.slip_lines = None
 
         self.slipsAPI = SlipsTaxAPI()
-        self.tensor_flow_present = dependency_present(['tensorflow'])
 
         self.qr_data_available.connect(self.parseQRdata)
         self.qr_data_validated.connect(self.downloadSlipJSON)
@@ -157,8 +155,6 @@ class ImportSlipDialog(QDialog, Ui_ImportSlipDlg):
         self.ClearBtn.clicked.connect(self.clearSlipData)
         self.AssignCategoryBtn.clicked.connect(self.recognizeCategories)
 
-        self.AssignCategoryBtn.setEnabled(self.tensor_flow_present)
-
     def closeEvent(self, arg__1):
         self.ScannerQR.stopScan()
         self.accept()
@@ -416,8 +412,6 @@ class ImportSlipDialog(QDialog, Ui_ImportSlipDlg):
 
     @Slot()
     def recognizeCategories(self):
-        if not self.tensor_flow_present:
-            return
         self.slip_lines['category'], self.slip_lines['confidence'] = \
             recognize_categories(self.slip_lines['name'].tolist())
         self.model.dataChanged.emit(None, None)  # refresh full view
\ No newline at end of file
@@ -12,6 +12,7 @@ from PySide6.QtWidgets import QApplication, QDialog, QMessageBox
 from jal.constants import Setup, MarketDataFeed, PredefinedAsset, DividendSubtype, CorporateAction
 from jal.db.helpers import account_last_date, get_app_path
 from jal.db.db import JalDB
+from jal.profiling import trace_span
 from jal.widgets.account_select import SelectAccountDialog
 
 
@@ -95,6 +96,7 @@ class Statement(QObject):   # derived from QObject to have proper string transla
         self._data = {}
         self._previous_accounts = {}
         self._last_selected_account = None
+        self.interactive = True    # Questions to user are allowed
         self._section_loaders = {
             FOF.PERIOD: self._check_period,
             FOF.ASSETS: self._import_assets,
@@ -113,6 +115,13 @@ class Statement(QObject):   # derived from QObject to have proper string transla
         else:
             return 0, 0
 
+    # returns statement content as JSON-compatible dictionary (it may be passed between processes)
+    def data(self):
+        return self._data
+
+    def set_data(self, data):
+        self._data = data
+
     # returns timestamp that is equal to the last second of initial timestamp
     def _end_of_date(self, timestamp) -> int:
         end_of_day = datetime.utcfromtimestamp(timestamp).replace(hour=23, minute=59, second=59)
@@ -200,7 +209,8 @@ class Statement(QObject):   # derived from QObject to have proper string transla
     def import_into_db(self):
         for section in self._section_loaders:
             if section in self._data:
-                self._section_loaders[section](self._data[section])
+                with trace_span(f"Statement.import.{section}", records=len(self._data[section])):
+                    self._section_loaders[section](self._data[section])
 
         totals = defaultdict(dict)
         for account in self._data[FOF.ACCOUNTS]:
@@ -217,6 +227,9 @@ class Statement(QObject):   # derived from QObject to have proper string transla
         for account in accounts:
             if account['id'] < 0:  # Checks if report is after last transaction recorded for account.
                 if period[0] < account_last_date(-account['id']):
+                    if not self.interactive:
+                        raise Statement_ImportError(self.tr("Statement period starts before last recorded "
+                                                            "operation for the account"))
                     if QMessageBox().warning(None, self.tr("Confirmation"),
                                              self.tr("Statement period starts before last recorded operation for the account. Continue import?"),
                                              QMessageBox.Yes, QMessageBox.No) == QMessageBox.No:
@@ -385,6 +398,8 @@ class Statement(QObject):   # derived from QObject to have proper string transla
     def select_account(self, text, account_id, recent_account_id=0):
         if "pytest" in sys.modules:
             return 1    # Always return 1st account if we are in testing mode
+        if not self.interactive:
+            return 0
         dialog = SelectAccountDialog(text, account_id, recent_account=recent_account_id)
         if dialog.exec() != QDialog.Accepted:
             return 0
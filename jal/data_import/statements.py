@@ -1,52 +1,83 @@
-import logging
-import importlib
 import os
+import logging
+import multiprocessing
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
-from PySide6.QtCore import QObject, Signal
+from PySide6.QtCore import QObject, Signal, Slot, QCoreApplication, QTranslator
 from PySide6.QtWidgets import QFileDialog
 from jal.constants import Setup
-from jal.db.helpers import get_app_path
-from jal.data_import.statement import Statement_ImportError
+from jal.db.helpers import db_connection, get_app_path, init_readonly_db
+from jal.plugins import PluginManifest, plugin_class
+from jal.profiling import trace_span
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Keeps log records of worker process in order to re-log them in the main process
+class LogCollector(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.levelno, record.getMessage()))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Worker process initializer - statement is parsed with read-only connection to the database, messages are translated
+# with the same language as application uses
+def _init_worker(db_file, log_level):
+    from jal.db.db import JalDB
+    from jal.db.settings import JalSettings
+    logging.getLogger().setLevel(log_level)
+    if not init_readonly_db(db_file):
+        raise RuntimeError(f"Can't open DB file '{db_file}'")
+    app = QCoreApplication([])
+    language = JalDB().get_language_code(JalSettings().getValue('Language', default=1))
+    translator = QTranslator(app)
+    translator.load(get_app_path() + Setup.LANG_PATH + os.sep + language + '.qm')
+    app.installTranslator(translator)
+
+
+# Loads and validates 'statement_file' with plugin class 'class_name' from 'module'. Questions to user aren't possible
+# here so they are suppressed. Returns tuple (statement data, error message, log records), data is None if failed
+def parse_statement(module, class_name, statement_file):
+    from jal.data_import.statement import Statement_ImportError
+    log = LogCollector()
+    logging.getLogger().addHandler(log)
+    statement = plugin_class(module, class_name)()
+    statement.interactive = False
+    try:
+        with trace_span("Statement.load"):
+            statement.load(statement_file)
+        with trace_span("Statement.validate_format"):
+            statement.validate_format()
+    except Statement_ImportError as e:
+        return None, str(e), log.records
+    finally:
+        logging.getLogger().removeHandler(log)
+    return statement.data(), '', log.records
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 class Statements(QObject):
     load_completed = Signal(int, defaultdict)
     load_failed = Signal()
+    progress = Signal(str)             # Description of import stage that is in progress
+    _parsed = Signal(object)           # Internal signal to pass result from worker process into GUI thread
 
     def __init__(self, parent):
         super().__init__()
         self.parent = parent
+        self._pool = None
+        self._loader = None
 
         self.items = []
         self.loadStatementsList()
+        self._parsed.connect(self.onParsed)
 
     def loadStatementsList(self):
-        statements_folder = get_app_path() + Setup.IMPORT_PATH + os.sep + Setup.STATEMENT_PATH
-        statement_modules = [filename[:-3] for filename in os.listdir(statements_folder) if filename.endswith(".py")]
-        for module_name in statement_modules:
-            logging.debug(f"Trying to load statement module: {module_name}")
-            module = importlib.import_module(f"jal.data_import.broker_statements.{module_name}")
-            try:
-                statement_class_name = getattr(module, "JAL_STATEMENT_CLASS")
-            except AttributeError:
-                continue
-            try:
-                class_instance = getattr(module, statement_class_name)
-            except AttributeError:
-                logging.error(self.tr("Statement class can't be loaded: ") + statement_class_name)
-                continue
-            statement = class_instance()
-            self.items.append({
-                'name': statement.name,
-                'module': module,
-                'loader_class': statement_class_name,
-                'icon': statement.icon_name,
-                'filename_filter': statement.filename_filter
-            })
-            logging.debug(f"Class '{statement_class_name}' providing '{statement.name}' statement has been loaded")
-        self.items = sorted(self.items, key=lambda item: item['name'])
+        self.items = PluginManifest().items(PluginManifest.STATEMENTS)
 
     # method is called directly from menu, so it contains QAction that was triggered
     def load(self, action):
@@ -55,16 +86,85 @@ class Statements(QObject):
                                                                     ".", statement_loader['filename_filter'])
         if not statement_file:
             return
-        module = statement_loader['module']
-        class_instance = getattr(module, statement_loader['loader_class'])
+        self.start_import(statement_loader, statement_file)
+
+    # Returns description of statement plugin with given class or module name (i.e. 'StatementIBKR' or 'ibkr')
+    def find(self, name):
+        for item in self.items:
+            if name.lower() in [item['class'].lower(), item['module'].split('.')[-1].lower()]:
+                return item
+        return None
+
+    # Starts import of 'statement_file' with plugin described by 'statement_loader' (item of self.items).
+    # File is parsed and validated by a separate process in order not to block GUI, then onParsed() puts data into
+    # database in GUI thread as it may ask user about accounts and assets. load_completed or load_failed is emitted
+    # at the end. Only one import may run at a time, returns False if import wasn't started
+    def start_import(self, statement_loader, statement_file):
+        if self._pool is not None:
+            logging.warning(self.tr("Previous statement import isn't completed yet"))
+            return False
+        self._loader = statement_loader
+        self.progress.emit(self.tr("Loading statement: ") + os.path.basename(statement_file))
+        # Worker is spawned as fork isn't safe for a process that has Qt objects
+        self._pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                                         initializer=_init_worker,
+                                         initargs=(db_connection().databaseName(), logging.getLogger().level))
+        future = self._pool.submit(parse_statement, statement_loader['module'], statement_loader['class'],
+                                   statement_file)
+        future.add_done_callback(self._parsed.emit)   # Callback is called from other thread -> queued connection
+        return True
+
+    @Slot()
+    def onParsed(self, future):
+        self._pool.shutdown(wait=False)
+        self._pool = None
+        try:
+            data, error, records = future.result()
+        except Exception as e:
+            data, error, records = None, str(e), []
+        for level, message in records:
+            logging.log(level, message)
+        if data is None:
+            logging.error(self.tr("Import failed: ") + error)
+            self.load_failed.emit()
+            return
+        statement = plugin_class(self._loader['module'], self._loader['class'])()
+        statement.set_data(data)
+        self.progress.emit(self.tr("Importing statement into database"))
+        with trace_span("Statements.load", statement=self._loader['class']):
+            self._import_data(statement)
+
+    # Imports 'statement_file' with plugin described by 'statement_loader' (item of self.items) in current thread.
+    # Questions to user are suppressed if 'interactive' is False - import fails if there is something to ask.
+    # Returns True if statement was imported
+    def import_statement(self, statement_loader, statement_file, interactive=True):
+        from jal.data_import.statement import Statement_ImportError
+        class_instance = plugin_class(statement_loader['module'], statement_loader['class'])
         statement = class_instance()
+        statement.interactive = interactive
+        with trace_span("Statements.load", statement=statement_loader['class'], file=statement_file):
+            try:
+                with trace_span("Statement.load"):
+                    statement.load(statement_file)
+                with trace_span("Statement.validate_format"):
+                    statement.validate_format()
+            except Statement_ImportError as e:
+                logging.error(self.tr("Import failed: ") + str(e))
+                self.load_failed.emit()
+                return False
+            return self._import_data(statement)
+
+    # Matches loaded statement with database content and stores it. Emits load_completed or load_failed signal
+    def _import_data(self, statement):
+        from jal.data_import.statement import Statement_ImportError
         try:
-            statement.load(statement_file)
-            statement.validate_format()
-            statement.match_db_ids(verbal=False)
-            totals = statement.import_into_db()
+            with trace_span("Statement.match_db_ids"):
+                statement.match_db_ids(verbal=False)
+            with trace_span("Statement.import_into_db"):
+                totals = statement.import_into_db()
         except Statement_ImportError as e:
             logging.error(self.tr("Import failed: ") + str(e))
             self.load_failed.emit()
-            return
+            return False
         self.load_completed.emit(statement.period()[1], totals)
+        return True
@@ -0,0 +1,226 @@
+import logging
+from PySide6.QtCore import Qt, Signal, QObject, QRunnable, QThreadPool, QAbstractTableModel, QModelIndex
+from jal.constants import Setup
+from jal.db.helpers import executeSQL, read_connection
+from jal.profiling import trace_span
+
+_report_pool = None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Thread pool for report calculations. Threads never expire as every thread keeps own read-only DB connection
+def report_pool():
+    global _report_pool
+    if _report_pool is None:
+        _report_pool = QThreadPool()
+        _report_pool.setMaxThreadCount(Setup.REPORT_THREADS)
+        _report_pool.setExpiryTimeout(-1)
+    return _report_pool
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# QRunnable isn't a QObject so signals of the task are kept in a separate object.
+class ReportTaskSignals(QObject):
+    portion = Signal(int, object, object)   # request id, column names, list of rows
+    finished = Signal(int, object)          # request id, value returned by task function (None if task failed)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Calls 'function(task, *args)' in a thread of report pool. The function should use 'task.db' connection for queries,
+# it may display part of results with task.emit() and should stop if 'task.cancelled' is set.
+class ReportTask(QRunnable):
+    def __init__(self, request_id, function, args):
+        super().__init__()
+        self.setAutoDelete(False)    # Task is referenced by ReportRunner until it is finished
+        self.signals = ReportTaskSignals()
+        self.cancelled = False
+        self.db = None
+        self._request_id = request_id
+        self._function = function
+        self._args = args
+
+    def run(self):
+        result = None
+        if not self.cancelled:
+            self.db = read_connection()
+            try:
+                with trace_span(f"Report.{self._function.__name__}", request=self._request_id):
+                    result = self._function(self, *self._args)
+            except Exception as e:
+                logging.error(f"Report calculation failed: {e}")
+        self.signals.finished.emit(self._request_id, result)
+
+    def emit(self, columns, rows):
+        if not self.cancelled:
+            self.signals.portion.emit(self._request_id, columns, rows)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Executes report calculations in background. Only the last submitted request is valid - tasks that were superseded
+# are removed from the queue or cancelled and their results are dropped.
+# Signals are emitted in the thread of the runner (GUI thread) when data of the last request are available
+class ReportRunner(QObject):
+    busy = Signal(bool)
+    portion = Signal(object, object)    # column names, list of rows
+    finished = Signal(object)           # value returned by task function
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._request_id = 0
+        self._tasks = {}     # request id -> task that is queued or running
+
+    def submit(self, function, *args):
+        self._cancel_tasks()
+        self._request_id += 1
+        task = ReportTask(self._request_id, function, args)
+        task.signals.portion.connect(self._on_portion)
+        task.signals.finished.connect(self._on_finished)
+        self._tasks[self._request_id] = task
+        self.busy.emit(True)
+        report_pool().start(task)
+
+    def cancel(self):
+        busy = self.isBusy()
+        self._cancel_tasks()
+        self._request_id += 1      # Results of running tasks will be dropped
+        if busy:
+            self.busy.emit(False)
+
+    def isBusy(self):
+        return self._request_id in self._tasks
+
+    def _cancel_tasks(self):
+        for request_id, task in list(self._tasks.items()):
+            task.cancelled = True
+            if report_pool().tryTake(task):
+                del self._tasks[request_id]
+
+    def _on_portion(self, request_id, columns, rows):
+        if request_id == self._request_id:
+            self.portion.emit(columns, rows)
+
+    def _on_finished(self, request_id, result):
+        self._tasks.pop(request_id, None)
+        if request_id == self._request_id:
+            self.busy.emit(False)
+            self.finished.emit(result)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Task function that executes SQL query and emits its result by portions of Setup.REPORT_CHUNK_SIZE rows.
+# Returns total number of rows or None if query failed
+def fetch_rows(task, sql_text, params):
+    query = executeSQL(sql_text, params, db=task.db)
+    if query is None:
+        return None
+    record = query.record()
+    columns = [record.fieldName(i) for i in range(record.count())]
+    rows = []
+    count = 0
+    while query.next():
+        if task.cancelled:
+            return None
+        rows.append(tuple(query.value(i) for i in range(len(columns))))
+        if len(rows) == Setup.REPORT_CHUNK_SIZE:
+            task.emit(columns, rows)
+            count += len(rows)
+            rows = []
+    if rows or not count:
+        task.emit(columns, rows)
+    return count + len(rows)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Table model for reports that are calculated by ReportRunner. Previous results are displayed until first portion of
+# new results arrives, then rows are added as soon as they are calculated.
+# It mimics column-related methods of QSqlTableModel and calls configureView() when new columns set is loaded
+class ReportTableModel(QAbstractTableModel):
+    def __init__(self, parent_view):
+        super().__init__(parent_view)
+        self._view = parent_view
+        self._columns = []       # list of (column name, header title)
+        self._fields = []
+        self._headers = {}
+        self._rows = []
+        self._complete = True    # False if new results are being calculated and no rows were received yet
+        self._runner = ReportRunner(self)
+        self._runner.busy.connect(self.onBusy)
+        self._runner.portion.connect(self.onPortion)
+        self._runner.finished.connect(self.onFinished)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._fields)
+
+    def fieldIndex(self, name):
+        try:
+            return self._fields.index(name)
+        except ValueError:
+            return -1
+
+    def setHeaderData(self, section, orientation, value, role=Qt.EditRole):
+        if orientation != Qt.Horizontal or section < 0 or section >= len(self._fields):
+            return False
+        self._headers[section] = value
+        self.headerDataChanged.emit(orientation, section, section)
+        return True
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole:
+            if orientation == Qt.Horizontal:
+                return self._headers.get(section, self._fields[section] if section < len(self._fields) else None)
+            return section + 1
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            return self._rows[index.row()][index.column()]
+        return None
+
+    def setColumnNames(self):
+        for column in self._columns:
+            self.setHeaderData(self.fieldIndex(column[0]), Qt.Horizontal, column[1])
+
+    def resetDelegates(self):
+        for column in self._columns:
+            self._view.setItemDelegateForColumn(self.fieldIndex(column[0]), None)
+
+    def configureView(self):
+        self.setColumnNames()
+
+    # Starts calculation of the report with given task function (see ReportTask)
+    def calculate(self, function, *args):
+        self._complete = False
+        self._runner.submit(function, *args)
+
+    # Starts calculation of the report as SQL query
+    def setQuery(self, sql_text, params):
+        self.calculate(fetch_rows, sql_text, params)
+
+    def onBusy(self, busy):
+        self._view.setEnabled(not busy)
+
+    def onPortion(self, columns, rows):
+        if not self._complete:
+            self._complete = True
+            self.beginResetModel()
+            self._fields = columns
+            self._headers = {}
+            self._rows = list(rows)
+            self.endResetModel()
+            self.configureView()
+        elif rows:
+            self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+            self._rows.extend(rows)
+            self.endInsertRows()
+
+    def onFinished(self, result):
+        if not self._complete:   # Calculation failed or gave no data - clear previous results
+            self._complete = True
+            self.beginResetModel()
+            self._rows = []
+            self.endResetModel()
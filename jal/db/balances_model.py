@@ -3,6 +3,7 @@ from PySide6.QtGui import QBrush, QFont
 from PySide6.QtWidgets import QHeaderView
 from jal.constants import Setup, CustomColor, BookAccount
 from jal.db.helpers import executeSQL, readSQLrecord
+from jal.profiling import trace_span
 from jal.db.db import JalDB
 
 
@@ -112,7 +113,8 @@ class BalancesModel(QAbstractTableModel):
         return self._data[row]['account']
 
     def update(self):
-        self.calculateBalances()
+        with trace_span("BalancesModel.update"):
+            self.calculateBalances()
 
     # Populate table balances with data calculated for given parameters of model: _currency, _date, _active_only
     def calculateBalances(self):
@@ -0,0 +1,94 @@
+import re
+import logging
+from functools import lru_cache
+from PySide6.QtSql import QSqlDatabase, QSqlQuery
+from jal.constants import Setup
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# In-memory copy of small reference tables and application settings. Every table is loaded with one query at first
+# access and is dropped when it is modified so it will be re-loaded at next access. Modifications are tracked by
+# executeSQL() for every INSERT/UPDATE/DELETE statement, QSqlTableModel-based editors and JalSettings.setValue()
+# should call invalidate() explicitly.
+# Records are kept as dictionaries: table -> {id: {field: value}} (settings are indexed by name instead of id)
+class ReferenceCache:
+    REFERENCES = ['assets', 'accounts', 'agents', 'categories', 'tags', 'countries']
+    SETTINGS = 'settings'
+    KEYS = {SETTINGS: 'name'}
+
+    def __init__(self):
+        self._tables = {}
+        self._lookups = {}     # (table, field) -> {field value: key}
+
+    # Returns record of given table with given key or None if there is no such record
+    def record(self, table, key):
+        return self._table(table).get(key)
+
+    # Returns value of 'field' for record with given key or 'default' if there is no such record
+    def value(self, table, key, field, default=None):
+        record = self._table(table).get(key)
+        return default if record is None else record[field]
+
+    # Returns key of the first record where 'field' equals to given value or None if there is no such record
+    def find(self, table, field, value):
+        if (table, field) not in self._lookups:
+            lookup = {}
+            for key, record in self._table(table).items():
+                lookup.setdefault(record[field], key)
+            self._lookups[(table, field)] = lookup
+        return self._lookups[(table, field)].get(value)
+
+    # Drops cached copy of given table (or all tables if table is None).
+    # Reference tables are linked by foreign keys so modification of one of them may change others
+    def invalidate(self, table=None):
+        if table is None:
+            self._tables.clear()
+            self._lookups.clear()
+        elif table == self.SETTINGS:
+            self._drop(table)
+        elif table in self.REFERENCES:
+            for reference in self.REFERENCES:
+                self._drop(reference)
+
+    def _drop(self, table):
+        self._tables.pop(table, None)
+        for lookup in [x for x in self._lookups if x[0] == table]:
+            del self._lookups[lookup]
+
+    def _table(self, table):
+        if table not in self._tables:
+            records = self._load(table)
+            if records is None:    # Don't keep failed result, i.e. if table doesn't exist yet
+                return {}
+            self._tables[table] = records
+        return self._tables[table]
+
+    def _load(self, table):
+        query = QSqlQuery(QSqlDatabase.database(Setup.DB_CONNECTION))
+        query.setForwardOnly(True)
+        if not query.exec(f"SELECT * FROM {table}"):
+            logging.debug(f"Failed to load '{table}' into cache: {query.lastError().text()}")
+            return None
+        key_field = self.KEYS.get(table, 'id')
+        fields = [query.record().fieldName(i) for i in range(query.record().count())]
+        records = {}
+        while query.next():
+            record = {field: query.value(i) for i, field in enumerate(fields)}
+            records[record[key_field]] = record
+        return records
+
+
+_cache = ReferenceCache()
+
+
+def reference_cache():
+    return _cache
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Returns name of the table that is modified by given SQL statement or None if it isn't INSERT, UPDATE or DELETE
+@lru_cache(maxsize=1024)
+def modified_table(sql_text):
+    match = re.match(r"\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)"
+                     r"\s+(\w+)", sql_text, re.IGNORECASE)
+    return match.group(1).lower() if match else None
@@ -6,6 +6,7 @@ from PySide6.QtSql import QSqlTableModel
 from jal.ui.ui_add_asset_dlg import Ui_AddAssetDialog
 from jal.constants import Setup, BookAccount, PredefindedAccountType, PredefinedAsset
 from jal.db.helpers import db_connection, executeSQL, readSQL, get_country_by_code
+from jal.db.cache import reference_cache
 
 
 # -----------------------------------------------------------------------------------------------------------------------
@@ -67,13 +68,13 @@ class JalDB:
         return readSQL("SELECT language FROM languages WHERE id = :language_id", [(':language_id', language_id)])
 
     def get_asset_name(self, asset_id):
-        return readSQL("SELECT name FROM assets WHERE id=:asset_id", [(":asset_id", asset_id)])
+        return reference_cache().value('assets', asset_id, 'name')
 
     def get_asset_type(self, asset_id):
-        return readSQL("SELECT type_id FROM assets WHERE id=:asset_id", [(":asset_id", asset_id)])
+        return reference_cache().value('assets', asset_id, 'type_id')
 
     def get_account_name(self, account_id):
-        return readSQL("SELECT name FROM accounts WHERE id=:account_id", [(":account_id", account_id)])
+        return reference_cache().value('accounts', account_id, 'name')
 
     # Searches for account_id by account number and optional currency
     # Returns: account_id or None if no account was found
@@ -132,10 +133,10 @@ class JalDB:
         return query.lastInsertId()
 
     def get_account_currency(self, account_id):
-        return readSQL("SELECT currency_id FROM accounts WHERE id=:account_id", [(":account_id", account_id)])
+        return reference_cache().value('accounts', account_id, 'currency_id')
 
     def get_account_bank(self, account_id):
-        return readSQL("SELECT organization_id FROM accounts WHERE id=:account_id", [(":account_id", account_id)])
+        return reference_cache().value('accounts', account_id, 'organization_id')
 
     # Searches for asset_id in database - first by ISIN, then by Reg.Code next by Symbol
     # If found - tries to update data if some is empty in database
@@ -144,7 +145,7 @@ class JalDB:
     def get_asset_id(self, symbol, isin='', reg_code='', name='', expiry=0, dialog_new=True):  # TODO Change params to **kwargs
         asset_id = None
         if isin:
-            asset_id = readSQL("SELECT id FROM assets WHERE isin=:isin", [(":isin", isin)])
+            asset_id = reference_cache().find('assets', 'isin', isin)
             if asset_id is None:
                 asset_id = readSQL("SELECT id FROM assets WHERE name=:symbol COLLATE NOCASE AND coalesce(isin, '')=''",
                                    [(":symbol", symbol)])
@@ -1,10 +1,15 @@
 import os
+import time
+import atexit
 import logging
 import sqlite3
+import threading
+from itertools import count
 from PySide6.QtSql import QSql, QSqlDatabase, QSqlQuery
 from PySide6.QtWidgets import QApplication, QMessageBox
 from PySide6.QtGui import QIcon
 from jal.constants import Setup
+from jal.db.cache import reference_cache, modified_table
 from jal.db.settings import JalSettings
 
 
@@ -63,6 +68,81 @@ def db_connection():
     return db
 
 
+# -------------------------------------------------------------------------------------------------------------------
+# Tunes connection 'db': page cache size, memory mapped I/O and temporary tables in memory.
+# Writer connection also switches database into write-ahead log mode - it keeps database consistent on power loss
+# with 'synchronous = NORMAL' that makes commits cheap and allows read-only connections to read last committed
+# state of the database while writer is active
+def set_db_pragmas(db, read_only=False):
+    _ = executeSQL(f"PRAGMA cache_size = {Setup.DB_CACHE_SIZE}", db=db)
+    _ = executeSQL(f"PRAGMA mmap_size = {Setup.DB_MMAP_SIZE}", db=db)
+    _ = executeSQL("PRAGMA temp_store = MEMORY", db=db)
+    if not read_only:
+        _ = executeSQL("PRAGMA journal_mode = WAL", db=db)
+        _ = executeSQL("PRAGMA synchronous = NORMAL", db=db)
+
+
+# -------------------------------------------------------------------------------------------------------------------
+# Keeps read-only connections to the database - one for every thread that asked for it, as Qt doesn't allow to use
+# connection in a thread other than one that created it. Main connection (Setup.DB_CONNECTION) is the only one
+# that writes into the database.
+class ReadConnectionPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._db_file = ''
+        self._connections = {}              # connection name -> database file of connection
+        self._thread_data = threading.local()
+        self._counter = count(1)
+
+    def setDatabaseName(self, db_file):
+        with self._lock:
+            self._db_file = db_file
+
+    # Returns read-only connection of calling thread (it is re-opened if database file was changed)
+    def connection(self):
+        name = getattr(self._thread_data, 'name', None)
+        with self._lock:
+            db_file = self._db_file
+            if name is not None and self._connections.get(name) == db_file:
+                return QSqlDatabase.database(name)
+            if name is None:
+                name = self._thread_data.name = f"{Setup.DB_CONNECTION}.read.{next(self._counter)}"
+            self._connections[name] = db_file
+        if QSqlDatabase.contains(name):
+            QSqlDatabase.removeDatabase(name)
+        db = QSqlDatabase.addDatabase("QSQLITE", name)
+        db.setDatabaseName(db_file)
+        db.setConnectOptions("QSQLITE_OPEN_READONLY;QSQLITE_ENABLE_REGEXP=1")
+        if not db.open():
+            logging.error(f"Can't open DB file '{db_file}': {db.lastError().text()}")
+        else:
+            set_db_pragmas(db, read_only=True)
+        return db
+
+    # Closes connection of calling thread - it should be called before thread termination
+    def release(self):
+        name = getattr(self._thread_data, 'name', None)
+        if name is None:
+            return
+        with self._lock:
+            self._connections.pop(name, None)
+        del self._thread_data.name
+        QSqlDatabase.database(name, False).close()
+        QSqlDatabase.removeDatabase(name)
+
+
+_read_pool = ReadConnectionPool()
+
+
+# Returns read-only connection for calling thread. It may be used together with executeSQL() / readSQL()
+def read_connection():
+    return _read_pool.connection()
+
+
+def release_read_connection():
+    _read_pool.release()
+
+
 # -------------------------------------------------------------------------------------------------------------------
 def db_triggers_disable():
     _ = executeSQL("UPDATE settings SET value=0 WHERE name='TriggersEnabled'", commit=True)
@@ -71,14 +151,131 @@ def db_triggers_disable():
 def db_triggers_enable():
     _ = executeSQL("UPDATE settings SET value=1 WHERE name='TriggersEnabled'", commit=True)
 
+# -------------------------------------------------------------------------------------------------------------------
+# Collects statistics of SQL queries executed by executeSQL() / readSQL(): number of calls, execution time,
+# time of rows fetch by readSQLrecord() and number of rows returned. Statistics is kept per SQL text.
+# Queries that run longer than Setup.SQL_SLOW_QUERY_TIME are put into slow-query log together with bound parameters
+# and EXPLAIN QUERY PLAN output (it is done once for every SQL text).
+# Profiling is enabled with JAL_PROFILE_SQL environment variable: '1' - output goes into stderr,
+# other value is treated as a name of file for the output. Summary is written at exit or by sql_profiler_dump()
+class SqlProfiler:
+    CALLS = 0
+    EXEC_TIME = 1
+    MAX_TIME = 2
+    FETCH_TIME = 3
+    ROWS = 4
+
+    def __init__(self, log_file=None):
+        self.stats = {}     # SQL text -> [calls, execution time, max execution time, fetch time, rows]
+        self._explained = set()
+        self._logger = logging.getLogger("jal.sql")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        if log_file is None:
+            self._handler = logging.StreamHandler()
+        else:
+            self._handler = logging.FileHandler(log_file, encoding='utf-8')
+        self._logger.addHandler(self._handler)
+
+    def _record(self, sql_text):
+        if sql_text not in self.stats:
+            self.stats[sql_text] = [0, 0.0, 0.0, 0.0, 0]
+        return self.stats[sql_text]
+
+    def executed(self, db, sql_text, params, elapsed):
+        record = self._record(sql_text)
+        record[self.CALLS] += 1
+        record[self.EXEC_TIME] += elapsed
+        record[self.MAX_TIME] = max(record[self.MAX_TIME], elapsed)
+        if elapsed >= Setup.SQL_SLOW_QUERY_TIME:
+            self._logger.info(f"Slow SQL ({elapsed * 1000:.1f} ms): '{sql_text}' with params '{params}'" +
+                              self.explain(db, sql_text, params))
+
+    def fetched(self, sql_text, elapsed, rows=1):
+        record = self._record(sql_text)
+        record[self.FETCH_TIME] += elapsed
+        record[self.ROWS] += rows
+
+    # Returns query plan for the SQL query (only once for every query text)
+    def explain(self, db, sql_text, params):
+        if sql_text in self._explained:
+            return ''
+        self._explained.add(sql_text)
+        query = QSqlQuery(db)
+        if not query.prepare("EXPLAIN QUERY PLAN " + sql_text):
+            return ''
+        for param in params:
+            query.bindValue(param[0], param[1])
+        if not query.exec():
+            return ''
+        plan = ''
+        while query.next():
+            plan += f"\n    {query.value(3)}"
+        return "\nQuery plan:" + plan
+
+    # Returns text lines with statistics of 'count' queries that took the most time
+    def summary(self, count=25):
+        lines = [f"{'calls':>7} | {'total [ms]':>10} | {'avg [ms]':>8} | {'max [ms]':>8} | {'fetch [ms]':>10} | "
+                 f"{'rows':>8} | SQL"]
+        queries = sorted(self.stats.items(), key=lambda x: x[1][self.EXEC_TIME] + x[1][self.FETCH_TIME], reverse=True)
+        for sql_text, record in queries[:count]:
+            lines.append(f"{record[self.CALLS]:7d} | {record[self.EXEC_TIME] * 1000:10.1f} | "
+                         f"{record[self.EXEC_TIME] * 1000 / max(record[self.CALLS], 1):8.2f} | "
+                         f"{record[self.MAX_TIME] * 1000:8.2f} | {record[self.FETCH_TIME] * 1000:10.1f} | "
+                         f"{record[self.ROWS]:8d} | {' '.join(sql_text.split())}")
+        return lines
+
+    def dump(self, count=25):
+        self._logger.info(f"SQL profile summary ({len(self.stats)} queries):\n" + "\n".join(self.summary(count)))
+
+    def close(self):
+        self._logger.removeHandler(self._handler)
+        self._handler.close()
+
+
+_sql_profiler = None
+
+
+# Starts collection of SQL statistics (see SqlProfiler) and returns profiler object
+def sql_profiler_start(log_file=None):
+    global _sql_profiler
+    if _sql_profiler is None:
+        _sql_profiler = SqlProfiler(log_file)
+        atexit.register(sql_profiler_dump)
+    return _sql_profiler
+
+
+def sql_profiler_stop():
+    global _sql_profiler
+    profiler = _sql_profiler
+    _sql_profiler = None
+    atexit.unregister(sql_profiler_dump)
+    if profiler is not None:
+        profiler.close()
+    return profiler
+
+
+def sql_profiler_dump():
+    if _sql_profiler is not None:
+        _sql_profiler.dump()
+
+
+if os.environ.get('JAL_PROFILE_SQL'):
+    sql_profiler_start(None if os.environ['JAL_PROFILE_SQL'] == '1' else os.environ['JAL_PROFILE_SQL'])
+
+
 # -------------------------------------------------------------------------------------------------------------------
 # prepares SQL query from given sql_text
 # params_list is a list of tuples (":param", value) which are used to prepare SQL query
 # Current transactin will be commited if 'commit' set to true
 # Parameter 'forward_only' may be used for optimization
+# Query is executed with main connection if connection 'db' isn't given explicitly
+# Cached copy of reference table is dropped if query modifies it
 # return value - QSqlQuery object (to allow iteration through result)
-def executeSQL(sql_text, params=[], forward_only=True, commit=False):
-    db = db_connection()
+def executeSQL(sql_text, params=[], forward_only=True, commit=False, db=None):
+    start = time.perf_counter()
+    if db is None:
+        db = db_connection()
     query = QSqlQuery(db)
     query.setForwardOnly(forward_only)
     if not query.prepare(sql_text):
@@ -89,6 +286,11 @@ def executeSQL(sql_text, params=[], forward_only=True, commit=False):
     if not query.exec():
         logging.error(f"SQL exec: '{query.lastError().text()}' for query '{sql_text}' with params '{params}'")
         return None
+    if _sql_profiler is not None:
+        _sql_profiler.executed(db, sql_text, params, time.perf_counter() - start)
+    table = modified_table(sql_text)
+    if table is not None:
+        reference_cache().invalidate(table)
     if commit:
         db.commit()
     return query
@@ -101,10 +303,14 @@ def executeSQL(sql_text, params=[], forward_only=True, commit=False):
 # named = False: result is packed into a list of field values
 # named = True: result is packet into a dictionary with field names as keys
 # - check_unique = True: checks that only 1 record was returned by query, otherwise returns None
-def readSQL(sql_text, params=None, named=False, check_unique=False):
+# Query is executed with main connection if connection 'db' isn't given explicitly
+def readSQL(sql_text, params=None, named=False, check_unique=False, db=None):
     if params is None:
         params = []
-    query = QSqlQuery(db_connection())
+    start = time.perf_counter()
+    if db is None:
+        db = db_connection()
+    query = QSqlQuery(db)
     query.setForwardOnly(True)
     if not query.prepare(sql_text):
         logging.error(f"SQL prep: '{query.lastError().text()}' for query '{sql_text}' | '{params}'")
@@ -114,6 +320,8 @@ def readSQL(sql_text, params=None, named=False, check_unique=False):
     if not query.exec():
         logging.error(f"SQL exec: '{query.lastError().text()}' for query '{sql_text}' | '{params}'")
         return None
+    if _sql_profiler is not None:
+        _sql_profiler.executed(db, sql_text, params, time.perf_counter() - start)
     if query.next():
         res = readSQLrecord(query, named=named)
         if check_unique and query.next():
@@ -124,6 +332,15 @@ def readSQL(sql_text, params=None, named=False, check_unique=False):
 
 
 def readSQLrecord(query, named=False):
+    if _sql_profiler is not None:
+        start = time.perf_counter()
+        values = _readSQLrecord(query, named)
+        _sql_profiler.fetched(query.lastQuery(), time.perf_counter() - start)
+        return values
+    return _readSQLrecord(query, named)
+
+
+def _readSQLrecord(query, named=False):
     if named:
         values = {}
     else:
@@ -147,19 +364,22 @@ def readSQLrecord(query, named=False):
 #    if not - it will initialize DB with help of SQL-script
 # 2) checks that DB looks like a valid one:
 #    if schema version is invalid it will close DB
+# Database file is taken from 'db_path' folder unless 'db_file' is given explicitly
 # Returns: LedgerInitError(code = 0 if db was initialized successfully)
-def init_and_check_db(db_path):
+def init_and_check_db(db_path, db_file=None):
+    reference_cache().invalidate()
+    db_file = get_dbfilename(db_path) if db_file is None else db_file
     db = QSqlDatabase.addDatabase("QSQLITE", Setup.DB_CONNECTION)
     if not db.isValid():
         return LedgerInitError(LedgerInitError.DbDriverFailure)
-    db.setDatabaseName(get_dbfilename(db_path))
+    db.setDatabaseName(db_file)
     db.setConnectOptions("QSQLITE_ENABLE_REGEXP=1")
     db.open()
     tables = db.tables(QSql.Tables)
     if not tables:
         db.close()
         connection_name = db.connectionName()
-        init_db_from_sql(get_dbfilename(db_path), db_path + Setup.INIT_SCRIPT_PATH)
+        init_db_from_sql(db_file, db_path + Setup.INIT_SCRIPT_PATH)
         QSqlDatabase.removeDatabase(connection_name)
         return LedgerInitError(LedgerInitError.EmptyDbInitialized)
 
@@ -172,11 +392,32 @@ def init_and_check_db(db_path):
         return LedgerInitError(LedgerInitError.NewerDbSchema)
 
     _ = executeSQL("PRAGMA foreign_keys = ON")
+    set_db_pragmas(db)
+    _read_pool.setDatabaseName(db_file)
     db_triggers_enable()
 
     return LedgerInitError(LedgerInitError.DbInitSuccess)
 
 
+# -------------------------------------------------------------------------------------------------------------------
+# Opens read-only connection to existing DB file 'db_file' with standard connection name.
+# It is intended for worker processes that only read data (and may run in parallel with each other)
+# Returns True if connection was opened successfully
+def init_readonly_db(db_file):
+    reference_cache().invalidate()
+    db = QSqlDatabase.addDatabase("QSQLITE", Setup.DB_CONNECTION)
+    if not db.isValid():
+        logging.error(f"Sqlite driver initialization failed for '{db_file}'")
+        return False
+    db.setDatabaseName(db_file)
+    db.setConnectOptions("QSQLITE_OPEN_READONLY;QSQLITE_ENABLE_REGEXP=1")
+    if not db.open():
+        logging.error(f"Can't open DB file '{db_file}': {db.lastError().text()}")
+        return False
+    set_db_pragmas(db, read_only=True)
+    return True
+
+
 # -------------------------------------------------------------------------------------------------------------------
 def init_db_from_sql(db_file, sql_file):
     with open(sql_file, 'r', encoding='utf-8') as sql_file:
@@ -229,7 +470,7 @@ def get_account_name(account_id):
 def get_country_by_code(country_code):
     if not country_code:
         return 0
-    country_id = readSQL("SELECT id FROM countries WHERE code=:code", [(":code", country_code)], check_unique=True)
+    country_id = reference_cache().find('countries', 'code', country_code)
     if country_id is None:
         country_id = 0
         logging.warning(QApplication.translate('DB', "Unknown country code: ") + f"'{country_code}'")
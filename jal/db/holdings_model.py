@@ -6,7 +6,9 @@ from PySide6.QtGui import QBrush, QFont
 from PySide6.QtWidgets import QHeaderView
 from jal.constants import Setup, CustomColor, BookAccount, PredefindedAccountType
 from jal.db.helpers import executeSQL, readSQLrecord
+from jal.profiling import trace_span
 from jal.db.db import JalDB
+from jal.db.background import ReportRunner
 from jal.widgets.delegates import GridLinesDelegate
 
 
@@ -35,6 +37,75 @@ class TreeItem:
         return self._parent
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+# Report task (see ReportTask) that returns list of holdings at given 'date' with values adjusted to 'currency'
+def holdings_list(task, currency, date):
+    query = executeSQL(
+        "WITH "
+        "_last_quotes AS (SELECT MAX(timestamp) AS timestamp, asset_id, quote "
+        "FROM quotes WHERE timestamp <= :holdings_timestamp GROUP BY asset_id), "
+        "_last_assets AS ("
+        "SELECT id, SUM(t_value) AS total_value "
+        "FROM "
+        "("
+        "SELECT a.id, SUM(l.amount) AS t_value "
+        "FROM ledger AS l "
+        "LEFT JOIN accounts AS a ON l.account_id = a.id "
+        "WHERE (l.book_account=:money_book OR l.book_account=:liabilities_book) "
+        "AND a.type_id = :investments AND l.timestamp <= :holdings_timestamp GROUP BY a.id "
+        "UNION ALL "
+        "SELECT a.id, SUM(l.amount*q.quote) AS t_value "
+        "FROM ledger AS l "
+        "LEFT JOIN accounts AS a ON l.account_id = a.id "
+        "LEFT JOIN _last_quotes AS q ON l.asset_id = q.asset_id "
+        "WHERE l.book_account=:assets_book AND a.type_id = :investments AND l.timestamp <= :holdings_timestamp "
+        "GROUP BY a.id"
+        ") "
+        "GROUP BY id HAVING ABS(total_value) > :tolerance) "
+        "SELECT h.currency_id, c.name AS currency, h.account_id, h.account, h.asset_id, "
+        "c.name=a.name AS asset_is_currency, a.name AS asset, a.full_name AS asset_name, a.expiry, "
+        "h.qty, h.value AS value_i, h.quote, h.quote_a, h.total FROM ("
+        "SELECT a.currency_id, l.account_id, a.name AS account, l.asset_id, sum(l.amount) AS qty, "
+        "sum(l.value) AS value, q.quote, q.quote*cur_q.quote/cur_adj_q.quote AS quote_a, t.total_value AS total "
+        "FROM ledger AS l "
+        "LEFT JOIN accounts AS a ON l.account_id = a.id "
+        "LEFT JOIN _last_quotes AS q ON l.asset_id = q.asset_id "
+        "LEFT JOIN _last_quotes AS cur_q ON a.currency_id = cur_q.asset_id "
+        "LEFT JOIN _last_quotes AS cur_adj_q ON cur_adj_q.asset_id = :base_currency "
+        "LEFT JOIN _last_assets AS t ON l.account_id = t.id "
+        "WHERE a.type_id = :investments AND l.book_account = :assets_book AND l.timestamp <= :holdings_timestamp "
+        "GROUP BY l.account_id, l.asset_id "
+        "HAVING ABS(qty) > :tolerance "
+        "UNION ALL "
+        "SELECT a.currency_id, l.account_id, a.name AS account, l.asset_id, sum(l.amount) AS qty, "
+        "0 AS value, 1, cur_q.quote/cur_adj_q.quote AS quote_a, t.total_value AS total "
+        "FROM ledger AS l "
+        "LEFT JOIN accounts AS a ON l.account_id = a.id "
+        "LEFT JOIN _last_quotes AS cur_q ON a.currency_id = cur_q.asset_id "
+        "LEFT JOIN _last_quotes AS cur_adj_q ON cur_adj_q.asset_id = :base_currency "
+        "LEFT JOIN _last_assets AS t ON l.account_id = t.id "
+        "WHERE (l.book_account=:money_book OR l.book_account=:liabilities_book) "
+        "AND a.type_id = :investments AND l.timestamp <= :holdings_timestamp "
+        "GROUP BY l.account_id, l.asset_id "
+        "HAVING ABS(qty) > :tolerance "
+        ") AS h "
+        "LEFT JOIN assets AS c ON c.id=h.currency_id "
+        "LEFT JOIN assets AS a ON a.id=h.asset_id "
+        "ORDER BY currency, account, asset_is_currency, asset",
+        [(":base_currency", currency), (":money_book", BookAccount.Money),
+         (":assets_book", BookAccount.Assets), (":liabilities_book", BookAccount.Liabilities),
+         (":holdings_timestamp", date), (":investments", PredefindedAccountType.Investment),
+         (":tolerance", Setup.DISP_TOLERANCE)], forward_only=True, db=task.db)
+    if query is None:
+        return None
+    holdings = []
+    while query.next():
+        if task.cancelled:
+            return None
+        holdings.append(readSQLrecord(query, named=True))
+    return holdings
+
+
 class HoldingsModel(QAbstractItemModel):
     def __init__(self, parent_view):
         super().__init__(parent_view)
@@ -44,6 +115,9 @@ class HoldingsModel(QAbstractItemModel):
         self._currency = 0
         self._currency_name = ''
         self._date = QDate.currentDate().endOfDay(Qt.UTC).toSecsSinceEpoch()
+        self._runner = ReportRunner(self)
+        self._runner.busy.connect(self.onBusy)
+        self._runner.finished.connect(self.loadHoldings)
         self.calculated_names = ['share', 'profit', 'profit_rel', 'value', 'value_a']
         self._columns = [self.tr("Currency/Account/Asset"),
                          self.tr("Asset Name"),
@@ -223,74 +297,27 @@ class HoldingsModel(QAbstractItemModel):
         return item.data['account_id'], item.data['asset_id'], item.data['qty']
 
     def update(self):
-        self.calculateHoldings()
+        with trace_span("HoldingsModel.update"):
+            self.calculateHoldings()
 
-    # Populate table 'holdings' with data calculated for given parameters of model: _currency, _date,
     def calculateHoldings(self):
-        query = executeSQL(
-            "WITH "
-            "_last_quotes AS (SELECT MAX(timestamp) AS timestamp, asset_id, quote "
-            "FROM quotes WHERE timestamp <= :holdings_timestamp GROUP BY asset_id), "
-            "_last_assets AS ("
-            "SELECT id, SUM(t_value) AS total_value "
-            "FROM "
-            "("
-            "SELECT a.id, SUM(l.amount) AS t_value "
-            "FROM ledger AS l "
-            "LEFT JOIN accounts AS a ON l.account_id = a.id "
-            "WHERE (l.book_account=:money_book OR l.book_account=:liabilities_book) "
-            "AND a.type_id = :investments AND l.timestamp <= :holdings_timestamp GROUP BY a.id "
-            "UNION ALL "
-            "SELECT a.id, SUM(l.amount*q.quote) AS t_value "
-            "FROM ledger AS l "
-            "LEFT JOIN accounts AS a ON l.account_id = a.id "
-            "LEFT JOIN _last_quotes AS q ON l.asset_id = q.asset_id "
-            "WHERE l.book_account=:assets_book AND a.type_id = :investments AND l.timestamp <= :holdings_timestamp "
-            "GROUP BY a.id"
-            ") "
-            "GROUP BY id HAVING ABS(total_value) > :tolerance) "
-            "SELECT h.currency_id, c.name AS currency, h.account_id, h.account, h.asset_id, "
-            "c.name=a.name AS asset_is_currency, a.name AS asset, a.full_name AS asset_name, a.expiry, "
-            "h.qty, h.value AS value_i, h.quote, h.quote_a, h.total FROM ("
-            "SELECT a.currency_id, l.account_id, a.name AS account, l.asset_id, sum(l.amount) AS qty, "
-            "sum(l.value) AS value, q.quote, q.quote*cur_q.quote/cur_adj_q.quote AS quote_a, t.total_value AS total "
-            "FROM ledger AS l "
-            "LEFT JOIN accounts AS a ON l.account_id = a.id "
-            "LEFT JOIN _last_quotes AS q ON l.asset_id = q.asset_id "
-            "LEFT JOIN _last_quotes AS cur_q ON a.currency_id = cur_q.asset_id "
-            "LEFT JOIN _last_quotes AS cur_adj_q ON cur_adj_q.asset_id = :base_currency "
-            "LEFT JOIN _last_assets AS t ON l.account_id = t.id "
-            "WHERE a.type_id = :investments AND l.book_account = :assets_book AND l.timestamp <= :holdings_timestamp "
-            "GROUP BY l.account_id, l.asset_id "
-            "HAVING ABS(qty) > :tolerance "
-            "UNION ALL "
-            "SELECT a.currency_id, l.account_id, a.name AS account, l.asset_id, sum(l.amount) AS qty, "
-            "0 AS value, 1, cur_q.quote/cur_adj_q.quote AS quote_a, t.total_value AS total "
-            "FROM ledger AS l "
-            "LEFT JOIN accounts AS a ON l.account_id = a.id "
-            "LEFT JOIN _last_quotes AS cur_q ON a.currency_id = cur_q.asset_id "
-            "LEFT JOIN _last_quotes AS cur_adj_q ON cur_adj_q.asset_id = :base_currency "
-            "LEFT JOIN _last_assets AS t ON l.account_id = t.id "
-            "WHERE (l.book_account=:money_book OR l.book_account=:liabilities_book) "
-            "AND a.type_id = :investments AND l.timestamp <= :holdings_timestamp "
-            "GROUP BY l.account_id, l.asset_id "
-            "HAVING ABS(qty) > :tolerance "
-            ") AS h "
-            "LEFT JOIN assets AS c ON c.id=h.currency_id "
-            "LEFT JOIN assets AS a ON a.id=h.asset_id "
-            "ORDER BY currency, account, asset_is_currency, asset",
-            [(":base_currency", self._currency), (":money_book", BookAccount.Money),
-             (":assets_book", BookAccount.Assets), (":liabilities_book", BookAccount.Liabilities),
-             (":holdings_timestamp", self._date), (":investments", PredefindedAccountType.Investment),
-             (":tolerance", Setup.DISP_TOLERANCE)], forward_only=True)
+        self._runner.submit(holdings_list, self._currency, self._date)
+
+    def onBusy(self, busy):
+        self._view.setEnabled(not busy)
+
+    # Populate holdings tree with data calculated by holdings_list() task for parameters of model
+    def loadHoldings(self, holdings):
+        if holdings is None:
+            return
+        self.beginResetModel()
         # Load data from SQL to tree
         self._root = TreeItem({})
         currency = 0
         c_node = None
         account = 0
         a_node = None
-        while query.next():
-            values = readSQLrecord(query, named=True)
+        for values in holdings:
             values['level'] = 2
             if values['currency_id'] != currency:
                 currency = values['currency_id']
@@ -344,7 +371,7 @@ class HoldingsModel(QAbstractItemModel):
                     'value_a'] / total
             else:
                 self._root.getChild(i).data['share'] = None
-        self.modelReset.emit()
+        self.endResetModel()
         self._view.expandAll()
 
     # Update node totals with sum of profit, value and adjusted profit and value of all children
@@ -1,13 +1,22 @@
+import json
+import time
+import heapq
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 from math import copysign
 from PySide6.QtCore import Signal, QObject, QDate
 from PySide6.QtWidgets import QDialog, QMessageBox
 from jal.constants import Setup, BookAccount, TransactionType, TransferSubtype, ActionSubtype, DividendSubtype, \
     CorporateAction, PredefinedCategory, PredefinedPeer
-from jal.db.helpers import executeSQL, readSQL, readSQLrecord, db_triggers_disable, db_triggers_enable
+from jal.db.helpers import executeSQL, readSQL, readSQLrecord, db_triggers_disable, db_triggers_enable, \
+    db_connection, init_readonly_db
 from jal.db.db import JalDB
 from jal.db.settings import JalSettings
+from jal.db.cache import reference_cache
+from jal.db.valuation import invalidate_valuation
+from jal.profiling import trace_add, trace_span
 from jal.ui.ui_rebuild_window import Ui_ReBuildDialog
 
 
@@ -27,8 +36,8 @@ class RebuildDialog(QDialog, Ui_ReBuildDialog):
         y = parent.y() + parent.height()/2 - self.height()/2
         self.setGeometry(x, y, self.width(), self.height())
 
-    def isFastAndDirty(self):
-        return self.FastAndDirty.isChecked()
+    def isParallel(self):
+        return self.Parallel.isChecked()
 
     def getTimestamp(self):
         if self.LastRadioButton.isChecked():
@@ -40,14 +49,16 @@ class RebuildDialog(QDialog, Ui_ReBuildDialog):
 
 
 # ===================================================================================================================
-# Subclasses dictionary to store last amount/value for [book, account, asset]
-# Differs from dictionary in a way that __getitem__() method uses DB-stored values for initialization
+# Subclasses dictionary to store last amount and value for [book, account, asset] as a list [amount, value]
+# Differs from dictionary in a way that __getitem__() method initializes missing keys: with zeros if all last values
+# were loaded from DB by load() method or with DB-stored values otherwise
 class LedgerAmounts(dict):
-    def __init__(self, total_field=None, *args, **kwargs):
+    AMOUNT = 0
+    VALUE = 1
+
+    def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        if total_field is None:
-            raise ValueError("Unitialized field in LedgerAmounts")
-        self.total_field = total_field
+        self._loaded = False
 
     def __getitem__(self, key):
         # predefined indices in key tuple
@@ -58,13 +69,116 @@ class LedgerAmounts(dict):
         try:
             return super().__getitem__(key)
         except KeyError:
-            amount = readSQL(f"SELECT {self.total_field} FROM ledger "
-                             "WHERE book_account = :book AND account_id = :account_id AND asset_id = :asset_id "
-                             "ORDER BY id DESC LIMIT 1",
-                             [(":book", key[BOOK]), (":account_id", key[ACCOUNT]), (":asset_id", key[ASSET])])
-            amount = float(amount) if amount is not None else 0.0
-            super().__setitem__(key, amount)
-            return amount
+            amounts = [0.0, 0.0]
+            if not self._loaded:
+                values = readSQL("SELECT amount_acc, value_acc FROM ledger "
+                                 "WHERE book_account = :book AND account_id = :account_id AND asset_id = :asset_id "
+                                 "ORDER BY id DESC LIMIT 1",
+                                 [(":book", key[BOOK]), (":account_id", key[ACCOUNT]), (":asset_id", key[ASSET])])
+                if values is not None:
+                    amounts = [float(values[self.AMOUNT]), float(values[self.VALUE])]
+            super().__setitem__(key, amounts)
+            return amounts
+
+    def clear(self):
+        super().clear()
+        self._loaded = False
+
+    # Loads last amount and value for every [book, account, asset] from ledger with one query
+    def load(self):
+        self.clear()
+        query = executeSQL("SELECT book_account, account_id, asset_id, amount_acc, value_acc FROM ("
+                           "SELECT book_account, account_id, asset_id, amount_acc, value_acc, ROW_NUMBER() OVER "
+                           "(PARTITION BY book_account, account_id, asset_id ORDER BY id DESC) AS row_no FROM ledger"
+                           ") WHERE row_no = 1")
+        while query.next():
+            book, account_id, asset_id, amount, value = readSQLrecord(query)
+            super().__setitem__((book, account_id, asset_id), [float(amount), float(value)])
+        self._loaded = True
+
+
+# ===================================================================================================================
+# Returns operations since 'frontier' (only operations of 'account_id' if it is given) in the same order and with
+# the same fields as all_transactions view has. View is sorted by (timestamp, seq, subtype, id) so SQLite builds
+# and sorts the whole union before the first row is returned. Instead of it every branch of the view is read with
+# a separate query that goes in timestamp order with help of index and these streams are merged by heapq.merge().
+# (Rows with equal timestamps are re-ordered by the full key inside every stream before the merge)
+class OperationsStream:
+    QUERIES = [   # (account field, timestamp field, query for view branch)
+        ("a.account_id", "a.timestamp",
+         "SELECT a.op_type AS type, 1 AS seq, a.id, a.timestamp, "
+         "(SELECT iif(SUM(d.amount) < 0, -COUNT(d.amount), COUNT(d.amount)) FROM action_details AS d "
+         "WHERE d.pid=a.id) AS subtype, a.account_id AS account, c.currency_id AS currency, NULL AS asset, "
+         "(SELECT SUM(d.amount) FROM action_details AS d WHERE d.pid=a.id) AS amount, "
+         "(SELECT d.category_id FROM action_details AS d WHERE d.pid=a.id ORDER BY d.id LIMIT 1) AS category, "
+         "NULL AS price, NULL AS fee_tax, a.peer_id AS peer, "
+         "(SELECT d.tag_id FROM action_details AS d WHERE d.pid=a.id ORDER BY d.id LIMIT 1) AS tag "
+         "FROM actions AS a LEFT JOIN accounts AS c ON c.id=a.account_id "
+         "WHERE a.timestamp >= :frontier"),
+        ("d.account_id", "d.timestamp",
+         "SELECT d.op_type AS type, 2 AS seq, d.id, d.timestamp, d.type AS subtype, d.account_id AS account, "
+         "c.currency_id AS currency, d.asset_id AS asset, d.amount AS amount, NULL AS category, NULL AS price, "
+         "d.tax AS fee_tax, c.organization_id AS peer, NULL AS tag "
+         "FROM dividends AS d LEFT JOIN accounts AS c ON c.id=d.account_id "
+         "WHERE d.timestamp >= :frontier"),
+        ("a.account_id", "a.timestamp",
+         "SELECT a.op_type AS type, 3 AS seq, a.id, a.timestamp, a.type AS subtype, a.account_id AS account, "
+         "c.currency_id AS currency, a.asset_id AS asset, a.qty AS amount, NULL AS category, a.qty_new AS price, "
+         "a.basis_ratio AS fee_tax, a.asset_id_new AS peer, NULL AS tag "
+         "FROM corp_actions AS a LEFT JOIN accounts AS c ON c.id=a.account_id "
+         "WHERE a.timestamp >= :frontier"),
+        ("t.account_id", "t.timestamp",
+         "SELECT t.op_type AS type, 4 AS seq, t.id, t.timestamp, iif(t.qty < 0, -1, 1) AS subtype, "
+         "t.account_id AS account, c.currency_id AS currency, t.asset_id AS asset, t.qty AS amount, "
+         "NULL AS category, t.price AS price, t.fee AS fee_tax, c.organization_id AS peer, NULL AS tag "
+         "FROM trades AS t LEFT JOIN accounts AS c ON c.id=t.account_id "
+         "WHERE t.timestamp >= :frontier"),
+        ("t.withdrawal_account", "t.withdrawal_timestamp",
+         "SELECT t.op_type AS type, 5 AS seq, t.id, t.withdrawal_timestamp AS timestamp, -1 AS subtype, "
+         "t.withdrawal_account AS account, c.currency_id AS currency, t.asset AS asset, t.withdrawal AS amount, "
+         "NULL AS category, NULL AS price, NULL AS fee_tax, NULL AS peer, NULL AS tag "
+         "FROM transfers AS t LEFT JOIN accounts AS c ON c.id=t.withdrawal_account "
+         "WHERE t.withdrawal_timestamp >= :frontier"),
+        ("t.fee_account", "t.withdrawal_timestamp",
+         "SELECT t.op_type AS type, 5 AS seq, t.id, t.withdrawal_timestamp AS timestamp, 0 AS subtype, "
+         "t.fee_account AS account, c.currency_id AS currency, t.asset AS asset, t.fee AS amount, "
+         "NULL AS category, NULL AS price, NULL AS fee_tax, NULL AS peer, NULL AS tag "
+         "FROM transfers AS t LEFT JOIN accounts AS c ON c.id=t.fee_account "
+         "WHERE t.withdrawal_timestamp >= :frontier AND t.fee_account IS NOT NULL"),
+        ("t.deposit_account", "t.deposit_timestamp",
+         "SELECT t.op_type AS type, 5 AS seq, t.id, t.deposit_timestamp AS timestamp, 1 AS subtype, "
+         "t.deposit_account AS account, c.currency_id AS currency, t.asset AS asset, t.deposit AS amount, "
+         "NULL AS category, NULL AS price, NULL AS fee_tax, NULL AS peer, NULL AS tag "
+         "FROM transfers AS t LEFT JOIN accounts AS c ON c.id=t.deposit_account "
+         "WHERE t.deposit_timestamp >= :frontier")
+    ]
+
+    def __init__(self, frontier, account_id=None):
+        self._frontier = frontier
+        self._account_id = account_id
+
+    def __iter__(self):
+        streams = [self._stream(*query) for query in self.QUERIES]
+        for _key, operation in heapq.merge(*streams, key=lambda x: x[0]):
+            yield operation
+
+    # Yields (sort key, operation) for all operations returned by one query
+    def _stream(self, account_field, timestamp_field, sql_text):
+        params = [(":frontier", self._frontier)]
+        if self._account_id is not None:
+            sql_text += f" AND {account_field} = :account_id"
+            params.append((":account_id", self._account_id))
+        sql_text += f" ORDER BY {timestamp_field}"
+        query = executeSQL(sql_text, params)
+        group = []    # Operations with the same timestamp
+        while query.next():
+            operation = readSQLrecord(query, named=True)
+            key = (operation['timestamp'], operation.pop('seq'), operation['subtype'], operation['id'])
+            if group and group[0][0][0] != key[0]:
+                yield from sorted(group, key=lambda x: x[0])
+                group = []
+            group.append((key, operation))
+        yield from sorted(group, key=lambda x: x[0])
 
 
 # ===================================================================================================================
@@ -75,8 +189,7 @@ class Ledger(QObject):
     def __init__(self):
         QObject.__init__(self)
         self.current = {}
-        self.amounts = LedgerAmounts("amount_acc")    # store last amount for [book, account, asset]
-        self.values = LedgerAmounts("value_acc")      # together with corresponding value
+        self.amounts = LedgerAmounts()    # store last amount and value for [book, account, asset]
         self.main_window = None
         self.progress_bar = None
 
@@ -113,8 +226,9 @@ class Ledger(QObject):
             category_id = None
             tag_id = None
         value = 0.0 if value is None else value
-        self.amounts[(book, account_id, asset_id)] += amount
-        self.values[(book, account_id, asset_id)] += value
+        amounts = self.amounts[(book, account_id, asset_id)]
+        amounts[LedgerAmounts.AMOUNT] += amount
+        amounts[LedgerAmounts.VALUE] += value
         if (abs(amount) + abs(value)) <= (4 * Setup.CALC_TOLERANCE):
             return  # we have zero amount - no reason to put it into ledger
 
@@ -124,15 +238,56 @@ class Ledger(QObject):
                        ":amount, :value, :amount_acc, :value_acc, :peer_id, :category_id, :tag_id)",
                        [(":timestamp", timestamp), (":op_type", op_type), (":operation_id", op_id),
                         (":book", book), (":asset_id", asset_id), (":account_id", account_id), (":amount", amount),
-                        (":value", value), (":amount_acc", self.amounts[(book, account_id, asset_id)]),
-                        (":value_acc", self.values[(book, account_id, asset_id)]),
+                        (":value", value), (":amount_acc", amounts[LedgerAmounts.AMOUNT]),
+                        (":value_acc", amounts[LedgerAmounts.VALUE]),
                         (":peer_id", peer_id), (":category_id", category_id), (":tag_id", tag_id)])
 
+    # Returns query with a list of all previous not matched trades or corporate actions for given account and asset
+    # Fee and quantity of opening trade and type of opening corporate action are included for deals calculation
+    def openTradesQuery(self, account_id, asset_id):
+        return executeSQL("SELECT o.timestamp, o.op_type, o.operation_id, o.account_id, o.asset_id, o.price, "
+                          "o.remaining_qty, t.fee, t.qty AS trade_qty, ca.type AS corp_action "
+                          "FROM open_trades AS o "
+                          "LEFT JOIN trades AS t ON t.id=o.operation_id AND t.op_type=o.op_type "
+                          "LEFT JOIN corp_actions AS ca ON ca.id=o.operation_id AND ca.op_type=o.op_type "
+                          "WHERE o.account_id=:account_id AND o.asset_id=:asset_id AND o.remaining_qty!=0 "
+                          "ORDER BY o.timestamp, o.op_type DESC",
+                          [(":account_id", account_id), (":asset_id", asset_id)])
+
+    # Stores a deal that closes 'qty' of 'opening_trade' with current operation at 'close_price'.
+    # Fees of opening and closing trades are split proportionally to deal quantity and stored together with deal
+    # profit and corporate action flag (positive - deal was opened by corporate action, negative - closed by it)
+    def appendDeal(self, opening_trade, qty, close_price, close_fee=None, close_qty=None):
+        open_fee = opening_trade['fee'] * abs(qty / opening_trade['trade_qty']) \
+            if opening_trade['fee'] and opening_trade['trade_qty'] else 0.0
+        close_fee = close_fee * abs(qty / close_qty) if close_fee and close_qty else 0.0
+        profit = qty * (close_price - opening_trade['price']) - (open_fee + close_fee)
+        rel_profit = 100 * profit / abs(qty * opening_trade['price']) if qty * opening_trade['price'] else 0.0
+        if opening_trade['corp_action']:
+            corp_action = opening_trade['corp_action']
+        elif self.current['type'] == TransactionType.CorporateAction:
+            corp_action = -self.current['subtype']
+        else:
+            corp_action = None
+        _ = executeSQL("INSERT INTO deals(account_id, asset_id, open_op_type, open_op_id, open_timestamp, open_price, "
+                       "close_op_type, close_op_id, close_timestamp, close_price, qty, open_fee, close_fee, profit, "
+                       "rel_profit, corp_action) "
+                       "VALUES(:account_id, :asset_id, :open_op_type, :open_op_id, :open_timestamp, :open_price, "
+                       ":close_op_type, :close_op_id, :close_timestamp, :close_price, :qty, :open_fee, :close_fee, "
+                       ":profit, :rel_profit, :corp_action)",
+                       [(":account_id", opening_trade['account_id']), (":asset_id", opening_trade['asset_id']),
+                        (":open_op_type", opening_trade['op_type']), (":open_op_id", opening_trade['operation_id']),
+                        (":open_timestamp", opening_trade['timestamp']), (":open_price", opening_trade['price']),
+                        (":close_op_type", self.current['type']), (":close_op_id", self.current['id']),
+                        (":close_timestamp", self.current['timestamp']), (":close_price", close_price), (":qty", qty),
+                        (":open_fee", open_fee), (":close_fee", close_fee), (":profit", profit),
+                        (":rel_profit", rel_profit), (":corp_action", corp_action)])
+
     # Returns Amount measured in current account currency or asset that 'book' has at current ledger frontier
     def getAmount(self, book, asset_id=None):
         if asset_id is None:
             asset_id = self.current['currency']
-        return self.amounts[(book, self.current['account'], asset_id)]
+        return self.amounts[(book, self.current['account'], asset_id)][LedgerAmounts.AMOUNT]
 
     def takeCredit(self, operation_amount):
         money_available = self.getAmount(BookAccount.Money)
@@ -260,11 +415,7 @@ class Ledger(QObject):
         asset_amount = self.getAmount(BookAccount.Assets, asset_id)
         if ((-type) * asset_amount) > 0:  # Process deal match if we have asset that is opposite to operation
             # Get a list of all previous not matched trades or corporate actions
-            query = executeSQL("SELECT timestamp, op_type, operation_id, account_id, asset_id, price, remaining_qty "
-                               "FROM open_trades "
-                               "WHERE account_id=:account_id AND asset_id=:asset_id AND remaining_qty!=0 "
-                               "ORDER BY timestamp, op_type DESC",
-                               [(":account_id", account_id), (":asset_id", asset_id)])
+            query = self.openTradesQuery(account_id, asset_id)
             while query.next():
                 opening_trade = readSQLrecord(query, named=True)
                 next_deal_qty = opening_trade['remaining_qty']
@@ -274,15 +425,8 @@ class Ledger(QObject):
                                "WHERE op_type=:op_type AND operation_id=:id AND asset_id=:asset_id",
                                [(":qty", next_deal_qty), (":op_type", opening_trade['op_type']),
                                 (":id", opening_trade['operation_id']), (":asset_id", asset_id)])
-                _ = executeSQL("INSERT INTO deals(account_id, asset_id, open_op_type, open_op_id, open_timestamp, open_price, "
-                               "close_op_type, close_op_id, close_timestamp, close_price, qty) "
-                               "VALUES(:account_id, :asset_id, :open_op_type, :open_op_id, :open_timestamp, :open_price, "
-                               ":close_op_type, :close_op_id, :close_timestamp, :close_price, :qty)",
-                               [(":account_id", account_id), (":asset_id", asset_id),
-                                (":open_op_type", opening_trade['op_type']), (":open_op_id", opening_trade['operation_id']),
-                                (":open_timestamp", opening_trade['timestamp']), (":open_price", opening_trade['price']),
-                                (":close_op_type", TransactionType.Trade), (":close_op_id", self.current['id']),
-                                (":close_timestamp", self.current['timestamp']), (":close_price", price), (":qty", (-type)*next_deal_qty)])
+                self.appendDeal(opening_trade, (-type)*next_deal_qty, price,
+                                close_fee=self.current['fee_tax'], close_qty=self.current['amount'])
                 processed_qty += next_deal_qty
                 processed_value += (next_deal_qty * opening_trade['price'])
                 if processed_qty == qty:
@@ -348,11 +492,7 @@ class Ledger(QObject):
                              + f"{datetime.utcfromtimestamp(self.current['timestamp']).strftime('%d/%m/%Y %H:%M:%S')}, "
                              + f"Asset amount: {asset_amount}, Qty required: {qty}, Operation: {self.current}")
         # Get a list of all previous not matched trades or corporate actions
-        query = executeSQL("SELECT timestamp, op_type, operation_id, account_id, asset_id, price, remaining_qty "
-                           "FROM open_trades "
-                           "WHERE account_id=:account_id AND asset_id=:asset_id  AND remaining_qty!=0 "
-                           "ORDER BY timestamp, op_type DESC",
-                           [(":account_id", account_id), (":asset_id", asset_id)])
+        query = self.openTradesQuery(account_id, asset_id)
         while query.next():
             opening_trade = readSQLrecord(query, named=True)
             next_deal_qty = opening_trade['remaining_qty']
@@ -366,16 +506,7 @@ class Ledger(QObject):
                             (":asset_id", asset_id)])
 
             # Deal have the same open and close prices as corportate action doesn't create profit, but redistributes value
-            _ = executeSQL("INSERT INTO deals(account_id, asset_id, open_op_type, open_op_id, open_timestamp, open_price, "
-                           " close_op_type, close_op_id, close_timestamp, close_price, qty) "
-                           "VALUES(:account_id, :asset_id, :open_op_type, :open_op_id, :open_timestamp, :open_price, "
-                           ":close_op_type, :close_op_id, :close_timestamp, :close_price, :qty)",
-                           [(":account_id", account_id), (":asset_id", asset_id),
-                            (":open_op_type", opening_trade['op_type']), (":open_op_id", opening_trade['operation_id']),
-                            (":open_timestamp", opening_trade['timestamp']), (":open_price", opening_trade['price']),
-                            (":close_op_type", TransactionType.CorporateAction), (":close_op_id", self.current['id']),
-                            (":close_timestamp", self.current['timestamp']), (":close_price", opening_trade['price']),
-                            (":qty", next_deal_qty)])
+            self.appendDeal(opening_trade, next_deal_qty, opening_trade['price'])
             processed_qty += next_deal_qty
             processed_value += (next_deal_qty * opening_trade['price'])
             if processed_qty == qty:
@@ -417,13 +548,42 @@ class Ledger(QObject):
                         (":account_id", account_id), (":asset_id", new_asset), (":price", new_price), (":remaining_qty", new_qty)])
         self.appendTransaction(BookAccount.Assets, new_qty, new_value)
 
-    # Rebuild transaction sequence and recalculate all amounts
-    # timestamp:
-    # -1 - re-build from last valid operation (from ledger frontier)
-    #      will asks for confirmation if we have more than SILENT_REBUILD_THRESHOLD operations require rebuild
-    # 0 - re-build from scratch
-    # any - re-build all operations after given timestamp
-    def rebuild(self, from_timestamp=-1, fast_and_dirty=False):
+    # Returns checkpoint of interrupted rebuild if it is still valid, i.e. the operation that was processed last
+    # still exists and ledger wasn't modified after the checkpoint was saved. Otherwise returns None
+    def loadCheckpoint(self):
+        try:
+            checkpoint = json.loads(JalSettings().getValue('RebuildCheckpoint', ''))
+        except (TypeError, ValueError):
+            return None
+        if readSQL("SELECT MAX(id) FROM ledger") != checkpoint['ledger_id']:
+            return None
+        if not readSQL("SELECT COUNT(id) FROM all_transactions "
+                       "WHERE timestamp=:timestamp AND type=:type AND subtype=:subtype AND id=:id",
+                       [(":timestamp", checkpoint['timestamp']), (":type", checkpoint['type']),
+                        (":subtype", checkpoint['subtype']), (":id", checkpoint['id'])]):
+            return None
+        return checkpoint
+
+    # Stores current operation as the last completed one. It should be committed together with results of operation
+    def saveCheckpoint(self, frontier):
+        checkpoint = {
+            'frontier': frontier,
+            'timestamp': self.current['timestamp'],
+            'type': self.current['type'],
+            'subtype': self.current['subtype'],
+            'id': self.current['id'],
+            'ledger_id': readSQL("SELECT MAX(id) FROM ledger")
+        }
+        _ = executeSQL("INSERT OR REPLACE INTO settings(id, name, value) "
+                       "VALUES((SELECT id FROM settings WHERE name=:key), :key, :value)",
+                       [(":key", 'RebuildCheckpoint'), (":value", json.dumps(checkpoint))])
+
+    # Processes operations from all_transactions view starting from 'frontier' (only operations of 'account_id'
+    # if it is given). Number of operations and time spent are accumulated in 'op_timing' for every processing method.
+    # Results are committed after every Setup.REBUILD_CHUNK_SIZE operations together with a checkpoint, so processing
+    # may be continued after the last completed operation from given 'checkpoint'. Uncommitted results are rolled back
+    # in case of failure. (Workers of parallel rebuild don't use checkpoints as their results are stored at once)
+    def processOperations(self, frontier, op_timing, account_id=None, checkpoint=None):
         operationProcess = {
             TransactionType.Action: self.processAction,
             TransactionType.Dividend: self.processDividend,
@@ -432,59 +592,166 @@ class Ledger(QObject):
             TransactionType.CorporateAction: self.processCorporateAction
         }
 
+        use_checkpoints = account_id is None
+        skip = checkpoint is not None   # Operations are skipped up to the checkpoint (including it)
+        processed = 0
+        self.amounts.load()
+        db = db_connection()
+        db.transaction()
+        try:
+            operations = OperationsStream(frontier if checkpoint is None else checkpoint['timestamp'], account_id)
+            for position, self.current in enumerate(operations, start=1):
+                if skip:
+                    skip = (self.current['type'], self.current['subtype'], self.current['id']) != \
+                           (checkpoint['type'], checkpoint['subtype'], checkpoint['id'])
+                    continue
+                process = operationProcess[self.current['type']]
+                op_start = time.perf_counter()
+                process()
+                timing = op_timing.setdefault(process.__name__, [0, 0.0])
+                timing[0] += 1
+                timing[1] += time.perf_counter() - op_start
+                processed += 1
+                if use_checkpoints and processed % Setup.REBUILD_CHUNK_SIZE == 0:
+                    self.saveCheckpoint(frontier)
+                    db.commit()
+                    db.transaction()
+                if self.progress_bar is not None:
+                    self.progress_bar.setValue(position)
+            if use_checkpoints and processed:
+                self.saveCheckpoint(frontier)
+            db.commit()
+        except Exception:
+            db.rollback()
+            reference_cache().invalidate()    # Cache may keep settings that were rolled back
+            raise
+
+    # Does the same as processOperations() but operations of every account are processed in a separate process.
+    # It is possible as all ledger records, deals and open trades are bound to the account of operation
+    # (transfers are present in all_transactions as separate records for every account).
+    # Workers use read-only connection to the database and results are stored into it in one transaction.
+    def processOperationsParallel(self, frontier, op_timing, accounts):
+        results = []
+        failed = []
+        processed = 0
+        # Workers are spawned as fork isn't safe for a process that has Qt objects
+        with ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'), initializer=_init_rebuild_worker,
+                                 initargs=(db_connection().databaseName(),)) as pool:
+            futures = {pool.submit(_rebuild_account, account_id, frontier): account_id for account_id in accounts}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed.append(futures[future])
+                    logging.error(self.tr("Ledger rebuild failed for account ") + f"{futures[future]}: {e}")
+                    continue
+                results.append(result)
+                for method, timing in result['timing'].items():
+                    total = op_timing.setdefault(method, [0, 0.0])
+                    total[0] += timing[0]
+                    total[1] += timing[1]
+                    processed += timing[0]
+                if self.progress_bar is not None:
+                    self.progress_bar.setValue(processed)
+        if results:
+            self.storeAccountResults(results)
+        if failed:
+            raise RuntimeError(self.tr("Ledger wasn't rebuilt for accounts: ") + f"{failed}")
+
+    # Replaces open trades of accounts and adds deals and ledger records calculated by _rebuild_account()
+    # Records of different accounts are interleaved in order of time to keep ledger ordered as it is after
+    # sequential rebuild (order of records within every account is preserved by heapq.merge())
+    def storeAccountResults(self, results):
+        db = db_connection()
+        db.transaction()
+        for result in results:
+            _ = executeSQL("DELETE FROM open_trades WHERE account_id=:account_id",
+                           [(":account_id", result['account_id'])])
+        for table, order_field in [("open_trades", "timestamp"), ("deals", "close_timestamp"),
+                                   ("ledger", "timestamp")]:
+            columns = results[0][table][0]
+            order_idx = columns.index(order_field)
+            sql_text = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join([':' + x for x in columns])})"
+            for row in heapq.merge(*[x[table][1] for x in results], key=lambda x: x[order_idx]):
+                _ = executeSQL(sql_text, [(':' + name, value) for name, value in zip(columns, row)])
+        db.commit()
+
+    # Rebuild transaction sequence and recalculate all amounts
+    # timestamp:
+    # -1 - re-build from last valid operation (from ledger frontier)
+    #      will asks for confirmation if we have more than SILENT_REBUILD_THRESHOLD operations require rebuild
+    # 0 - re-build from scratch
+    # any - re-build all operations after given timestamp
+    # parallel - operations of different accounts are processed by a pool of processes
+    # confirm - ask user before rebuild of more than SILENT_REBUILD_THRESHOLD operations from ledger frontier
+    # Rebuild from ledger frontier continues interrupted rebuild if it has a valid checkpoint (see processOperations())
+    # Returns False if rebuild failed
+    def rebuild(self, from_timestamp=-1, parallel=False, confirm=True):
         exception_happened = False
         self.amounts.clear()
-        self.values.clear()
+        checkpoint = self.loadCheckpoint() if from_timestamp < 0 else None
         if from_timestamp >= 0:
             frontier = from_timestamp
             operations_count = readSQL("SELECT COUNT(id) FROM all_transactions WHERE timestamp >= :frontier",
                                        [(":frontier", frontier)])
+        elif checkpoint is not None:
+            frontier = checkpoint['frontier']
+            operations_count = readSQL("SELECT COUNT(id) FROM all_transactions WHERE timestamp >= :frontier",
+                                       [(":frontier", checkpoint['timestamp'])])
+            parallel = False
         else:
             frontier = self.getCurrentFrontier()
             operations_count = readSQL("SELECT COUNT(id) FROM all_transactions WHERE timestamp >= :frontier",
                                        [(":frontier", frontier)])
-            if operations_count > self.SILENT_REBUILD_THRESHOLD:
+            if confirm and operations_count > self.SILENT_REBUILD_THRESHOLD:
                 if QMessageBox().warning(None, self.tr("Confirmation"), f"{operations_count}" +
                                          self.tr(" operations require rebuild. Do you want to do it right now?"),
                                          QMessageBox.Yes, QMessageBox.No) == QMessageBox.No:
                     JalSettings().setValue('RebuildDB', 1)
-                    return
+                    return True
         if operations_count == 0:
             logging.info(self.tr("Leger is empty"))
-            return
+            return True
         if self.progress_bar is not None:
             self.progress_bar.setRange(0, operations_count)
             self.main_window.showProgressBar(True)
-        logging.info(self.tr("Re-building ledger since: ") +
-                     f"{datetime.utcfromtimestamp(frontier).strftime('%d/%m/%Y %H:%M:%S')}")
         start_time = datetime.now()
-        _ = executeSQL("DELETE FROM deals WHERE close_timestamp >= :frontier", [(":frontier", frontier)])
-        _ = executeSQL("DELETE FROM ledger WHERE timestamp >= :frontier", [(":frontier", frontier)])
-        _ = executeSQL("DELETE FROM ledger_totals WHERE timestamp >= :frontier", [(":frontier", frontier)])
-        _ = executeSQL("DELETE FROM open_trades WHERE timestamp >= :frontier", [(":frontier", frontier)])
+        rebuild_start = time.perf_counter()
+        if checkpoint is None:
+            logging.info(self.tr("Re-building ledger since: ") +
+                         f"{datetime.utcfromtimestamp(frontier).strftime('%d/%m/%Y %H:%M:%S')}")
+            JalSettings().setValue('RebuildDB', 1)    # Flag is kept if rebuild is interrupted
+            JalSettings().setValue('RebuildCheckpoint', '')
+            _ = executeSQL("DELETE FROM deals WHERE close_timestamp >= :frontier", [(":frontier", frontier)])
+            _ = executeSQL("DELETE FROM ledger WHERE timestamp >= :frontier", [(":frontier", frontier)])
+            _ = executeSQL("DELETE FROM open_trades WHERE timestamp >= :frontier", [(":frontier", frontier)])
+            invalidate_valuation(frontier)
+        else:
+            logging.info(self.tr("Continue ledger re-build from: ") +
+                         f"{datetime.utcfromtimestamp(checkpoint['timestamp']).strftime('%d/%m/%Y %H:%M:%S')}")
 
         db_triggers_disable()
-        if fast_and_dirty:  # For 30k operations difference of execution time is - with 0:02:41 / without 0:11:44
-            _ = executeSQL("PRAGMA synchronous = OFF")
-        try:
-            query = executeSQL("SELECT type, id, timestamp, subtype, account, currency, asset, amount, "
-                               "category, price, fee_tax, peer, tag FROM all_transactions "
-                               "WHERE timestamp >= :frontier", [(":frontier", frontier)])
+        op_timing = {}    # name of processing method -> [number of operations, time spent]
+        accounts = []
+        if parallel:
+            query = executeSQL("SELECT DISTINCT account FROM all_transactions WHERE timestamp >= :frontier",
+                               [(":frontier", frontier)])
             while query.next():
-                self.current = readSQLrecord(query, named=True)
-                operationProcess[self.current['type']]()
-                if self.progress_bar is not None:
-                    self.progress_bar.setValue(query.at())
+                accounts.append(readSQLrecord(query))
+        try:
+            if len(accounts) > 1:
+                self.processOperationsParallel(frontier, op_timing, accounts)
+            else:
+                self.processOperations(frontier, op_timing, checkpoint=checkpoint)
         except Exception as e:
             exception_happened = True
             logging.error(f"{e}")
         finally:
-            if fast_and_dirty:
-                _ = executeSQL("PRAGMA synchronous = ON")
             db_triggers_enable()
             if self.progress_bar is not None:
                 self.main_window.showProgressBar(False)
         # Fill ledger totals values
+        _ = executeSQL("DELETE FROM ledger_totals WHERE timestamp >= :frontier", [(":frontier", frontier)])
         _ = executeSQL("INSERT INTO ledger_totals"
                        "(op_type, operation_id, timestamp, book_account, asset_id, account_id, amount_acc, value_acc) "
                        "SELECT op_type, operation_id, timestamp, book_account, "
@@ -492,18 +759,83 @@ class Ledger(QObject):
                        "WHERE id IN ("
                        "SELECT MAX(id) FROM ledger WHERE timestamp >= :frontier "
                        "GROUP BY op_type, operation_id, book_account, account_id)", [(":frontier", frontier)])
-        JalSettings().setValue('RebuildDB', 0)
+        invalidate_valuation(frontier)     # Series might be calculated from incomplete ledger while it was re-built
+        if not exception_happened:
+            JalSettings().setValue('RebuildDB', 0)
+            JalSettings().setValue('RebuildCheckpoint', '')
+        # Time spent for every operation type is put into attributes of the span
+        op_stats = {}
+        for method, timing in op_timing.items():
+            op_stats[f"{method}.count"] = timing[0]
+            op_stats[f"{method}.ms"] = round(timing[1] * 1000, 1)
+        trace_add("Ledger.rebuild", rebuild_start, time.perf_counter() - rebuild_start, frontier=frontier,
+                  operations=operations_count, accounts=len(accounts), failed=exception_happened, **op_stats)
         if exception_happened:
             logging.error(self.tr("Exception happened. Ledger is incomplete. Please correct errors listed in log"))
         else:
             logging.info(self.tr("Ledger is complete. Elapsed time: ") + f"{datetime.now() - start_time}" +
                          self.tr(", new frontier: ") +
-                         f"{datetime.utcfromtimestamp(self.current['timestamp']).strftime('%d/%m/%Y %H:%M:%S')}")
+                         f"{datetime.utcfromtimestamp(self.getCurrentFrontier()).strftime('%d/%m/%Y %H:%M:%S')}")
 
-        self.updated.emit()
+        with trace_span("Ledger.updated"):
+            self.updated.emit()
+        return not exception_happened
 
     def showRebuildDialog(self, parent):
         rebuild_dialog = RebuildDialog(parent, self.getCurrentFrontier())
         if rebuild_dialog.exec():
-            self.rebuild(from_timestamp=rebuild_dialog.getTimestamp(),
-                         fast_and_dirty=rebuild_dialog.isFastAndDirty())
+            self.rebuild(from_timestamp=rebuild_dialog.getTimestamp(), parallel=rebuild_dialog.isParallel())
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Worker process initializer for parallel ledger rebuild - every worker keeps its own read-only connection to DB
+def _init_rebuild_worker(db_file):
+    if not init_readonly_db(db_file):
+        raise RuntimeError(f"Can't open DB file '{db_file}'")
+
+
+# Creates temporary table that has the same name and columns as 'table' of the main database. As temporary tables
+# take precedence over main ones all ledger queries use it instead of read-only table. Returns list of columns
+# except primary key
+def _shadow_table(table):
+    _ = executeSQL(f"DROP TABLE IF EXISTS temp.{table}")
+    columns = []
+    definitions = []
+    query = executeSQL(f"PRAGMA main.table_info({table})")
+    while query.next():
+        _cid, name, data_type, _not_null, _default, primary_key = readSQLrecord(query)
+        definitions.append(f"{name} {data_type}" + (" PRIMARY KEY" if primary_key else ""))
+        if not primary_key:
+            columns.append(name)
+    _ = executeSQL(f"CREATE TEMP TABLE {table} ({', '.join(definitions)})")
+    return columns
+
+
+# Returns list of tuples with values of 'columns' for all records of temporary 'table' that match 'condition'
+def _shadow_records(table, columns, condition, params):
+    records = []
+    query = executeSQL(f"SELECT {', '.join(columns)} FROM temp.{table} WHERE {condition} ORDER BY id", params)
+    while query.next():
+        records.append(tuple([None if query.isNull(i) else query.value(i) for i in range(len(columns))]))
+    return records
+
+
+# Processes operations of one account since 'frontier' in temporary tables that are initialized with the state
+# of the account at the frontier: open trades and last ledger records for every book and asset.
+# Returns dictionary with operation timings and (columns, records) for open_trades, deals and ledger tables
+def _rebuild_account(account_id, frontier):
+    with trace_span("Ledger.rebuild_account", account=account_id):
+        result = {'account_id': account_id, 'timing': {}}
+        columns = {table: _shadow_table(table) for table in ["open_trades", "deals", "ledger"]}
+        _ = executeSQL("INSERT INTO temp.open_trades SELECT * FROM main.open_trades WHERE account_id=:account_id",
+                       [(":account_id", account_id)])
+        _ = executeSQL("INSERT INTO temp.ledger SELECT * FROM main.ledger WHERE id IN "
+                       "(SELECT MAX(id) FROM main.ledger WHERE account_id=:account_id GROUP BY book_account, asset_id)",
+                       [(":account_id", account_id)])
+        Ledger().processOperations(frontier, result['timing'], account_id=account_id)
+        result['open_trades'] = (columns['open_trades'],
+                                 _shadow_records("open_trades", columns['open_trades'], "1", []))
+        result['deals'] = (columns['deals'], _shadow_records("deals", columns['deals'], "1", []))
+        result['ledger'] = (columns['ledger'], _shadow_records("ledger", columns['ledger'], "timestamp >= :frontier",
+                                                               [(":frontier", frontier)]))
+    return result
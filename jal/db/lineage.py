@@ -0,0 +1,87 @@
+from jal.constants import TransactionType, CorporateAction, DividendSubtype
+from jal.db.helpers import executeSQL, readSQLrecord
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Open/close lineage of deals of one account that is kept in memory as a directed acyclic graph.
+# Every corporate action is a node that has edges to operations that opened deals closed by this corporate action,
+# i.e. the graph is traversed from the latest corporate action back to initial purchases.
+# All trades, corporate actions and bond interest payments that are referenced by the graph are loaded with a few
+# bulk queries so the traversal doesn't need any SQL queries.
+class DealsLineage:
+    def __init__(self, account_id):
+        self._account_id = account_id
+        self._edges = {}        # corporate action id -> [(open_op_type, open_op_id, deal_qty), ...]
+        self._trades = {}       # trade id -> trade record
+        self._actions = {}      # corporate action id -> corporate action record
+        self._interest = {}     # trade number -> bond interest record
+        self._load()
+
+    def _load(self):
+        query = executeSQL("SELECT close_op_id, open_op_type, open_op_id, qty FROM deals "
+                           "WHERE account_id=:account_id AND close_op_type=:corp_action ORDER BY id",
+                           [(":account_id", self._account_id), (":corp_action", TransactionType.CorporateAction)])
+        while query.next():
+            close_id, open_type, open_id, qty = readSQLrecord(query)
+            self._edges.setdefault(close_id, []).append((open_type, open_id, qty))
+        query = executeSQL("SELECT t.id AS trade_id, s.name AS symbol, s.isin AS isin, s.type_id AS type_id, "
+                           "t.timestamp AS t_date, t.number AS trade_number, "
+                           "t.settlement AS s_date, t.price AS price, t.fee AS fee "
+                           "FROM trades AS t "
+                           "LEFT JOIN assets AS s ON t.asset_id=s.id "
+                           "WHERE t.id IN (SELECT open_op_id FROM deals WHERE account_id=:account_id "
+                           "AND open_op_type=:trade AND close_op_type=:corp_action)",
+                           [(":account_id", self._account_id), (":trade", TransactionType.Trade),
+                            (":corp_action", TransactionType.CorporateAction)])
+        while query.next():
+            trade = readSQLrecord(query, named=True)
+            self._trades[trade['trade_id']] = trade
+        query = executeSQL("SELECT a.id, a.timestamp AS action_date, a.number AS action_number, a.type, "
+                           "s1.name AS symbol, s1.isin AS isin, a.qty AS qty, "
+                           "s2.name AS symbol_new, s2.isin AS isin_new, a.qty_new AS qty_new, "
+                           "a.note AS note, a.basis_ratio "
+                           "FROM corp_actions AS a "
+                           "LEFT JOIN assets AS s1 ON a.asset_id=s1.id "
+                           "LEFT JOIN assets AS s2 ON a.asset_id_new=s2.id "
+                           "WHERE a.account_id=:account_id",
+                           [(":account_id", self._account_id)])
+        while query.next():
+            action = readSQLrecord(query, named=True)
+            self._actions[action.pop('id')] = action
+        query = executeSQL("SELECT b.name AS symbol, b.isin AS isin, i.timestamp AS o_date, i.number AS number, "
+                           "i.amount AS interest, cc.iso_code AS country_iso "
+                           "FROM dividends AS i "
+                           "LEFT JOIN assets AS b ON i.asset_id = b.id "
+                           "LEFT JOIN accounts AS a ON a.id = i.account_id "
+                           "LEFT JOIN countries AS cc ON cc.id = a.country_id "
+                           "WHERE i.account_id=:account_id AND i.type=:interest ORDER BY i.id",
+                           [(":account_id", self._account_id), (":interest", DividendSubtype.BondInterest)])
+        while query.next():
+            interest = readSQLrecord(query, named=True)
+            self._interest.setdefault(interest['number'], interest)
+
+    # Returns list of (op_type, op_id, deal_qty) for operations that opened deals closed by given corporate action
+    def opened_by(self, action_id):
+        return self._edges.get(action_id, [])
+
+    # Following methods return copies of records as callers put report data into them
+    def trade(self, trade_id):
+        return dict(self._trades[trade_id])
+
+    def corporate_action(self, action_id):
+        return dict(self._actions[action_id])
+
+    def bond_interest(self, trade_number):
+        interest = self._interest.get(trade_number)
+        return dict(interest) if interest is not None else None
+
+    # Returns asset quantity before corporate action that corresponds to 'qty' of 'symbol' after it and
+    # multiplier that should be applied to the cost basis
+    def basis(self, action_id, symbol, qty):
+        action = self._actions[action_id]
+        if action['type'] == CorporateAction.SpinOff and symbol != action['symbol_new']:
+            return action['qty'], 1 - action['basis_ratio']
+        elif action['type'] == CorporateAction.SpinOff:
+            return action['qty'] * qty / action['qty_new'], action['basis_ratio']
+        else:
+            return action['qty'] * qty / action['qty_new'], 1
@@ -5,6 +5,8 @@ from PySide6.QtGui import QBrush, QFont
 from PySide6.QtWidgets import QStyledItemDelegate, QHeaderView
 from jal.constants import CustomColor, TransactionType, TransferSubtype, DividendSubtype, CorporateAction
 from jal.db.helpers import db_connection, readSQL, executeSQL, readSQLrecord
+from jal.db.cache import reference_cache
+from jal.profiling import trace_span
 
 
 class OperationsModel(QAbstractTableModel):
@@ -292,7 +294,8 @@ class OperationsModel(QAbstractTableModel):
         self.prepareData()
 
     def update(self):
-        self.prepareData()
+        with trace_span("OperationsModel.update"):
+            self.prepareData()
 
     def get_operation_type(self, row):
         if (row >= 0) and (row < len(self._data)):
@@ -303,7 +306,8 @@ class OperationsModel(QAbstractTableModel):
     @Slot()
     def refresh(self):
         idx = self._view.selectionModel().selection().indexes()
-        self.prepareData()
+        with trace_span("OperationsModel.refresh"):
+            self.prepareData()
         if idx:
             self._view.setCurrentIndex(idx[0])
 
@@ -325,13 +329,78 @@ class OperationsModel(QAbstractTableModel):
         self.fetchMore(self.createIndex(0, 0))
         self.modelReset.emit()
 
-    def deleteRows(self, rows):
+    # Returns {table name: set of operation ids} for given rows of the model (only operations of given types if set)
+    def _operations(self, rows, types=None):
+        operations = {}
         for row in rows:
             if (row >= 0) and (row < len(self._data)):
-                table_name = self._tables[self._data[row]['type']]
-                query = f"DELETE FROM {table_name} WHERE id={self._data[row]['id']}"
-                _ = executeSQL(query)
+                if types is None or self._data[row]['type'] in types:
+                    table_name = self._tables[self._data[row]['type']]
+                    operations.setdefault(table_name, set()).add(self._data[row]['id'])
+        return operations
+
+    # Executes 'statements' (list of (table name, SQL text)) for operations of given rows in one transaction with
+    # triggers disabled. Every statement is executed for all operations of its table, operation ids are substituted
+    # as {ids}. Ledger is invalidated once from the earliest timestamp of affected operations.
+    # Returns True if all changes were committed
+    def _batchModify(self, rows, statements, types=None):
+        operations = self._operations(rows, types)
+        if not operations:
+            return False
+        frontier = None
+        for table_name, ids in operations.items():
+            timestamp_field = "timestamp"
+            if table_name == "transfers":
+                timestamp_field = "MIN(withdrawal_timestamp, deposit_timestamp)"
+            timestamp = readSQL(f"SELECT MIN({timestamp_field}) FROM {table_name} "
+                                f"WHERE id IN ({','.join([str(x) for x in ids])})")
+            if timestamp is not None and timestamp != '':
+                frontier = timestamp if frontier is None else min(frontier, timestamp)
+        db = db_connection()
+        db.transaction()
+        success = executeSQL("UPDATE settings SET value=0 WHERE name='TriggersEnabled'") is not None
+        for table_name, sql_text in statements:
+            if not success:
+                break
+            if table_name in operations:
+                ids = ','.join([str(x) for x in operations[table_name]])
+                success = executeSQL(sql_text.format(ids=ids)) is not None
+        if success and frontier is not None:
+            success = executeSQL("DELETE FROM ledger WHERE timestamp >= :frontier",
+                                 [(":frontier", frontier)]) is not None
+            if success and ("trades" in operations or "corp_actions" in operations):
+                success = executeSQL("DELETE FROM open_trades WHERE timestamp >= :frontier",
+                                     [(":frontier", frontier)]) is not None
+        if success:
+            success = executeSQL("UPDATE settings SET value=1 WHERE name='TriggersEnabled'") is not None
+        if success:
+            db.commit()
+        else:
+            db.rollback()
+            reference_cache().invalidate()
         self.prepareData()
+        return success
+
+    def deleteRows(self, rows):
+        statements = [("actions", "DELETE FROM action_details WHERE pid IN ({ids})")]
+        statements += [(table_name, f"DELETE FROM {table_name} WHERE id IN ({{ids}})")
+                       for table_name in self._tables.values()]
+        return self._batchModify(rows, statements)
+
+    # Sets category of all details of selected actions
+    def recategorizeRows(self, rows, category_id):
+        return self._batchModify(rows, [("actions", f"UPDATE action_details SET category_id={int(category_id)} "
+                                                    f"WHERE pid IN ({{ids}})")], [TransactionType.Action])
+
+    # Sets tag of all details of selected actions (tag is removed if tag_id is None)
+    def retagRows(self, rows, tag_id):
+        tag = 'NULL' if tag_id is None else int(tag_id)
+        return self._batchModify(rows, [("actions", f"UPDATE action_details SET tag_id={tag} WHERE pid IN ({{ids}})")],
+                                 [TransactionType.Action])
+
+    def changePeerRows(self, rows, peer_id):
+        return self._batchModify(rows, [("actions", f"UPDATE actions SET peer_id={int(peer_id)} "
+                                                    f"WHERE id IN ({{ids}})")], [TransactionType.Action])
 
 
 class ColoredAmountsDelegate(QStyledItemDelegate):
@@ -0,0 +1,177 @@
+from datetime import datetime, timezone
+import numpy as np
+from jal.constants import BookAccount, TransactionType
+from jal.db.helpers import executeSQL, readSQLrecord
+
+DAY_SECONDS = 86400
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Returns numpy array of UTC day start timestamps for all days of [begin, end] interval
+def day_starts(begin, end):
+    first = int(datetime.utcfromtimestamp(begin).replace(hour=0, minute=0, second=0, tzinfo=timezone.utc).timestamp())
+    return np.arange(first, max(end, first) + 1, DAY_SECONDS, dtype=np.int64)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Returns matrix [len(timestamps) x len(asset_ids)] of quotes that were effective at given timestamps - every
+# quote is forward-filled until the next one. Values are NaN before the first known quote of an asset.
+# Quotes are loaded with one query so the function may be used to build a chart of several assets.
+def quote_matrix(asset_ids, timestamps, db=None):
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    matrix = np.full((len(timestamps), len(asset_ids)), np.nan)
+    if not len(asset_ids) or not len(timestamps):
+        return matrix
+    columns = {int(asset_id): i for i, asset_id in enumerate(asset_ids)}
+    history = {asset_id: ([], []) for asset_id in columns}
+    query = executeSQL(f"SELECT asset_id, timestamp, quote FROM quotes "
+                       f"WHERE asset_id IN ({','.join([str(x) for x in columns])}) AND timestamp<=:until "
+                       f"AND quote IS NOT NULL ORDER BY asset_id, timestamp, id",
+                       [(":until", int(timestamps.max()))], db=db)
+    if query is None:
+        return matrix
+    while query.next():
+        asset_id, timestamp, quote = readSQLrecord(query)
+        history[asset_id][0].append(timestamp)
+        history[asset_id][1].append(quote)
+    for asset_id, (quote_ts, quotes) in history.items():
+        if not quote_ts:
+            continue
+        idx = np.searchsorted(np.array(quote_ts, dtype=np.int64), timestamps, side='right') - 1
+        matrix[:, columns[asset_id]] = np.where(idx >= 0, np.array(quotes, dtype=np.float64)[np.maximum(idx, 0)],
+                                                np.nan)
+    return matrix
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Calculates daily net asset value and performance of a portfolio of accounts in given currency.
+# Positions of every account (money, liabilities and assets) are accumulated from ledger records as cumulative sums
+# of daily deltas, then multiplied by forward-filled quotes of assets and by cross-rate of account currency.
+# Transfers into/out of accounts are external flows of the portfolio, transfer fees are costs and not flows.
+# Flows are assumed to happen at the start of the day so daily return is: nav[t] / (nav[t-1] + flow[t]) - 1
+# Calculation may be done with read-only connection 'db'.
+class PortfolioPerformance:
+    def __init__(self, accounts, currency_id, db=None):
+        self._accounts = [int(x) for x in accounts]
+        self._currency_id = currency_id
+        self._db = db
+
+    # Returns dictionary of numpy arrays with a value for every day of [begin, end] interval:
+    # day - day start timestamp, nav - portfolio value at the day end, flow - external flows of the day,
+    # return - daily time-weighted return, twr - cumulative time-weighted return since the first day
+    def calculate(self, begin, end):
+        days = day_starts(begin, end)
+        day_ends = days + DAY_SECONDS
+        result = {'day': days, 'nav': np.zeros(len(days)), 'flow': np.zeros(len(days)),
+                  'return': np.zeros(len(days)), 'twr': np.zeros(len(days))}
+        if not self._accounts or not len(days):
+            return result
+        op_type, account, timestamp, book, asset, amount = self._ledger(int(day_ends[-1]))
+        if not len(account):
+            return result
+        day_idx = np.searchsorted(day_ends, timestamp, side='right')   # records before 'begin' go into the first day
+        account_rates = self._account_rates(day_ends)
+        account_column = {account_id: i for i, account_id in enumerate(self._accounts)}
+
+        # Every position is a unique (account, asset, is_asset) combination: money and liabilities are valued at 1
+        holdings = (book == BookAccount.Money) | (book == BookAccount.Liabilities) | (book == BookAccount.Assets)
+        keys = np.stack([account, asset, (book == BookAccount.Assets).astype(np.int64)], axis=1)[holdings]
+        if len(keys):
+            positions, position_idx = np.unique(keys, axis=0, return_inverse=True)
+            deltas = np.zeros((len(days), len(positions)))
+            np.add.at(deltas, (day_idx[holdings], position_idx.reshape(-1)), amount[holdings])
+            quantities = np.cumsum(deltas, axis=0)
+            prices = np.ones((len(days), len(positions)))
+            assets = np.unique(positions[positions[:, 2] == 1][:, 1])
+            quotes = quote_matrix(assets, day_ends, db=self._db)
+            for i, asset_id in enumerate(assets):
+                prices[:, (positions[:, 2] == 1) & (positions[:, 1] == asset_id)] = quotes[:, [i]]
+            prices *= account_rates[:, [account_column[x] for x in positions[:, 0]]]
+            result['nav'] = np.nansum(quantities * prices, axis=1)   # Positions without quotes are ignored
+
+        # Transfers book keeps amount in account currency with sign opposite to money movement.
+        # Fee leg of a transfer is booked to both Transfers and Costs (see Ledger.processTransfer()) - the Costs
+        # record of transfer operation compensates its Transfers record as fee isn't an external flow
+        fees = (book == BookAccount.Costs) & (op_type == TransactionType.Transfer)
+        transfers = ((book == BookAccount.Transfers) | fees) & (timestamp >= days[0])
+        if transfers.any():
+            rates = account_rates[day_idx[transfers], [account_column[x] for x in account[transfers]]]
+            flows = np.where(fees[transfers], amount[transfers], -amount[transfers])
+            result['flow'] = np.bincount(day_idx[transfers], weights=flows * np.nan_to_num(rates), minlength=len(days))
+        result['return'], result['twr'] = time_weighted_return(result['nav'], result['flow'])
+        return result
+
+    # Returns numpy arrays with operation type, account, timestamp, book, asset and amount of ledger records
+    # before 'until'
+    def _ledger(self, until):
+        rows = []
+        query = executeSQL(f"SELECT op_type, account_id, timestamp, book_account, asset_id, amount FROM ledger "
+                           f"WHERE account_id IN ({','.join([str(x) for x in self._accounts])}) "
+                           f"AND timestamp<:until ORDER BY timestamp, id", [(":until", until)], db=self._db)
+        if query is not None:
+            while query.next():
+                rows.append(readSQLrecord(query))
+        return tuple([np.array([x[i] for x in rows], dtype=np.int64) for i in range(5)] +
+                     [np.array([x[5] for x in rows], dtype=np.float64)])
+
+    # Returns matrix [len(timestamps) x len(accounts)] of rates that convert account currency into portfolio currency.
+    # All quotes of currencies are given against the same base currency so cross-rate is a ratio of two quotes
+    def _account_rates(self, timestamps):
+        currencies = []
+        query = executeSQL(f"SELECT id, currency_id FROM accounts "
+                           f"WHERE id IN ({','.join([str(x) for x in self._accounts])})", db=self._db)
+        if query is not None:
+            while query.next():
+                currencies.append(readSQLrecord(query))
+        currencies = dict(currencies)
+        currency_ids = sorted(set(currencies.values()) | {self._currency_id})
+        quotes = quote_matrix(currency_ids, timestamps, db=self._db)
+        rates = np.ones((len(timestamps), len(self._accounts)))
+        for i, account_id in enumerate(self._accounts):
+            currency_id = currencies.get(account_id, self._currency_id)
+            if currency_id != self._currency_id:
+                rates[:, i] = quotes[:, currency_ids.index(currency_id)] / \
+                              quotes[:, currency_ids.index(self._currency_id)]
+        return rates
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Returns arrays of daily and cumulative time-weighted returns for daily 'nav' series and external 'flows'
+# (flows happen at the start of a day). The first day is a starting point of the period so its return is 0,
+# return of a day is also 0 if there was no invested capital at its start.
+def time_weighted_return(nav, flows):
+    capital = np.concatenate([[0.0], nav[:-1]]) + flows
+    capital[0] = 0.0
+    daily = np.zeros(len(nav))
+    np.divide(nav, capital, out=daily, where=capital > 0)
+    daily = np.where(capital > 0, daily - 1.0, 0.0)
+    return daily, np.cumprod(1.0 + daily) - 1.0
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Returns annualized money-weighted return (internal rate of return) for daily 'nav' series and external 'flows'.
+# Value at the end of the first day is taken as initial investment and value at the end of the last day as final
+# withdrawal. The rate is found by Newton's method with NPV and its derivative evaluated for all flows at once.
+# Returns None if rate can't be found
+def money_weighted_return(days, nav, flows, iterations=50):
+    if len(days) < 2:
+        return None
+    days = np.asarray(days, dtype=np.float64)
+    # Cash flows from investor point of view: investments are negative, withdrawals are positive
+    cash = np.concatenate([[-nav[0]], -np.asarray(flows[1:], dtype=np.float64), [nav[-1]]])
+    moments = np.concatenate([[days[0] + DAY_SECONDS], days[1:], [days[-1] + DAY_SECONDS]])
+    years = (moments - moments[0]) / (365.0 * DAY_SECONDS)
+    if not (cash < 0).any() or not (cash > 0).any():
+        return None
+    rate = 0.1
+    for _ in range(iterations):
+        discount = (1.0 + rate) ** -years
+        npv = np.sum(cash * discount)
+        derivative = np.sum(-years * cash * discount / (1.0 + rate))
+        if derivative == 0:
+            return None
+        step = npv / derivative
+        rate = max(rate - step, -0.9999)
+        if abs(step) < 1e-10:
+            return float(rate)
+    return None
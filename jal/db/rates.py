@@ -0,0 +1,64 @@
+from threading import Lock
+import numpy as np
+from jal.db.helpers import executeSQL, readSQL, readSQLrecord
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Provides exchange rates (or any other quotes) that were effective at given moment of time.
+# History of every asset is loaded once into sorted numpy arrays and lookups are done with binary search.
+# Loaded histories are shared between all class instances (i.e. between all reports) and are validated once per
+# instance with a light-weight signature query - so any modification of quotes table is picked up by next report.
+# Instances don't keep any state in database so they may be used in parallel by reports in different threads.
+class ExchangeRates:
+    _history = {}   # asset_id -> (signature, timestamps array, quotes array)
+    _lock = Lock()
+
+    def __init__(self):
+        self._validated = set()
+
+    def _signature(self, asset_id):
+        return readSQL("SELECT COUNT(id), MAX(id), TOTAL(timestamp), TOTAL(quote) FROM quotes WHERE asset_id=:asset_id",
+                       [(":asset_id", asset_id)])
+
+    def _load(self, asset_id):
+        if asset_id in self._validated:
+            return self._history[asset_id]
+        signature = self._signature(asset_id)
+        with self._lock:
+            if asset_id in self._history and self._history[asset_id][0] == signature:
+                self._validated.add(asset_id)
+                return self._history[asset_id]
+        timestamps = []
+        quotes = []
+        query = executeSQL("SELECT timestamp, quote FROM quotes WHERE asset_id=:asset_id ORDER BY timestamp, id",
+                           [(":asset_id", asset_id)])
+        while query.next():
+            timestamp, quote = readSQLrecord(query)
+            timestamps.append(timestamp)
+            quotes.append(np.nan if quote is None or quote == '' else quote)
+        with self._lock:
+            self._history[asset_id] = (signature, np.array(timestamps, dtype=np.int64),
+                                       np.array(quotes, dtype=np.float64))
+        self._validated.add(asset_id)
+        return self._history[asset_id]
+
+    # Returns list of rates of asset_id that were effective at given timestamps (None if there is no rate)
+    def rates(self, asset_id, timestamps):
+        _signature, history_timestamps, history_quotes = self._load(asset_id)
+        if not len(timestamps):
+            return []
+        timestamps = np.array([x if x else 0 for x in timestamps], dtype=np.int64)
+        idx = np.searchsorted(history_timestamps, timestamps, side='right') - 1
+        rates = np.where(idx >= 0, history_quotes[np.maximum(idx, 0)] if history_quotes.size else np.nan, np.nan)
+        return [None if np.isnan(x) else float(x) for x in rates]
+
+    # Returns rate of asset_id that was effective at given timestamp (None if there is no rate)
+    def rate(self, asset_id, timestamp):
+        return self.rates(asset_id, [timestamp])[0]
+
+    # Returns the latest known rate of asset_id (None if there is no rate)
+    def last(self, asset_id):
+        _signature, history_timestamps, history_quotes = self._load(asset_id)
+        if not history_quotes.size or np.isnan(history_quotes[-1]):
+            return None
+        return float(history_quotes[-1])
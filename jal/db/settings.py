@@ -1,6 +1,7 @@
 import logging
 from PySide6.QtSql import QSqlDatabase, QSqlQuery
 from jal.constants import Setup
+from jal.db.cache import reference_cache, ReferenceCache
 
 
 class JalSettings:
@@ -16,19 +17,7 @@ class JalSettings:
             return
 
     def getValue(self, key, default=None):
-        get_query = QSqlQuery(self.db)
-        get_query.setForwardOnly(True)
-        get_query.prepare("SELECT value FROM settings WHERE name=:key")
-
-        value = default
-        get_query.bindValue(":key", key)
-        if not get_query.exec():
-            if not default:
-                logging.fatal(f"Failed to get settings for key='{key}'")
-            return value
-        if get_query.next():
-            value = get_query.value(0)
-        return value
+        return reference_cache().value(ReferenceCache.SETTINGS, key, 'value', default)
 
     def setValue(self, key, value):
         set_query = QSqlQuery(self.db)
@@ -39,3 +28,4 @@ class JalSettings:
         if not set_query.exec():
             logging.fatal(f"Failed to set settings key='{key}' to value='{value}'")
         self.db.commit()
+        reference_cache().invalidate(ReferenceCache.SETTINGS)
@@ -3,8 +3,9 @@ import logging
 import pandas as pd
 from PySide6.QtCore import Qt, QAbstractTableModel
 from PySide6.QtGui import QFont
-from jal.db.helpers import executeSQL, readSQL, readSQLrecord
+from jal.db.helpers import executeSQL, readSQLrecord
 from jal.db.db import JalDB
+from jal.db.rates import ExchangeRates
 from jal.ui.reports.ui_tax_estimation import Ui_TaxEstimationDialog
 from jal.widgets.mdi import MdiWidget
 
@@ -87,63 +88,42 @@ class TaxEstimator(MdiWidget, Ui_TaxEstimationDialog):
         self.ready = True
 
     def prepare_tax(self):
-        _ = executeSQL("DELETE FROM t_last_dates")
-        _ = executeSQL("DELETE FROM t_last_quotes")
-
-        _ = executeSQL("INSERT INTO t_last_dates(ref_id, timestamp) "
-                       "SELECT ref_id, coalesce(MAX(q.timestamp), 0) AS timestamp "
-                       "FROM ("
-                       "SELECT t.timestamp AS ref_id FROM trades AS t "
-                       "WHERE t.account_id=:account_id AND t.asset_id=:asset_id "
-                       "UNION "
-                       "SELECT t.settlement AS ref_id FROM trades AS t "
-                       "WHERE t.account_id=:account_id AND t.asset_id=:asset_id "
-                       ") LEFT JOIN accounts AS a ON a.id = :account_id "
-                       "LEFT JOIN quotes AS q ON ref_id >= q.timestamp AND a.currency_id=q.asset_id "
-                       "WHERE ref_id IS NOT NULL "
-                       "GROUP BY ref_id ORDER BY ref_id",
-                       [(":account_id", self.account_id), (":asset_id", self.asset_id)])
-        _ = executeSQL("INSERT INTO t_last_quotes(timestamp, asset_id, quote) "
-                       "SELECT MAX(timestamp) AS timestamp, asset_id, quote "
-                       "FROM quotes AS q LEFT JOIN accounts AS a ON a.id = :account_id "
-                       "WHERE q.asset_id = :asset_id OR q.asset_id = a.currency_id "
-                       "GROUP BY asset_id",
-                       [(":account_id", self.account_id), (":asset_id", self.asset_id)])
-
-        self.quote = readSQL("SELECT quote FROM t_last_quotes WHERE asset_id=:asset_id",
-                             [(":asset_id", self.asset_id)])
+        rates = ExchangeRates()
+        self.quote = rates.last(self.asset_id)
         if self.quote is None:
             logging.error(self.tr("Can't get current quote for ") + self.asset_name)
             return
-        self.currency_name = JalDB().get_asset_name(JalDB().get_account_currency(self.account_id))
+        currency_id = JalDB().get_account_currency(self.account_id)
+        self.currency_name = JalDB().get_asset_name(currency_id)
 
-        self.rate = readSQL("SELECT quote FROM accounts AS a "
-                            "LEFT JOIN t_last_quotes AS q ON q.asset_id=a.currency_id WHERE id=:account_id",
-                            [(":account_id", self.account_id)])
+        self.rate = rates.last(currency_id)
         if self.rate is None:
             logging.error(self.tr("Can't get current rate for ") + self.currency_name)
             return
 
         query = executeSQL("SELECT strftime('%d/%m/%Y', datetime(t.timestamp, 'unixepoch')) AS timestamp, "
-                           "t.qty AS qty, t.price AS o_price, oq.quote AS o_rate FROM trades AS t "
-                           "LEFT JOIN accounts AS ac ON ac.id = :account_id "
-                           "LEFT JOIN t_last_dates AS od ON od.ref_id = IIF(t.settlement=0, t.timestamp, t.settlement) "
-                           "LEFT JOIN quotes AS oq ON ac.currency_id=oq.asset_id AND oq.timestamp=od.timestamp "
+                           "t.qty AS qty, t.price AS o_price, IIF(t.settlement=0, t.timestamp, t.settlement) AS o_date "
+                           "FROM trades AS t "
                            "WHERE t.account_id=:account_id AND t.asset_id=:asset_id AND t.qty*(:total_qty)>0 "
                            "ORDER BY t.timestamp DESC, t.id DESC",
                            [(":account_id", self.account_id), (":asset_id", self.asset_id),
                             (":total_qty", self.asset_qty)])
+        trades = []
+        while query.next():
+            trades.append(readSQLrecord(query, named=True))
+        for trade, rate in zip(trades, rates.rates(currency_id, [x['o_date'] for x in trades])):
+            trade['o_rate'] = rate
+            del trade['o_date']
         table = []
         remainder = self.asset_qty
         profit = 0
         value = 0
         profit_rub = 0
         value_rub = 0
-        while query.next():
-            record = readSQLrecord(query, named=True)
+        for record in trades:
             record['qty'] = record['qty'] if record['qty'] <= remainder else remainder
             record['profit'] = record['qty'] * (self.quote - record['o_price'])
-            record['o_rate'] = 1 if record['o_rate'] == '' else record['o_rate']
+            record['o_rate'] = 1 if record['o_rate'] is None else record['o_rate']
             record['profit_rub'] = record['qty'] * (self.quote * self.rate - record['o_price'] * record['o_rate'])
             record['tax'] = 0.13 * record['profit_rub'] if record['profit_rub'] > 0 else 0
             table.append(record)
@@ -0,0 +1,158 @@
+from datetime import datetime, timezone
+import numpy as np
+from jal.constants import BookAccount, PredefinedCategory
+from jal.db.helpers import db_connection, executeSQL, readSQL, readSQLrecord
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Returns list of UTC month start timestamps beginning from the month of 'begin' and up to the first month that
+# starts at or after 'end'
+def month_starts(begin, end):
+    begin_date = datetime.utcfromtimestamp(begin)
+    year, month = begin_date.year, begin_date.month
+    months = []
+    while True:
+        month_start = int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+        months.append(month_start)
+        if month_start >= end:
+            break
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Returns UTC timestamp of the month start that follows the month of given timestamp
+def next_month_start(timestamp):
+    date = datetime.utcfromtimestamp(timestamp)
+    year, month = (date.year + 1, 1) if date.month == 12 else (date.year, date.month + 1)
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Returns version of cached valuation - it is changed every time when cached series are dropped
+def valuation_version(db=None):
+    return readSQL("SELECT value FROM settings WHERE name='ValuationVersion'", db=db)
+
+
+# Drops cached series of all accounts starting from the month of given timestamp
+def invalidate_valuation(timestamp):
+    _ = executeSQL("DELETE FROM valuation_series WHERE period >= "
+                   "CAST(strftime('%s', date(:timestamp, 'unixepoch', 'start of month')) AS INTEGER)",
+                   [(":timestamp", timestamp)])
+    _ = executeSQL("UPDATE settings SET value=value+1 WHERE name='ValuationVersion'")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Calculates monthly series of account valuation and cash flows and keeps it in 'valuation_series' table.
+# For every month start 'period' the series contains:
+#   assets - value of all money and assets of the account at the period start (using last known quotes)
+#   transfer, result, profit, dividend, tax_fee - flows that happened during the month
+# Cached rows are removed by ledger re-build and by quotes modification (via triggers) so every row that present
+# in the table is valid and only missing months are calculated.
+# Series may be calculated with read-only connection 'db' but they are always stored with the main connection.
+# Such series are stored only if valuation_version() wasn't changed since calculation start as data might be modified
+# (and cached series dropped) while connection 'db' was reading older snapshot.
+class AccountValuation:
+    def __init__(self, account_id, db=None):
+        self._account_id = account_id
+        self._db = db
+
+    # Makes sure that series is present in 'valuation_series' for all months of [begin, end] interval
+    # Returns list of month start timestamps that cover the interval
+    def update(self, begin, end):
+        months = month_starts(begin, end)
+        if not self.cached(months):
+            self.store(months, self.calculate(months))
+        return months
+
+    # Returns True if series is present in 'valuation_series' for all given months
+    def cached(self, months):
+        count = readSQL("SELECT COUNT(period) FROM valuation_series "
+                        "WHERE account_id=:account_id AND period>=:first AND period<=:last",
+                        [(":account_id", self._account_id), (":first", months[0]), (":last", months[-1])],
+                        db=self._db)
+        return count == len(months)
+
+    # Returns numpy array with series rows: [period, transfer, assets, result, profit, dividend, tax_fee]
+    def calculate(self, months):
+        months = np.array(months, dtype=np.int64)
+        until = next_month_start(int(months[-1]))
+        rows = []
+        query = executeSQL("SELECT timestamp, book_account, asset_id, amount, coalesce(category_id, 0) FROM ledger "
+                           "WHERE account_id=:account_id AND timestamp<:until ORDER BY timestamp, id",
+                           [(":account_id", self._account_id), (":until", until)], db=self._db)
+        while query.next():
+            rows.append(readSQLrecord(query))
+        series = np.zeros((len(months), 7))
+        series[:, 0] = months
+        if not rows:
+            return series
+        timestamp = np.array([x[0] for x in rows], dtype=np.int64)
+        book = np.array([x[1] for x in rows], dtype=np.int64)
+        asset = np.array([x[2] for x in rows], dtype=np.int64)
+        amount = np.array([x[3] for x in rows], dtype=np.float64)
+        category = np.array([x[4] for x in rows], dtype=np.int64)
+
+        series[:, 2] = self._assets_value(months, timestamp, book, asset, amount)
+
+        # Flows are aggregated by month index of every ledger record
+        month_idx = np.searchsorted(months, timestamp, side='right') - 1
+        in_range = month_idx >= 0
+        pnl = in_range & ((book == BookAccount.Costs) | (book == BookAccount.Incomes))
+        returns = (category == PredefinedCategory.Dividends) | (category == PredefinedCategory.Interest)
+        flows = [
+            (1, in_range & (book == BookAccount.Transfers)),
+            (3, pnl),
+            (4, pnl & (category == PredefinedCategory.Profit)),
+            (5, pnl & returns),
+            (6, in_range & (book == BookAccount.Costs) & (category != 0) & ~returns)
+        ]
+        for column, mask in flows:
+            series[:, column] = np.bincount(month_idx[mask], weights=-amount[mask], minlength=len(months))
+        return series
+
+    # Returns value of money and assets at every month start. Asset amounts are taken as cumulative sum of ledger
+    # records and multiplied by the last quote that is known at the moment of month start
+    def _assets_value(self, months, timestamp, book, asset, amount):
+        value = np.zeros(len(months))
+        holdings = (book == BookAccount.Money) | (book == BookAccount.Assets)
+        for asset_id in np.unique(asset[holdings]):
+            mask = holdings & (asset == asset_id)
+            idx = np.searchsorted(timestamp[mask], months, side='right') - 1
+            qty = np.where(idx >= 0, np.cumsum(amount[mask])[np.maximum(idx, 0)], 0)
+            quote_ts, quotes = self._quotes(int(asset_id), int(months[-1]))
+            if not quote_ts.size:
+                continue
+            q_idx = np.searchsorted(quote_ts, months, side='right') - 1
+            value += np.where(q_idx >= 0, qty * quotes[np.maximum(q_idx, 0)], 0)
+        return value
+
+    # Returns sorted numpy arrays of quote timestamps and values for given asset up to given timestamp
+    def _quotes(self, asset_id, until):
+        quotes = []
+        query = executeSQL("SELECT timestamp, quote FROM quotes "
+                           "WHERE asset_id=:asset_id AND timestamp<=:until AND quote IS NOT NULL ORDER BY timestamp",
+                           [(":asset_id", asset_id), (":until", until)], db=self._db)
+        while query.next():
+            quotes.append(readSQLrecord(query))
+        return np.array([x[0] for x in quotes], dtype=np.int64), np.array([x[1] for x in quotes], dtype=np.float64)
+
+    # Puts series into 'valuation_series'. If 'version' is given it should be a value of valuation_version() that was
+    # taken before calculation start - series isn't stored if cached data were dropped after that.
+    # Returns True if series was stored
+    def store(self, months, series, version=None):
+        if version is not None and version != valuation_version():
+            return False
+        db = db_connection()
+        db.transaction()
+        _ = executeSQL("DELETE FROM valuation_series WHERE account_id=:account_id AND period>=:first AND period<=:last",
+                       [(":account_id", self._account_id), (":first", months[0]), (":last", months[-1])])
+        for row in series:
+            _ = executeSQL("INSERT INTO valuation_series (account_id, period, transfer, assets, result, profit, "
+                           "dividend, tax_fee) "
+                           "VALUES (:account_id, :period, :transfer, :assets, :result, :profit, :dividend, :tax_fee)",
+                           [(":account_id", self._account_id), (":period", int(row[0])), (":transfer", float(row[1])),
+                            (":assets", float(row[2])), (":result", float(row[3])), (":profit", float(row[4])),
+                            (":dividend", float(row[5])), (":tax_fee", float(row[6]))])
+        db.commit()
+        return True
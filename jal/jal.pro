@@ -1,3 +1,3 @@
-SOURCES = ./jal.py ./widgets/delegates.py ./widgets/qr_scanner.py ./widgets/dividend_widget.py ./widgets/log_viewer.py ./widgets/mdi.py ./widgets/income_spending_widget.py ./widgets/reference_data.py ./widgets/tax_widget.py ./widgets/date_range_selector.py ./widgets/helpers.py ./widgets/__init__.py ./widgets/abstract_operation_details.py ./widgets/operations_widget.py ./widgets/corporate_action_widget.py ./widgets/reference_dialogs.py ./widgets/price_chart.py ./widgets/account_select.py ./widgets/trade_widget.py ./widgets/transfer_widget.py ./widgets/main_window.py ./widgets/reference_selector.py ./db/ledger.py ./db/settings.py ./db/tax_estimator.py ./db/backup_restore.py ./db/helpers.py ./db/__init__.py ./db/db.py ./db/balances_model.py ./db/operations_model.py ./db/holdings_model.py ./constants.py ./__init__.py ./updates/__init__.py ./data_export/templates/__init__.py ./data_export/taxes.py ./data_export/__init__.py ./data_export/dlsg.py ./data_export/xlsx.py ./net/helpers.py ./net/__init__.py ./net/downloader.py ./reports/deals.py ./reports/profit_loss.py ./reports/category.py ./reports/__init__.py ./reports/income_spending.py ./reports/reports.py ./reports/holdings.py ./data_import/broker_statements/ibkr.py ./data_import/broker_statements/__init__.py ./data_import/broker_statements/ibkr_html_old.py ./data_import/broker_statements/psb.py ./data_import/broker_statements/uralsib.py ./data_import/broker_statements/kit.py ./data_import/broker_statements/openbroker.py ./data_import/broker_statements/quik_html_old.py ./data_import/statements.py ./data_import/statement_xml.py ./data_import/statement.py ./data_import/__init__.py ./data_import/category_recognizer.py ./data_import/statement_xls.py ./data_import/slips_tax.py ./data_import/slips.py
+SOURCES = ./jal.py ./plugins.py ./profiling.py ./widgets/delegates.py ./widgets/qr_scanner.py ./widgets/dividend_widget.py ./widgets/log_viewer.py ./widgets/mdi.py ./widgets/income_spending_widget.py ./widgets/reference_data.py ./widgets/tax_widget.py ./widgets/date_range_selector.py ./widgets/helpers.py ./widgets/__init__.py ./widgets/abstract_operation_details.py ./widgets/operations_widget.py ./widgets/corporate_action_widget.py ./widgets/reference_dialogs.py ./widgets/price_chart.py ./widgets/account_select.py ./widgets/trade_widget.py ./widgets/transfer_widget.py ./widgets/main_window.py ./widgets/reference_selector.py ./db/ledger.py ./db/settings.py ./db/tax_estimator.py ./db/backup_restore.py ./db/helpers.py ./db/__init__.py ./db/db.py ./db/balances_model.py ./db/operations_model.py ./db/holdings_model.py ./constants.py ./__init__.py ./updates/__init__.py ./data_export/templates/__init__.py ./data_export/taxes.py ./data_export/__init__.py ./data_export/dlsg.py ./data_export/xlsx.py ./net/helpers.py ./net/__init__.py ./net/downloader.py ./reports/deals.py ./reports/profit_loss.py ./reports/category.py ./reports/__init__.py ./reports/income_spending.py ./reports/reports.py ./reports/holdings.py ./data_import/broker_statements/ibkr.py ./data_import/broker_statements/__init__.py ./data_import/broker_statements/ibkr_html_old.py ./data_import/broker_statements/psb.py ./data_import/broker_statements/uralsib.py ./data_import/broker_statements/kit.py ./data_import/broker_statements/openbroker.py ./data_import/broker_statements/quik_html_old.py ./data_import/statements.py ./data_import/statement_xml.py ./data_import/statement.py ./data_import/__init__.py ./data_import/category_recognizer.py ./data_import/statement_xls.py ./data_import/slips_tax.py ./data_import/slips.py
 FORMS = ./ui/slip_import_dlg.ui ./ui/rebuild_window.ui ./ui/quotes_update.ui ./ui/reference_data_dlg.ui ./ui/reports/income_spending_report.ui ./ui/reports/holdings_report.ui ./ui/reports/category_report.ui ./ui/reports/tax_estimation.ui ./ui/reports/deals_report.ui ./ui/reports/profit_loss_report.ui ./ui/select_account_dlg.ui ./ui/main_window.ui ./ui/operations_widget.ui ./ui/tax_export_widget.ui ./ui/login_fns_dlg.ui ./ui/add_asset_dlg.ui
 TRANSLATIONS = languages/en.ts languages/ru.ts
@@ -1,8 +1,14 @@
-import sys
+import time
+start_time = time.perf_counter()    # Is used to measure application start-up time
 import os
+from jal.profiling import ImportProfiler
+import_profiler = ImportProfiler()
+if os.environ.get('JAL_PROFILE_IMPORTS'):    # Set JAL_PROFILE_IMPORTS=1 to get import time breakdown in the log
+    import_profiler.start()
+import sys
 import logging
 import traceback
-from PySide6.QtCore import Qt, QTranslator
+from PySide6.QtCore import Qt, QTranslator, QTimer
 from PySide6.QtWidgets import QApplication, QMessageBox
 from jal.constants import Setup
 from jal.widgets.main_window import MainWindow
@@ -18,6 +24,19 @@ def exception_logger(exctype, value, tb):
     sys.__excepthook__(exctype, value, tb)
 
 
+#-----------------------------------------------------------------------------------------------------------------------
+# Is called from event loop when main window is displayed
+def log_startup_time():
+    startup_time = time.perf_counter() - start_time
+    if startup_time > Setup.STARTUP_TIME_TARGET:
+        logging.warning(f"Start-up took {startup_time:.2f}s that is more than {Setup.STARTUP_TIME_TARGET:.2f}s target")
+    else:
+        logging.info(f"Start-up took {startup_time:.2f}s")
+    if import_profiler.timings:
+        import_profiler.stop()
+        import_profiler.log()
+
+
 #-----------------------------------------------------------------------------------------------------------------------
 def main():
     sys.excepthook = exception_logger
@@ -50,6 +69,7 @@ def main():
     else:
         window = MainWindow(language)
     window.show()
+    QTimer.singleShot(0, log_startup_time)
 
     app.exec()
     app.removeTranslator(translator)
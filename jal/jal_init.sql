@@ -67,6 +67,9 @@ CREATE TABLE action_details (
     note        TEXT (256) 
 );
 
+DROP INDEX IF EXISTS action_details_by_pid;
+CREATE INDEX action_details_by_pid ON action_details (pid);
+
 
 -- Table: actions
 DROP TABLE IF EXISTS actions;
@@ -88,6 +91,9 @@ CREATE TABLE actions (
                                                    ON UPDATE CASCADE
 );
 
+DROP INDEX IF EXISTS actions_by_timestamp;
+CREATE INDEX actions_by_timestamp ON actions (timestamp);
+
 -- Table: asset_types
 DROP TABLE IF EXISTS asset_types;
 
@@ -144,6 +150,22 @@ CREATE TABLE asset_reg_id (
     reg_code VARCHAR (20) NOT NULL
 );
 
+-- Table: asset_moex_id
+DROP TABLE IF EXISTS asset_moex_id;
+
+CREATE TABLE asset_moex_id (
+    asset_id  INTEGER      PRIMARY KEY
+                           UNIQUE
+                           NOT NULL
+                           REFERENCES assets (id) ON DELETE CASCADE
+                                                  ON UPDATE CASCADE,
+    secid     VARCHAR (20) NOT NULL,
+    engine    VARCHAR (20) NOT NULL,
+    market    VARCHAR (20) NOT NULL,
+    board     VARCHAR (20) NOT NULL,
+    timestamp INTEGER      NOT NULL
+);
+
 -- Table: agents
 DROP TABLE IF EXISTS agents;
 
@@ -239,6 +261,9 @@ CREATE TABLE dividends (
     note       TEXT (1024)
 );
 
+DROP INDEX IF EXISTS dividends_by_timestamp;
+CREATE INDEX dividends_by_timestamp ON dividends (timestamp);
+
 
 -- Table: languages
 DROP TABLE IF EXISTS languages;
@@ -365,6 +390,9 @@ CREATE TABLE quotes (
     quote     REAL
 );
 
+DROP INDEX IF EXISTS quotes_by_asset_timestamp;
+CREATE INDEX quotes_by_asset_timestamp ON quotes (asset_id, timestamp);
+
 
 -- Table: settings
 DROP TABLE IF EXISTS settings;
@@ -379,34 +407,6 @@ CREATE TABLE settings (
 );
 
 
--- Table: t_last_assets
-DROP TABLE IF EXISTS t_last_assets;
-
-CREATE TABLE t_last_assets (
-    id          INTEGER   NOT NULL,
-    total_value REAL
-);
-
-
--- Table: t_last_dates
-DROP TABLE IF EXISTS t_last_dates;
-
-CREATE TABLE t_last_dates (
-    ref_id INTEGER NOT NULL,
-    timestamp  INTEGER NOT NULL
-);
-
-
--- Table: t_last_quotes
-DROP TABLE IF EXISTS t_last_quotes;
-
-CREATE TABLE t_last_quotes (
-    timestamp INTEGER NOT NULL,
-    asset_id INTEGER NOT NULL,
-    quote     REAL
-);
-
-
 -- Table: tags
 DROP TABLE IF EXISTS tags;
 
@@ -446,6 +446,9 @@ CREATE TABLE corp_actions (
     note         TEXT (1024)
 );
 
+DROP INDEX IF EXISTS corp_actions_by_timestamp;
+CREATE INDEX corp_actions_by_timestamp ON corp_actions (timestamp);
+
 
 -- Table: trades
 DROP TABLE IF EXISTS trades;
@@ -473,6 +476,9 @@ CREATE TABLE trades (
     note       TEXT (1024)
 );
 
+DROP INDEX IF EXISTS trades_by_timestamp;
+CREATE INDEX trades_by_timestamp ON trades (timestamp);
+
 
 -- Table: deals
 DROP TABLE IF EXISTS deals;
@@ -491,9 +497,21 @@ CREATE TABLE deals (
     close_op_id     INTEGER NOT NULL,
     close_timestamp INTEGER NOT NULL,
     close_price     REAL    NOT NULL,
-    qty             REAL    NOT NULL
+    qty             REAL    NOT NULL,
+    open_fee        REAL    NOT NULL
+                            DEFAULT (0),
+    close_fee       REAL    NOT NULL
+                            DEFAULT (0),
+    profit          REAL    NOT NULL
+                            DEFAULT (0),
+    rel_profit      REAL    NOT NULL
+                            DEFAULT (0),
+    corp_action     INTEGER
 );
 
+DROP INDEX IF EXISTS deals_by_account_close;
+CREATE INDEX deals_by_account_close ON deals (account_id, close_timestamp);
+
 
 CREATE TRIGGER on_deal_delete
          AFTER DELETE
@@ -533,6 +551,35 @@ CREATE TABLE transfers (
     note                 TEXT (1024)
 );
 
+DROP INDEX IF EXISTS transfers_by_withdrawal;
+CREATE INDEX transfers_by_withdrawal ON transfers (withdrawal_timestamp);
+DROP INDEX IF EXISTS transfers_by_deposit;
+CREATE INDEX transfers_by_deposit ON transfers (deposit_timestamp);
+
+
+-- Table: valuation_series to cache monthly valuation of accounts (is cleaned by ledger rebuild and quotes update)
+DROP TABLE IF EXISTS valuation_series;
+CREATE TABLE valuation_series (
+    id         INTEGER PRIMARY KEY
+                       UNIQUE
+                       NOT NULL,
+    account_id INTEGER NOT NULL
+                       REFERENCES accounts (id) ON DELETE CASCADE
+                                                ON UPDATE CASCADE,
+    period     INTEGER NOT NULL,
+    transfer   REAL    NOT NULL,
+    assets     REAL    NOT NULL,
+    result     REAL    NOT NULL,
+    profit     REAL    NOT NULL,
+    dividend   REAL    NOT NULL,
+    tax_fee    REAL    NOT NULL
+);
+
+DROP INDEX IF EXISTS valuation_series_by_account_period;
+CREATE UNIQUE INDEX valuation_series_by_account_period ON valuation_series (account_id, period);
+DROP INDEX IF EXISTS valuation_series_by_period;
+CREATE INDEX valuation_series_by_period ON valuation_series (period);
+
 
 -- Index: agents_by_name_idx
 DROP INDEX IF EXISTS agents_by_name_idx;
@@ -886,19 +933,11 @@ CREATE VIEW deals_ext AS
            open_price,
            close_price,
            d.qty AS qty,
-           coalesce(ot.fee * abs(d.qty / ot.qty), 0) + coalesce(ct.fee * abs(d.qty / ct.qty), 0) AS fee,
-           d.qty * (close_price - open_price ) - (coalesce(ot.fee * abs(d.qty / ot.qty), 0) + coalesce(ct.fee * abs(d.qty / ct.qty), 0) ) AS profit,
-           coalesce(100 * (d.qty * (close_price - open_price ) - (coalesce(ot.fee * abs(d.qty / ot.qty), 0) + coalesce(ct.fee * abs(d.qty / ct.qty), 0) ) ) / abs(d.qty * open_price ), 0) AS rel_profit,
-           coalesce(oca.type, -cca.type) AS corp_action
+           d.open_fee + d.close_fee AS fee,
+           d.profit,
+           d.rel_profit,
+           d.corp_action
     FROM deals AS d
-          -- Get more information about trade/corp.action that opened the deal
-           LEFT JOIN trades AS ot ON ot.id=d.open_op_id AND ot.op_type=d.open_op_type
-           LEFT JOIN corp_actions AS oca ON oca.id=d.open_op_id AND oca.op_type=d.open_op_type
-          -- Collect value of stock that was accumulated before corporate action
-           LEFT JOIN ledger AS ols ON ols.op_type=d.open_op_type AND ols.operation_id=d.open_op_id AND ols.asset_id = d.asset_id AND ols.value_acc != 0
-          -- Get more information about trade/corp.action that opened the deal
-           LEFT JOIN trades AS ct ON ct.id=d.close_op_id AND ct.op_type=d.close_op_type
-           LEFT JOIN corp_actions AS cca ON cca.id=d.close_op_id AND cca.op_type=d.close_op_type
           -- "Decode" account and asset
            LEFT JOIN accounts AS ac ON d.account_id = ac.id
            LEFT JOIN assets AS at ON d.asset_id = at.id
@@ -1093,6 +1132,37 @@ BEGIN
                 timestamp >= NEW.withdrawal_timestamp OR timestamp >= NEW.deposit_timestamp;
 END;
 
+-- Triggers to drop cached valuation that depends on modified quotes (see valuation_version())
+DROP TRIGGER IF EXISTS quotes_after_delete;
+CREATE TRIGGER quotes_after_delete
+      AFTER DELETE ON quotes
+      FOR EACH ROW
+      WHEN (SELECT value FROM settings WHERE id = 1)
+BEGIN
+    DELETE FROM valuation_series WHERE period >= OLD.timestamp;
+    UPDATE settings SET value=value+1 WHERE name='ValuationVersion';
+END;
+
+DROP TRIGGER IF EXISTS quotes_after_insert;
+CREATE TRIGGER quotes_after_insert
+      AFTER INSERT ON quotes
+      FOR EACH ROW
+      WHEN (SELECT value FROM settings WHERE id = 1)
+BEGIN
+    DELETE FROM valuation_series WHERE period >= NEW.timestamp;
+    UPDATE settings SET value=value+1 WHERE name='ValuationVersion';
+END;
+
+DROP TRIGGER IF EXISTS quotes_after_update;
+CREATE TRIGGER quotes_after_update
+      AFTER UPDATE OF timestamp, asset_id, quote ON quotes
+      FOR EACH ROW
+      WHEN (SELECT value FROM settings WHERE id = 1)
+BEGIN
+    DELETE FROM valuation_series WHERE period >= OLD.timestamp OR period >= NEW.timestamp;
+    UPDATE settings SET value=value+1 WHERE name='ValuationVersion';
+END;
+
 DROP TRIGGER IF EXISTS validate_account_insert;
 CREATE TRIGGER validate_account_insert BEFORE INSERT ON accounts
     FOR EACH ROW
@@ -1118,7 +1188,7 @@ END;
 
 
 -- Initialize default values for settings
-INSERT INTO settings(id, name, value) VALUES (0, 'SchemaVersion', 31);
+INSERT INTO settings(id, name, value) VALUES (0, 'SchemaVersion', 38);
 INSERT INTO settings(id, name, value) VALUES (1, 'TriggersEnabled', 1);
 INSERT INTO settings(id, name, value) VALUES (2, 'BaseCurrency', 1);
 INSERT INTO settings(id, name, value) VALUES (3, 'Language', 1);
@@ -1128,6 +1198,7 @@ INSERT INTO settings(id, name, value) VALUES (6, 'RuTaxRefreshToken', '');
 INSERT INTO settings(id, name, value) VALUES (7, 'RebuildDB', 0);
 INSERT INTO settings(id, name, value) VALUES (8, 'WindowGeometry', '');
 INSERT INTO settings(id, name, value) VALUES (9, 'WindowState', '');
+INSERT INTO settings(id, name, value) VALUES (10, 'ValuationVersion', 0);
 
 -- Initialize available languages
 INSERT INTO languages (id, language) VALUES (1, 'en');
@@ -11,7 +11,8 @@ from PySide6.QtWidgets import QApplication, QDialog
 
 from jal.ui.ui_update_quotes_window import Ui_UpdateQuotesDlg
 from jal.constants import Setup, MarketDataFeed, BookAccount, PredefinedAsset
-from jal.db.helpers import executeSQL, readSQLrecord
+from jal.db.helpers import executeSQL, readSQL, readSQLrecord, db_triggers_disable, db_triggers_enable
+from jal.db.valuation import invalidate_valuation
 from jal.db.db import JalDB
 from jal.net.helpers import get_web_data, post_web_data, isEnglish
 
@@ -66,6 +67,23 @@ class QuoteDownloader(QObject):
     def UpdateQuotes(self, start_timestamp, end_timestamp):
         self.PrepareRussianCBReader()
         jal_db = JalDB()
+        first_quote = start_timestamp    # Valuation is dropped since period start if download fails in the middle
+        # Quote triggers are disabled during download in order not to drop cached valuation for every quote,
+        # it is dropped once from the earliest quote downloaded
+        db_triggers_disable()
+        try:
+            first_quote = self.DownloadQuotes(jal_db, start_timestamp, end_timestamp)
+        finally:
+            if first_quote is not None:
+                invalidate_valuation(first_quote)
+            db_triggers_enable()
+        jal_db.commit()
+        logging.info(self.tr("Download completed"))
+
+    # Downloads and stores quotes of all assets that were held during given period.
+    # Returns timestamp of the earliest quote stored or None if there were no quotes
+    def DownloadQuotes(self, jal_db, start_timestamp, end_timestamp):
+        first_quote = None
         query = executeSQL("WITH _holdings AS ( "
                            "SELECT l.asset_id AS asset FROM ledger AS l "
                            "WHERE l.book_account = 4 AND l.timestamp <= :end_timestamp "
@@ -110,8 +128,9 @@ class QuoteDownloader(QObject):
             if data is not None:
                 for date, quote in data.iterrows():  # Date in pandas dataset is in UTC by default
                     jal_db.update_quote(asset['asset_id'], int(date.timestamp()), float(quote[0]))
-        jal_db.commit()
-        logging.info(self.tr("Download completed"))
+                    first_quote = int(date.timestamp()) if first_quote is None else min(first_quote,
+                                                                                        int(date.timestamp()))
+        return first_quote
 
     def PrepareRussianCBReader(self):
         rows = []
@@ -268,28 +287,60 @@ class QuoteDownloader(QObject):
             secid = asset_data['secid'] if 'secid' in asset_data else ''
         return secid
 
-    # noinspection PyMethodMayBeStatic
-    def MOEX_DataReader(self, asset_id, asset_code, isin, start_timestamp, end_timestamp, update_symbol=True):
+    # Returns dictionary with 'secid', 'engine', 'market' and 'board' that are required to get quotes history of the
+    # asset from moex.com (and 'timestamp' of their resolution) or None if asset wasn't found. Values are stored in DB
+    # and are taken from there while they are younger than Setup.MOEX_INFO_REFRESH (or resolved again if 'refresh'
+    # is True). Asset isin, reg.code and expiry are updated in DB together with resolution if 'update_symbol' is True
+    def MOEX_security(self, asset_id, asset_code, isin, update_symbol=True, refresh=False):
+        now = int(datetime.now(tz=timezone.utc).timestamp())
+        if not refresh:
+            security = readSQL("SELECT secid, engine, market, board, timestamp FROM asset_moex_id "
+                               "WHERE asset_id=:asset_id AND timestamp>=:valid_since",
+                               [(":asset_id", asset_id), (":valid_since", now - Setup.MOEX_INFO_REFRESH)], named=True)
+            if security is not None:
+                return security
         asset = self.MOEX_info(symbol=asset_code, isin=isin, special=True)
-        if (asset['engine'] is None) or (asset['market'] is None) or (asset['board'] is None):
-            logging.warning(f"Failed to find {asset_code} on moex.com")
+        if not all(asset.get(key) for key in ['engine', 'market', 'board']):
             return None
+        secid = asset_code
         if (asset['market'] == 'bonds') and (asset['board'] == 'TQCB'):
-            asset_code = isin   # Corporate bonds are quoted by ISIN
+            secid = isin   # Corporate bonds are quoted by ISIN
         if (asset['market'] == 'shares') and (asset['board'] == 'TQIF'):
-            asset_code = isin   # ETFs are quoted by ISIN
-
-        isin = asset['isin'] if 'isin' in asset else ''
-        reg_code = asset['reg_code'] if 'reg_code' in asset else ''
-        expiry = asset['expiry'] if 'expiry' in asset else 0
+            secid = isin   # ETFs are quoted by ISIN
         if update_symbol:
-            JalDB().update_asset_data(asset_id, new_isin=isin, new_reg=reg_code, expiry=expiry)
+            JalDB().update_asset_data(asset_id, new_isin=asset.get('isin', ''), new_reg=asset.get('reg_code', ''),
+                                      expiry=asset.get('expiry', 0))
+        # Select from 'assets' in order not to store values for an asset that isn't present in DB
+        _ = executeSQL("INSERT OR REPLACE INTO asset_moex_id(asset_id, secid, engine, market, board, timestamp) "
+                       "SELECT id, :secid, :engine, :market, :board, :timestamp FROM assets WHERE id=:asset_id",
+                       [(":asset_id", asset_id), (":secid", secid), (":engine", asset['engine']),
+                        (":market", asset['market']), (":board", asset['board']), (":timestamp", now)])
+        return {'secid': secid, 'engine': asset['engine'], 'market': asset['market'], 'board': asset['board'],
+                'timestamp': now}
+
+    # noinspection PyMethodMayBeStatic
+    def MOEX_DataReader(self, asset_id, asset_code, isin, start_timestamp, end_timestamp, update_symbol=True):
+        started = int(datetime.now(tz=timezone.utc).timestamp())
+        security = self.MOEX_security(asset_id, asset_code, isin, update_symbol=update_symbol)
+        if security is None:
+            logging.warning(f"Failed to find {asset_code} on moex.com")
+            return None
+        close = self.MOEX_history(security, start_timestamp, end_timestamp)
+        if close.empty and security['timestamp'] < started:   # Stored board might be outdated - check it again
+            refreshed = self.MOEX_security(asset_id, asset_code, isin, update_symbol=update_symbol, refresh=True)
+            if refreshed is not None and \
+                    any(refreshed[x] != security[x] for x in ['secid', 'engine', 'market', 'board']):
+                close = self.MOEX_history(refreshed, start_timestamp, end_timestamp)
+        return close
 
+    # Returns pandas dataset of close prices of 'security' (see MOEX_security()) for given period
+    @staticmethod
+    def MOEX_history(security, start_timestamp, end_timestamp):
         # Get price history
         date1 = datetime.utcfromtimestamp(start_timestamp).strftime('%Y-%m-%d')
         date2 = datetime.utcfromtimestamp(end_timestamp).strftime('%Y-%m-%d')
-        url = f"http://iss.moex.com/iss/history/engines/{asset['engine']}/markets/{asset['market']}/" \
-              f"boards/{asset['board']}/securities/{asset_code}.xml?from={date1}&till={date2}"
+        url = f"http://iss.moex.com/iss/history/engines/{security['engine']}/markets/{security['market']}/" \
+              f"boards/{security['board']}/securities/{security['secid']}.xml?from={date1}&till={date2}"
         xml_root = xml_tree.fromstring(get_web_data(url))
         history_rows = xml_root.findall("data[@id='history']/rows/*")
         quotes = []
@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import logging
+import importlib
+
+from PySide6.QtWidgets import QApplication
+from jal.constants import Setup
+from jal.db.helpers import get_app_path
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Reports and statement importers are plugins: modules in Setup.REPORT_PATH and Setup.STATEMENT_PATH folders that
+# declare JAL_REPORT_CLASS / JAL_STATEMENT_CLASS. Information required to build application menus (names, icons and
+# file filters) is kept in a static manifest file - so plugin modules (and their dependencies) are imported only
+# when report or import is actually invoked.
+# Manifest should be re-generated after plugin modification with 'python -m jal.plugins'
+class PluginManifest:
+    REPORTS = "reports"
+    STATEMENTS = "statements"
+
+    def __init__(self):
+        self.manifest = self.load()
+
+    # Returns list of plugin descriptions of given kind with names translated into current language
+    def items(self, kind):
+        items = []
+        for item in self.manifest[kind]:
+            item = dict(item)
+            item['name'] = QApplication.translate(item['class'], item['name'])
+            if 'filename_filter' in item:
+                item['filename_filter'] = QApplication.translate(item['class'], item['filename_filter'])
+            items.append(item)
+        return sorted(items, key=lambda x: x['name'])
+
+    # Returns manifest from the file or builds it from plugin modules if file is missing or invalid
+    @staticmethod
+    def load():
+        file_path = get_app_path() + Setup.PLUGINS_MANIFEST
+        try:
+            with open(file_path, 'r', encoding='utf-8') as json_file:
+                manifest = json.load(json_file)
+            if PluginManifest.REPORTS in manifest and PluginManifest.STATEMENTS in manifest:
+                return manifest
+            logging.warning(f"Invalid plugin manifest '{file_path}'")
+        except (OSError, ValueError) as e:
+            logging.warning(f"Can't load plugin manifest from '{file_path}' ({e})")
+        return PluginManifest.generate()
+
+    # Imports all plugin modules and collects plugin descriptions from them
+    @staticmethod
+    def generate():
+        manifest = {PluginManifest.REPORTS: [], PluginManifest.STATEMENTS: []}
+        for module_name in PluginManifest._modules(Setup.REPORT_PATH):
+            report = PluginManifest._instance(f"jal.{Setup.REPORT_PATH}.{module_name}", "JAL_REPORT_CLASS")
+            if report is None:
+                continue
+            manifest[PluginManifest.REPORTS].append({
+                'module': f"jal.{Setup.REPORT_PATH}.{module_name}",
+                'class': type(report).__name__,
+                'name': report.name,
+                'window_class': report.window_class
+            })
+        for module_name in PluginManifest._modules(Setup.IMPORT_PATH + os.sep + Setup.STATEMENT_PATH):
+            module_path = f"jal.{Setup.IMPORT_PATH}.{Setup.STATEMENT_PATH}.{module_name}"
+            statement = PluginManifest._instance(module_path, "JAL_STATEMENT_CLASS")
+            if statement is None:
+                continue
+            manifest[PluginManifest.STATEMENTS].append({
+                'module': module_path,
+                'class': type(statement).__name__,
+                'name': statement.name,
+                'icon': statement.icon_name,
+                'filename_filter': statement.filename_filter
+            })
+        for kind in manifest:
+            manifest[kind] = sorted(manifest[kind], key=lambda x: x['module'])
+        return manifest
+
+    @staticmethod
+    def save(manifest):
+        with open(get_app_path() + Setup.PLUGINS_MANIFEST, 'w', encoding='utf-8') as json_file:
+            json.dump(manifest, json_file, indent=2, ensure_ascii=False)
+            json_file.write('\n')
+
+    @staticmethod
+    def _modules(folder):
+        return sorted([filename[:-3] for filename in os.listdir(get_app_path() + folder) if filename.endswith(".py")])
+
+    # Returns instance of plugin class declared by 'class_declaration' in given module or None
+    @staticmethod
+    def _instance(module_path, class_declaration):
+        logging.debug(f"Trying to load plugin module: {module_path}")
+        module = importlib.import_module(module_path)
+        try:
+            class_name = getattr(module, class_declaration)
+        except AttributeError:
+            return None
+        try:
+            class_instance = getattr(module, class_name)
+        except AttributeError:
+            logging.error(f"Plugin class can't be loaded: {class_name}")
+            return None
+        return class_instance()
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Imports plugin module only at the moment of call and returns class with given name from it
+def plugin_class(module_path, class_name):
+    module = importlib.import_module(module_path)
+    return getattr(module, class_name)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    importlib.import_module("jal.widgets.reference_dialogs")   # keep the same widgets import order as application has
+    PluginManifest.save(PluginManifest.generate())
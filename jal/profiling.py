@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import time
+import atexit
+import builtins
+import logging
+import threading
+import multiprocessing
+import importlib.util
+from contextlib import contextmanager, nullcontext
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Collects time spent for import of every module - it gives the same breakdown as 'python -X importtime' does but
+# keeps it in memory so it may be put into application log.
+# Profiling is done by replacement of builtin __import__ function thus modules that are loaded with
+# importlib.import_module() (i.e. plugins) are accounted as a part of a module that imports them.
+class ImportProfiler:
+    def __init__(self):
+        self.timings = []       # list of (module name, self time, cumulative time, nesting level)
+        self._original_import = None
+        self._nested = []       # stack of accumulated times of nested imports
+
+    def start(self):
+        if self._original_import is not None:
+            return
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def stop(self):
+        if self._original_import is None:
+            return
+        builtins.__import__ = self._original_import
+        self._original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module_name = name
+        if level > 0:
+            try:
+                module_name = importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__'))
+            except (ImportError, ValueError):
+                pass
+        if module_name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        start = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = time.perf_counter() - start
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += cumulative
+            self.timings.append((module_name, cumulative - nested, cumulative, len(self._nested)))
+
+    # Returns text lines with 'count' slowest top-level imports and their heaviest dependencies
+    def report(self, count=20):
+        lines = [f"{'self [ms]':>10} | {'cumulative [ms]':>15} | imported module"]
+        for module, self_time, cumulative, level in sorted(self.timings, key=lambda x: x[2], reverse=True)[:count]:
+            lines.append(f"{self_time * 1000:10.1f} | {cumulative * 1000:15.1f} | {'  ' * level}{module}")
+        return lines
+
+    def log(self, count=20):
+        logging.info(f"Import time profile ({len(self.timings)} modules, "
+                     f"{sum([x[2] for x in self.timings if x[3] == 0]) * 1000:.0f} ms in total):\n" +
+                     "\n".join(self.report(count)))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Records nested time spans with attributes and saves them as Chrome trace-event JSON that may be opened with
+# chrome://tracing, https://ui.perfetto.dev or converted into a flame graph.
+# Tracing is enabled with JAL_TRACE environment variable that should contain a name of output file.
+# Trace is saved at exit or by trace_stop()
+class Tracer:
+    def __init__(self, trace_file):
+        self.trace_file = trace_file
+        self.events = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    # Context manager that records a span 'name'. It yields dictionary of span attributes so attributes
+    # that are known only at the end of span may be added inside of 'with' block
+    @contextmanager
+    def span(self, name, **attributes):
+        start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            self.add(name, start, time.perf_counter() - start, **attributes)
+
+    # Adds complete span 'name' that started at 'start' (value of time.perf_counter()) and lasted 'duration' seconds
+    def add(self, name, start, duration, **attributes):
+        event = {
+            "name": name,
+            "cat": "jal",
+            "ph": "X",
+            "ts": round((start - self._origin) * 1e6, 1),
+            "dur": round(duration * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {key: value if isinstance(value, (int, float, bool)) else str(value)
+                     for key, value in attributes.items()}
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def save(self):
+        with self._lock:
+            events = sorted(self.events, key=lambda x: x['ts'])
+        try:
+            with open(self.trace_file, 'w', encoding='utf-8') as trace_file:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+        except OSError as e:
+            logging.error(f"Can't save trace into '{self.trace_file}': {e}")
+
+
+_tracer = None
+
+
+# Starts recording of spans (see Tracer) and returns tracer object.
+# Worker processes (that inherit environment of main process) put their spans into separate '<trace_file>.<pid>' files
+def trace_start(trace_file):
+    global _tracer
+    if _tracer is None:
+        if multiprocessing.parent_process() is not None:
+            trace_file = f"{trace_file}.{os.getpid()}"
+        _tracer = Tracer(trace_file)
+        atexit.register(trace_save)
+    return _tracer
+
+
+def trace_stop():
+    global _tracer
+    tracer = _tracer
+    _tracer = None
+    atexit.unregister(trace_save)
+    if tracer is not None:
+        tracer.save()
+    return tracer
+
+
+def trace_save():
+    if _tracer is not None:
+        _tracer.save()
+
+
+def trace_enabled():
+    return _tracer is not None
+
+
+# Records span 'name' that started at 'start' (value of time.perf_counter()) and lasted 'duration' seconds
+def trace_add(name, start, duration, **attributes):
+    if _tracer is not None:
+        _tracer.add(name, start, duration, **attributes)
+
+
+# Returns context manager that records span 'name' if tracing is active and does nothing otherwise
+def trace_span(name, **attributes):
+    if _tracer is None:
+        return nullcontext(attributes)
+    return _tracer.span(name, **attributes)
+
+
+if os.environ.get('JAL_TRACE'):
+    trace_start(os.environ['JAL_TRACE'])
@@ -1,8 +1,7 @@
-from PySide6.QtCore import Qt, Signal, Slot, QObject
-from PySide6.QtSql import QSqlTableModel
+from PySide6.QtCore import Signal, Slot, QObject
 from PySide6.QtWidgets import QHeaderView
 from jal.ui.reports.ui_category_report import Ui_CategoryReportWidget
-from jal.db.helpers import db_connection, executeSQL
+from jal.db.background import ReportTableModel
 from jal.widgets.delegates import FloatDelegate, TimestampDelegate
 from jal.widgets.mdi import MdiWidget
 
@@ -11,29 +10,19 @@ JAL_REPORT_CLASS = "CategoryReport"
 
 # ----------------------------------------------------------------------------------------------------------------------
 # TODO Reimplement report based on 'ledger' DB table in order to include all types of operations
-class CategoryReportModel(QSqlTableModel):
+class CategoryReportModel(ReportTableModel):
     def __init__(self, parent_view):
+        super().__init__(parent_view)
         self._columns = [("timestamp", self.tr("Timestamp")),
                          ("account", self.tr("Account")),
                          ("name", self.tr("Peer Name")),
                          ("amount", self.tr("Amount")),
                          ("note", self.tr("Note"))]
-        self._view = parent_view
-        self._query = None
         self._timestamp_delegate = None
         self._float_delegate = None
         self._begin = 0
         self._end = 0
         self._category_id = 0
-        QSqlTableModel.__init__(self, parent=parent_view, db=db_connection())
-
-    def setColumnNames(self):
-        for column in self._columns:
-            self.setHeaderData(self.fieldIndex(column[0]), Qt.Horizontal, column[1])
-
-    def resetDelegates(self):
-        for column in self._columns:
-            self._view.setItemDelegateForColumn(self.fieldIndex(column[0]), None)
 
     def configureView(self):
         if self.columnCount() == 0:
@@ -59,27 +48,22 @@ class CategoryReportModel(QSqlTableModel):
         self._begin = begin
         self._end = end
         self.calculateCategoryReport()
-        self.configureView()
 
     def setCategory(self, category):
         self._category_id = category
         self.calculateCategoryReport()
-        self.configureView()
 
     def calculateCategoryReport(self):
         if self._category_id == 0:
             return
-        self._query = executeSQL("SELECT a.timestamp, ac.name AS account, p.name, d.amount, d.note "
-                                "FROM actions AS a "
-                                "LEFT JOIN action_details AS d ON d.pid=a.id "
-                                "LEFT JOIN agents AS p ON p.id=a.peer_id "
-                                "LEFT JOIN accounts AS ac ON ac.id=a.account_id "
-                                "WHERE a.timestamp>=:begin AND a.timestamp<=:end "
-                                "AND d.category_id=:category_id",
-                                [(":category_id", self._category_id), (":begin", self._begin), (":end", self._end)],
-                                 forward_only=False)
-        self.setQuery(self._query)
-        self.modelReset.emit()
+        self.setQuery("SELECT a.timestamp, ac.name AS account, p.name, d.amount, d.note "
+                      "FROM actions AS a "
+                      "LEFT JOIN action_details AS d ON d.pid=a.id "
+                      "LEFT JOIN agents AS p ON p.id=a.peer_id "
+                      "LEFT JOIN accounts AS ac ON ac.id=a.account_id "
+                      "WHERE a.timestamp>=:begin AND a.timestamp<=:end "
+                      "AND d.category_id=:category_id",
+                      [(":category_id", self._category_id), (":begin", self._begin), (":end", self._end)])
 
 
 # ----------------------------------------------------------------------------------------------------------------------
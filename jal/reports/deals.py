@@ -1,8 +1,7 @@
 from PySide6.QtCore import Qt, Slot, QObject
-from PySide6.QtSql import QSqlTableModel
 from jal.ui.reports.ui_deals_report import Ui_DealsReportWidget
-from jal.db.helpers import db_connection, executeSQL
-from jal.constants import CorporateAction
+from jal.db.background import ReportTableModel
+from jal.constants import TransactionType, CorporateAction
 from jal.widgets.delegates import TimestampDelegate, FloatDelegate
 from jal.widgets.mdi import MdiWidget
 
@@ -10,8 +9,9 @@ JAL_REPORT_CLASS = "DealsReport"
 
 
 # -----------------------------------------------------------------------------------------------------------------------
-class DealsReportModel(QSqlTableModel):
+class DealsReportModel(ReportTableModel):
     def __init__(self, parent_view):
+        super().__init__(parent_view)
         self._columns = [("asset", self.tr("Asset")),
                          ("o_datetime", self.tr("Open Date")),
                          ("c_datetime", self.tr("Close Date")),
@@ -28,27 +28,16 @@ class DealsReportModel(QSqlTableModel):
             CorporateAction.SpinOff: self.tr("Spin-off"),
             CorporateAction.Merger: self.tr("Merger")
         }
-        self._view = parent_view
         self._begin = 0
         self._end = 0
         self._account_id = 0
         self._group_dates = 0
-        self._query = None
         self._timestamp_delegate = None
         self._float_delegate = None
         self._float2_delegate = None
         self._float4_delegate = None
         self._profit_delegate = None
         self._ca_delegate = None
-        QSqlTableModel.__init__(self, parent=parent_view, db=db_connection())
-
-    def setColumnNames(self):
-        for column in self._columns:
-            self.setHeaderData(self.fieldIndex(column[0]), Qt.Horizontal, column[1])
-
-    def resetDelegates(self):
-        for column in self._columns:
-            self._view.setItemDelegateForColumn(self.fieldIndex(column[0]), None)
 
     def data(self, index, role=Qt.DisplayRole):
         if role == Qt.DisplayRole:
@@ -100,44 +89,46 @@ class DealsReportModel(QSqlTableModel):
         self._begin = begin
         self._end = end
         self.calculateDealsReport()
-        self.configureView()
 
     def setAccount(self, account_id):
         self._account_id = account_id
         self.calculateDealsReport()
-        self.configureView()
 
     def setGrouping(self, group_dates):
         self._group_dates = group_dates
         self.calculateDealsReport()
-        self.configureView()
 
     def calculateDealsReport(self):
         if self._account_id == 0:
             return
         if self._group_dates == 1:
-            self._query = executeSQL(
-                "SELECT asset, "
-                "strftime('%s', datetime(open_timestamp, 'unixepoch', 'start of day')) as o_datetime, "
-                "strftime('%s', datetime(close_timestamp, 'unixepoch', 'start of day')) as c_datetime, "
-                "SUM(open_price*qty)/SUM(qty) as open_price, SUM(close_price*qty)/SUM(qty) AS close_price, "
-                "SUM(qty) as qty, SUM(fee) as fee, SUM(profit) as profit, "
-                "coalesce(100*SUM(qty*(close_price-open_price)-fee)/SUM(qty*open_price), 0) AS rel_profit "
-                "FROM deals_ext "
-                "WHERE account_id=:account_id AND close_timestamp>=:begin AND close_timestamp<=:end "
+            self.setQuery(
+                "SELECT at.name AS asset, "
+                "strftime('%s', datetime(d.open_timestamp, 'unixepoch', 'start of day')) as o_datetime, "
+                "strftime('%s', datetime(d.close_timestamp, 'unixepoch', 'start of day')) as c_datetime, "
+                "SUM(d.open_price*d.qty)/SUM(d.qty) as open_price, SUM(d.close_price*d.qty)/SUM(d.qty) AS close_price, "
+                "SUM(d.qty) as qty, SUM(d.open_fee+d.close_fee) as fee, SUM(d.profit) as profit, "
+                "coalesce(100*SUM(d.profit)/SUM(d.qty*d.open_price), 0) AS rel_profit "
+                "FROM deals AS d "
+                "LEFT JOIN assets AS at ON d.asset_id = at.id "
+                "WHERE d.account_id=:account_id AND d.close_timestamp>=:begin AND d.close_timestamp<=:end "
+                "AND NOT (d.open_op_type=:corp_action AND d.close_op_type=:corp_action) "
                 "GROUP BY asset, o_datetime, c_datetime "
                 "ORDER BY c_datetime, o_datetime",
-                [(":account_id", self._account_id), (":begin", self._begin), (":end", self._end)], forward_only=False)
+                [(":account_id", self._account_id), (":begin", self._begin), (":end", self._end),
+                 (":corp_action", TransactionType.CorporateAction)])
         else:
-            self._query = executeSQL(
-                "SELECT asset, open_timestamp AS o_datetime, close_timestamp AS c_datetime, "
-                "open_price, close_price, qty, fee, profit, rel_profit, corp_action "
-                "FROM deals_ext "
-                "WHERE account_id=:account_id AND close_timestamp>=:begin AND close_timestamp<=:end "
+            self.setQuery(
+                "SELECT at.name AS asset, d.open_timestamp AS o_datetime, d.close_timestamp AS c_datetime, "
+                "d.open_price, d.close_price, d.qty, d.open_fee+d.close_fee AS fee, d.profit, d.rel_profit, "
+                "d.corp_action "
+                "FROM deals AS d "
+                "LEFT JOIN assets AS at ON d.asset_id = at.id "
+                "WHERE d.account_id=:account_id AND d.close_timestamp>=:begin AND d.close_timestamp<=:end "
+                "AND NOT (d.open_op_type=:corp_action AND d.close_op_type=:corp_action) "
                 "ORDER BY c_datetime, o_datetime",
-                [(":account_id", self._account_id), (":begin", self._begin), (":end", self._end)], forward_only=False)
-        self.setQuery(self._query)
-        self.modelReset.emit()
+                [(":account_id", self._account_id), (":begin", self._begin), (":end", self._end),
+                 (":corp_action", TransactionType.CorporateAction)])
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -4,6 +4,7 @@ from PySide6.QtGui import QBrush
 from jal.ui.reports.ui_income_spending_report import Ui_IncomeSpendingReportWidget
 from jal.constants import BookAccount, PredefinedAsset, CustomColor
 from jal.db.helpers import executeSQL
+from jal.db.background import ReportRunner
 from jal.widgets.delegates import GridLinesDelegate
 from jal.widgets.mdi import MdiWidget
 
@@ -107,6 +108,45 @@ class ReportTreeItem:
         return self._m_e
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+# Report task (see ReportTask) that returns list of monthly amounts for every category
+def category_amounts(task, begin, end):
+    query = executeSQL("WITH "
+                       "_months AS (SELECT strftime('%s', datetime(timestamp, 'unixepoch', 'start of month') ) "
+                       "AS month, asset_id, MAX(timestamp) AS last_timestamp "
+                       "FROM quotes AS q "
+                       "LEFT JOIN assets AS a ON q.asset_id=a.id "
+                       "WHERE a.type_id=:asset_money "
+                       "GROUP BY month, asset_id), "
+                       "_category_amounts AS ( "
+                       "SELECT strftime('%s', datetime(t.timestamp, 'unixepoch', 'start of month')) AS month_start, "
+                       "t.category_id AS id, sum(-t.amount * coalesce(q.quote, 1)) AS amount "
+                       "FROM ledger AS t "
+                       "LEFT JOIN _months AS d ON month_start = d.month AND t.asset_id = d.asset_id "
+                       "LEFT JOIN quotes AS q ON d.last_timestamp = q.timestamp AND t.asset_id = q.asset_id "
+                       "WHERE (t.book_account=:book_costs OR t.book_account=:book_incomes) "
+                       "AND t.timestamp>=:begin AND t.timestamp<=:end "
+                       "GROUP BY month_start, category_id) "
+                       "SELECT ct.level, ct.id, c.pid, c.name, ct.path, ca.month_start, "
+                       "coalesce(ca.amount, 0) AS amount "
+                       "FROM categories_tree AS ct "
+                       "LEFT JOIN _category_amounts AS ca ON ct.id=ca.id "
+                       "LEFT JOIN categories AS c ON ct.id=c.id "
+                       "ORDER BY path, month_start",
+                       [(":asset_money", PredefinedAsset.Money), (":book_costs", BookAccount.Costs),
+                        (":book_incomes", BookAccount.Incomes), (":begin", begin), (":end", end)],
+                       forward_only=True, db=task.db)
+    if query is None:
+        return None
+    rows = []
+    indexes = range(query.record().count())
+    while query.next():
+        if task.cancelled:
+            return None
+        rows.append(list(map(query.value, indexes)))
+    return begin, end, rows
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 class IncomeSpendingReportModel(QAbstractItemModel):
     COL_LEVEL = 0
@@ -125,6 +165,9 @@ class IncomeSpendingReportModel(QAbstractItemModel):
         self._root = None
         self._grid_delegate = None
         self._report_delegate = None
+        self._runner = ReportRunner(self)
+        self._runner.busy.connect(self.onBusy)
+        self._runner.finished.connect(self.loadIncomeSpendings)
         self.month_name = [
             self.tr('Jan'), self.tr('Feb'), self.tr('Mar'), self.tr('Apr'), self.tr('May'), self.tr('Jun'),
             self.tr('Jul'), self.tr('Aug'), self.tr('Sep'), self.tr('Oct'), self.tr('Nov'), self.tr('Dec')
@@ -244,49 +287,33 @@ class IncomeSpendingReportModel(QAbstractItemModel):
         self._begin = begin
         self._end = end
         self.calculateIncomeSpendings()
-        self.configureView()
 
     def calculateIncomeSpendings(self):
-        query = executeSQL("WITH "
-                           "_months AS (SELECT strftime('%s', datetime(timestamp, 'unixepoch', 'start of month') ) "
-                           "AS month, asset_id, MAX(timestamp) AS last_timestamp "
-                           "FROM quotes AS q "
-                           "LEFT JOIN assets AS a ON q.asset_id=a.id "
-                           "WHERE a.type_id=:asset_money "
-                           "GROUP BY month, asset_id), "
-                           "_category_amounts AS ( "
-                           "SELECT strftime('%s', datetime(t.timestamp, 'unixepoch', 'start of month')) AS month_start, "
-                           "t.category_id AS id, sum(-t.amount * coalesce(q.quote, 1)) AS amount "
-                           "FROM ledger AS t "
-                           "LEFT JOIN _months AS d ON month_start = d.month AND t.asset_id = d.asset_id "
-                           "LEFT JOIN quotes AS q ON d.last_timestamp = q.timestamp AND t.asset_id = q.asset_id "
-                           "WHERE (t.book_account=:book_costs OR t.book_account=:book_incomes) "
-                           "AND t.timestamp>=:begin AND t.timestamp<=:end "
-                           "GROUP BY month_start, category_id) "
-                           "SELECT ct.level, ct.id, c.pid, c.name, ct.path, ca.month_start, "
-                           "coalesce(ca.amount, 0) AS amount "
-                           "FROM categories_tree AS ct "
-                           "LEFT JOIN _category_amounts AS ca ON ct.id=ca.id "
-                           "LEFT JOIN categories AS c ON ct.id=c.id "
-                           "ORDER BY path, month_start",
-                           [(":asset_money", PredefinedAsset.Money), (":book_costs", BookAccount.Costs),
-                            (":book_incomes", BookAccount.Incomes), (":begin", self._begin), (":end", self._end)],
-                           forward_only=True)
-        self._root = ReportTreeItem(self._begin, self._end, -1, "ROOT")  # invisible root
-        self._root.appendChild(ReportTreeItem(self._begin, self._end, 0, self.tr("TOTAL")))  # visible root
-        indexes = range(query.record().count())
-        while query.next():
-            values = list(map(query.value, indexes))
+        self._runner.submit(category_amounts, self._begin, self._end)
+
+    def onBusy(self, busy):
+        self._view.setEnabled(not busy)
+
+    # Builds report tree from results of category_amounts() task
+    def loadIncomeSpendings(self, result):
+        if result is None:
+            return
+        begin, end, rows = result
+        self.beginResetModel()
+        self._root = ReportTreeItem(begin, end, -1, "ROOT")  # invisible root
+        self._root.appendChild(ReportTreeItem(begin, end, 0, self.tr("TOTAL")))  # visible root
+        for values in rows:
             leaf = self._root.getLeafById(values[self.COL_ID])
             if leaf is None:
                 parent = self._root.getLeafById(values[self.COL_PID])
-                leaf = ReportTreeItem(self._begin, self._end, values[self.COL_ID], values[self.COL_NAME], parent)
+                leaf = ReportTreeItem(begin, end, values[self.COL_ID], values[self.COL_NAME], parent)
                 parent.appendChild(leaf)
             if values[self.COL_TIMESTAMP]:
                 year = int(datetime.utcfromtimestamp(int(values[self.COL_TIMESTAMP])).strftime('%Y'))
                 month = int(datetime.utcfromtimestamp(int(values[self.COL_TIMESTAMP])).strftime('%m').lstrip('0'))
                 leaf.addAmount(year, month, values[self.COL_AMOUNT])
-        self.modelReset.emit()
+        self.endResetModel()
+        self.configureView()
         self._view.expandAll()
 
 
@@ -0,0 +1,118 @@
+from PySide6.QtCore import Slot, QObject
+from jal.ui.reports.ui_performance_report import Ui_PerformanceReportWidget
+from jal.constants import PredefindedAccountType
+from jal.db.helpers import executeSQL, readSQLrecord
+from jal.db.settings import JalSettings
+from jal.db.background import ReportTableModel
+from jal.db.performance import PortfolioPerformance, money_weighted_return
+from jal.widgets.delegates import FloatDelegate, TimestampDelegate
+from jal.widgets.mdi import MdiWidget
+
+JAL_REPORT_CLASS = "PerformanceReport"
+
+
+#-----------------------------------------------------------------------------------------------------------------------
+# Report task (see ReportTask) that gives daily value and returns of the account (or of all investment accounts if
+# account_id is 0) in given currency. Returns annualized money-weighted return of the period
+def portfolio_performance(task, account_id, currency_id, begin, end):
+    if account_id:
+        accounts = [account_id]
+    else:
+        accounts = []
+        query = executeSQL("SELECT id FROM accounts WHERE type_id=:investments",
+                           [(":investments", PredefindedAccountType.Investment)], db=task.db)
+        while query.next():
+            accounts.append(readSQLrecord(query))
+    series = PortfolioPerformance(accounts, currency_id, db=task.db).calculate(begin, end)
+    rows = [(int(day), float(nav), float(flow), 100.0 * float(daily), 100.0 * float(twr))
+            for day, nav, flow, daily, twr in zip(series['day'], series['nav'], series['flow'],
+                                                  series['return'], series['twr'])]
+    task.emit(["day", "nav", "flow", "return", "twr"], rows)
+    return money_weighted_return(series['day'], series['nav'], series['flow'])
+
+
+#-----------------------------------------------------------------------------------------------------------------------
+class PerformanceReportModel(ReportTableModel):
+    def __init__(self, parent_view, mwr_label):
+        super().__init__(parent_view)
+        self._columns = [("day", self.tr("Date")),
+                         ("nav", self.tr("Value")),
+                         ("flow", self.tr("In / Out")),
+                         ("return", self.tr("Return, %")),
+                         ("twr", self.tr("Cumulative TWR, %"))]
+        self._mwr_label = mwr_label
+        self._begin = 0
+        self._end = 0
+        self._account_id = 0
+        self._currency_id = 0
+        self._date_delegate = None
+        self._float_delegate = None
+
+    def configureView(self):
+        self._view.setModel(self)
+        self.setColumnNames()
+        self.resetDelegates()
+        font = self._view.horizontalHeader().font()
+        font.setBold(True)
+        self._view.horizontalHeader().setFont(font)
+        self._date_delegate = TimestampDelegate(display_format='%d/%m/%Y')
+        self._view.setItemDelegateForColumn(self.fieldIndex("day"), self._date_delegate)
+        self._float_delegate = FloatDelegate(2, allow_tail=False)
+        for column in ["nav", "flow", "return", "twr"]:
+            self._view.setItemDelegateForColumn(self.fieldIndex(column), self._float_delegate)
+
+    def setDatesRange(self, begin, end):
+        self._begin = begin
+        self._end = end
+        self.calculatePerformanceReport()
+
+    def setAccount(self, account_id):
+        self._account_id = account_id
+        self.calculatePerformanceReport()
+
+    def setCurrency(self, currency_id):
+        self._currency_id = currency_id
+        self.calculatePerformanceReport()
+
+    def calculatePerformanceReport(self):
+        if not self._currency_id or not self._end:
+            return
+        self.calculate(portfolio_performance, self._account_id, self._currency_id, self._begin, self._end)
+
+    def onFinished(self, result):
+        super().onFinished(result)
+        if result is None:
+            self._mwr_label.setText('')
+        else:
+            self._mwr_label.setText(self.tr("Money-weighted return (annual): ") + f"{100.0 * result:.2f}%")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class PerformanceReport(QObject):
+    def __init__(self):
+        super().__init__()
+        self.name = self.tr("Portfolio performance")
+        self.window_class = "PerformanceReportWindow"
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class PerformanceReportWindow(MdiWidget, Ui_PerformanceReportWidget):
+    def __init__(self, parent=None):
+        MdiWidget.__init__(self, parent)
+        self.setupUi(self)
+        self.parent_mdi = parent
+
+        self.performance_model = PerformanceReportModel(self.ReportTableView, self.MoneyWeightedReturnLbl)
+        self.ReportTableView.setModel(self.performance_model)
+
+        self.connect_signals_and_slots()
+        self.ReportCurrencyCombo.setIndex(JalSettings().getValue('BaseCurrency'))
+
+    def connect_signals_and_slots(self):
+        self.ReportRange.changed.connect(self.ReportTableView.model().setDatesRange)
+        self.ReportAccountBtn.changed.connect(self.onAccountChange)
+        self.ReportCurrencyCombo.changed.connect(self.ReportTableView.model().setCurrency)
+
+    @Slot()
+    def onAccountChange(self):
+        self.ReportTableView.model().setAccount(self.ReportAccountBtn.account_id)
@@ -1,8 +1,8 @@
-from PySide6.QtCore import Qt, Signal, Slot, QObject
-from PySide6.QtSql import QSqlTableModel
+from PySide6.QtCore import Signal, Slot, QObject
 from jal.ui.reports.ui_profit_loss_report import Ui_ProfitLossReportWidget
-from jal.db.helpers import db_connection, executeSQL
-from jal.constants import BookAccount, PredefinedCategory
+from jal.db.helpers import readSQL
+from jal.db.background import ReportTableModel, fetch_rows
+from jal.db.valuation import AccountValuation, month_starts, valuation_version
 from jal.widgets.delegates import FloatDelegate, TimestampDelegate
 from jal.widgets.mdi import MdiWidget
 
@@ -10,8 +10,37 @@ JAL_REPORT_CLASS = "ProfitLossReport"
 
 
 #-----------------------------------------------------------------------------------------------------------------------
-class ProfitLossReportModel(QSqlTableModel):
+# Report task (see ReportTask) that gives monthly P&L series of the account. Series are taken from 'valuation_series'
+# table if present there, otherwise series are calculated and returned as result of the task - read-only connection
+# can't store them so it is done by the model in GUI thread (together with valuation version of the data snapshot)
+def profit_loss_series(task, account_id, begin, end):
+    version = valuation_version(db=task.db)
+    valuation = AccountValuation(account_id, db=task.db)
+    months = month_starts(begin, end)
+    if valuation.cached(months):
+        fetch_rows(task, "SELECT period, transfer, assets, result, profit, dividend, tax_fee "
+                         "FROM valuation_series "
+                         "WHERE account_id=:account_id AND period>=:first AND period<=:last "
+                         "AND EXISTS(SELECT id FROM ledger WHERE account_id=:account_id "
+                         "AND timestamp>=:begin AND timestamp<=:end) "
+                         "ORDER BY period",
+                   [(":account_id", account_id), (":first", months[0]), (":last", months[-1]),
+                    (":begin", begin), (":end", end)])
+        return None
+    series = valuation.calculate(months)
+    rows = []
+    if readSQL("SELECT EXISTS(SELECT id FROM ledger WHERE account_id=:account_id "
+               "AND timestamp>=:begin AND timestamp<=:end)",
+               [(":account_id", account_id), (":begin", begin), (":end", end)], db=task.db):
+        rows = [(int(row[0]),) + tuple(float(x) for x in row[1:]) for row in series]
+    task.emit(["period", "transfer", "assets", "result", "profit", "dividend", "tax_fee"], rows)
+    return account_id, months, series, version
+
+
+#-----------------------------------------------------------------------------------------------------------------------
+class ProfitLossReportModel(ReportTableModel):
     def __init__(self, parent_view):
+        super().__init__(parent_view)
         self._columns = [("period", self.tr("Period")),
                          ("transfer", self.tr("In / Out")),
                          ("assets", self.tr("Assets value")),
@@ -19,22 +48,11 @@ class ProfitLossReportModel(QSqlTableModel):
                          ("profit", self.tr("Profit / Loss")),
                          ("dividend", self.tr("Returns")),
                          ("tax_fee", self.tr("Taxes & Fees"))]
-        self._view = parent_view
         self._begin = 0
         self._end = 0
         self._account_id = 0
-        self._query = None
         self._ym_delegate = None
         self._float_delegate = None
-        QSqlTableModel.__init__(self, parent=parent_view, db=db_connection())
-
-    def setColumnNames(self):
-        for column in self._columns:
-            self.setHeaderData(self.fieldIndex(column[0]), Qt.Horizontal, column[1])
-
-    def resetDelegates(self):
-        for column in self._columns:
-            self._view.setItemDelegateForColumn(self.fieldIndex(column[0]), None)
 
     def configureView(self):
         self._view.setModel(self)
@@ -59,94 +77,22 @@ class ProfitLossReportModel(QSqlTableModel):
         self._begin = begin
         self._end = end
         self.calculateProfitLossReport()
-        self.configureView()
 
     def setAccount(self, account_id):
         self._account_id = account_id
         self.calculateProfitLossReport()
-        self.configureView()
 
     def calculateProfitLossReport(self):
         if self._account_id == 0:
             return
-        self._query = executeSQL(
-            "WITH "
-            "_months AS ("
-            "SELECT DISTINCT(l.asset_id) AS asset_id, m.m_start AS month, MAX(q.timestamp) AS last_timestamp "
-            "FROM ledger AS l "
-            "LEFT JOIN "
-            "(WITH RECURSIVE months(m_start) AS "
-            "( "
-            "  VALUES(CAST(strftime('%s', date(:begin, 'unixepoch', 'start of month')) AS INTEGER)) "
-            "  UNION ALL "
-            "  SELECT CAST(strftime('%s', date(m_start, 'unixepoch', '+1 month')) AS INTEGER) "
-            "  FROM months "
-            "  WHERE m_start < :end "
-            ") "
-            "SELECT m_start FROM months) AS m "
-            "LEFT JOIN quotes AS q ON q.timestamp<=m.m_start AND q.asset_id=l.asset_id "
-            "WHERE l.timestamp>=:begin AND l.timestamp<=:end AND l.account_id=:account_id "
-            "GROUP BY m.m_start, l.asset_id "
-            "ORDER BY m.m_start, l.asset_id ) "
-            "SELECT DISTINCT(m.month) AS period, coalesce(t.transfer, 0) AS transfer, coalesce(a.assets, 0) AS assets, "
-            "coalesce(p.result, 0) AS result, coalesce(o.profit, 0) AS profit, coalesce(d.dividend, 0) AS dividend, "
-            "coalesce(f.tax_fee, 0) AS tax_fee "
-            "FROM _months AS m "
-            "LEFT JOIN ( "
-            "  SELECT mt.month, SUM(-l.amount) AS transfer "
-            "  FROM _months AS mt "
-            "  LEFT JOIN ledger AS l ON mt.month = "
-            "  CAST(strftime('%s', date(l.timestamp, 'unixepoch', 'start of month')) AS INTEGER) "
-            "  AND mt.asset_id=l.asset_id "
-            "  WHERE l.book_account=:book_transfers AND l.account_id=:account_id GROUP BY mt.month "
-            ") AS t ON t.month = m.month "
-            "LEFT JOIN ( "
-            "  SELECT ma.month, SUM(l.amount*q.quote) AS assets "
-            "  FROM _months AS ma "
-            "  LEFT JOIN ledger AS l ON l.timestamp<=ma.month AND l.asset_id=ma.asset_id "
-            "  LEFT JOIN quotes AS q ON ma.last_timestamp=q.timestamp AND ma.asset_id=q.asset_id "
-            "  WHERE l.account_id =:account_id AND (l.book_account=:book_money OR l.book_account=:book_assets) "
-            "  GROUP BY ma.month "
-            ") AS a ON a.month = m.month "
-            "LEFT JOIN ( "
-            "  SELECT CAST(strftime('%s', date(l.timestamp, 'unixepoch', 'start of month')) AS INTEGER) AS month,"
-            "  SUM(-l.amount) as result"
-            "  FROM ledger AS l  "
-            "  WHERE (l.book_account=:book_costs OR l.book_account=:book_incomes) AND l.account_id=:account_id "
-            "  GROUP BY month "
-            ") AS p ON p.month = m.month "
-            "LEFT JOIN ( "
-            "  SELECT CAST(strftime('%s', date(l.timestamp, 'unixepoch', 'start of month')) "
-            "  AS INTEGER) AS month, SUM(-l.amount) as profit "
-            "  FROM ledger AS l "
-            "  WHERE (l.book_account=:book_costs OR l.book_account=:book_incomes) "
-            "  AND category_id=:category_profit AND l.account_id=:account_id "
-            "  GROUP BY month "
-            ") AS o ON o.month = m.month "
-            "LEFT JOIN ( "
-            "  SELECT CAST(strftime('%s', date(l.timestamp, 'unixepoch', 'start of month')) AS INTEGER) "
-            "  AS month, SUM(-l.amount) as dividend "
-            "  FROM ledger AS l "
-            "  WHERE (l.book_account=:book_costs OR l.book_account=:book_incomes) "
-            "  AND (l.category_id=:category_dividend OR l.category_id=:category_interest) AND l.account_id=:account_id "
-            "  GROUP BY month "
-            ") AS d ON d.month = m.month "
-            "LEFT JOIN ( "
-            "  SELECT CAST(strftime('%s', date(l.timestamp, 'unixepoch', 'start of month')) "
-            "  AS INTEGER) AS month, SUM(-l.amount) as tax_fee "
-            "  FROM ledger AS l "
-            "  WHERE l.book_account=:book_costs AND l.category_id<>:category_dividend "
-            "AND l.category_id<>:category_interest AND l.account_id=:account_id "
-            "  GROUP BY month "
-            ") AS f ON f.month = m.month",
-            [(":account_id", self._account_id), (":begin", self._begin), (":end", self._end),
-             (":book_costs", BookAccount.Costs), (":book_incomes", BookAccount.Incomes),
-             (":book_money", BookAccount.Money), (":book_assets", BookAccount.Assets),
-             (":book_transfers", BookAccount.Transfers), (":category_profit", PredefinedCategory.Profit),
-             (":category_dividend", PredefinedCategory.Dividends), (":category_interest", PredefinedCategory.Interest)],
-            forward_only=False)
-        self.setQuery(self._query)
-        self.modelReset.emit()
+        self.calculate(profit_loss_series, self._account_id, self._begin, self._end)
+
+    # Keeps series that were calculated by report task for later use if they are still valid
+    def onFinished(self, result):
+        super().onFinished(result)
+        if result is not None:
+            account_id, months, series, version = result
+            AccountValuation(account_id).store(months, series, version=version)
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -1,12 +1,6 @@
-import os
-import logging
-import importlib
-
 from PySide6.QtWidgets import QFileDialog, QMessageBox
 from PySide6.QtCore import Qt, QObject
-from jal.constants import Setup
-from jal.db.helpers import get_app_path
-from jal.data_export.xlsx import XLSX
+from jal.plugins import PluginManifest, plugin_class
 
 
 class Reports(QObject):
@@ -19,30 +13,12 @@ class Reports(QObject):
         self.loadReportsList()
 
     def loadReportsList(self):
-        reports_folder = get_app_path() + Setup.REPORT_PATH
-        report_modules = [filename[:-3] for filename in os.listdir(reports_folder) if filename.endswith(".py")]
-        for module_name in report_modules:
-            logging.debug(f"Trying to load report module: {module_name}")
-            module = importlib.import_module(f"jal.reports.{module_name}")
-            try:
-                report_class_name = getattr(module, "JAL_REPORT_CLASS")
-            except AttributeError:
-                continue
-            try:
-                class_instance = getattr(module, report_class_name)
-            except AttributeError:
-                logging.error(self.tr("Report class can't be loaded: ") + report_class_name)
-                continue
-            report = class_instance()
-            self.items.append({'name': report.name, 'module': module, 'window_class': report.window_class})
-            logging.debug(f"Report class '{report_class_name}' providing '{report.name}' report has been loaded")
-        self.items = sorted(self.items, key=lambda item: item['name'])
+        self.items = PluginManifest().items(PluginManifest.REPORTS)
 
     # method is called directly from menu, so it contains QAction that was triggered
     def show(self, action):
         report_loader = self.items[action.data()]
-        module = report_loader['module']
-        class_instance = getattr(module, report_loader['window_class'])
+        class_instance = plugin_class(report_loader['module'], report_loader['window_class'])
         report = class_instance(self.mdi)
         self.mdi.addSubWindow(report, maximized=True)
 
@@ -58,6 +34,7 @@ class Reports(QObject):
         else:
             return
 
+        from jal.data_export.xlsx import XLSX
         report = XLSX(filename)
         # sheet = report.add_report_sheet(self.tr("Report"))
         #
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+################################################################################
+## Form generated from reading UI file 'performance_report.ui'
+##
+## Created by: Qt User Interface Compiler version 6.5.3
+##
+## WARNING! All changes made in this file will be lost when recompiling UI file!
+################################################################################
+
+from PySide6.QtCore import (QCoreApplication, QDate, QDateTime, QLocale,
+    QMetaObject, QObject, QPoint, QRect,
+    QSize, QTime, QUrl, Qt)
+from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
+    QFont, QFontDatabase, QGradient, QIcon,
+    QImage, QKeySequence, QLinearGradient, QPainter,
+    QPalette, QPixmap, QRadialGradient, QTransform)
+from PySide6.QtWidgets import (QAbstractItemView, QApplication, QFrame, QHBoxLayout,
+    QHeaderView, QLabel, QSizePolicy, QSpacerItem,
+    QTableView, QVBoxLayout, QWidget)
+
+from jal.widgets.account_select import (AccountButton, CurrencyComboBox)
+from jal.widgets.date_range_selector import DateRangeSelector
+
+class Ui_PerformanceReportWidget(object):
+    def setupUi(self, PerformanceReportWidget):
+        if not PerformanceReportWidget.objectName():
+            PerformanceReportWidget.setObjectName(u"PerformanceReportWidget")
+        PerformanceReportWidget.resize(648, 301)
+        self.verticalLayout = QVBoxLayout(PerformanceReportWidget)
+        self.verticalLayout.setSpacing(0)
+        self.verticalLayout.setObjectName(u"verticalLayout")
+        self.verticalLayout.setContentsMargins(0, 0, 0, 0)
+        self.ReportParamsFrame = QFrame(PerformanceReportWidget)
+        self.ReportParamsFrame.setObjectName(u"ReportParamsFrame")
+        self.ReportParamsFrame.setFrameShape(QFrame.Panel)
+        self.ReportParamsFrame.setFrameShadow(QFrame.Sunken)
+        self.horizontalLayout = QHBoxLayout(self.ReportParamsFrame)
+        self.horizontalLayout.setSpacing(6)
+        self.horizontalLayout.setObjectName(u"horizontalLayout")
+        self.horizontalLayout.setContentsMargins(2, 2, 2, 2)
+        self.ReportRange = DateRangeSelector(self.ReportParamsFrame)
+        self.ReportRange.setObjectName(u"ReportRange")
+        self.ReportRange.setProperty("ItemsList", u"QTD;YTD;this_year;last_year")
+
+        self.horizontalLayout.addWidget(self.ReportRange)
+
+        self.ReportAccountLbl = QLabel(self.ReportParamsFrame)
+        self.ReportAccountLbl.setObjectName(u"ReportAccountLbl")
+
+        self.horizontalLayout.addWidget(self.ReportAccountLbl)
+
+        self.ReportAccountBtn = AccountButton(self.ReportParamsFrame)
+        self.ReportAccountBtn.setObjectName(u"ReportAccountBtn")
+
+        self.horizontalLayout.addWidget(self.ReportAccountBtn)
+
+        self.ReportCurrencyLbl = QLabel(self.ReportParamsFrame)
+        self.ReportCurrencyLbl.setObjectName(u"ReportCurrencyLbl")
+
+        self.horizontalLayout.addWidget(self.ReportCurrencyLbl)
+
+        self.ReportCurrencyCombo = CurrencyComboBox(self.ReportParamsFrame)
+        self.ReportCurrencyCombo.setObjectName(u"ReportCurrencyCombo")
+
+        self.horizontalLayout.addWidget(self.ReportCurrencyCombo)
+
+        self.ReportFrameSpacer = QSpacerItem(40, 20, QSizePolicy.Expanding, QSizePolicy.Minimum)
+
+        self.horizontalLayout.addItem(self.ReportFrameSpacer)
+
+        self.MoneyWeightedReturnLbl = QLabel(self.ReportParamsFrame)
+        self.MoneyWeightedReturnLbl.setObjectName(u"MoneyWeightedReturnLbl")
+
+        self.horizontalLayout.addWidget(self.MoneyWeightedReturnLbl)
+
+
+        self.verticalLayout.addWidget(self.ReportParamsFrame)
+
+        self.ReportTableView = QTableView(PerformanceReportWidget)
+        self.ReportTableView.setObjectName(u"ReportTableView")
+        self.ReportTableView.setFrameShape(QFrame.Panel)
+        self.ReportTableView.setFrameShadow(QFrame.Sunken)
+        self.ReportTableView.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.ReportTableView.setAlternatingRowColors(True)
+        self.ReportTableView.setGridStyle(Qt.DotLine)
+        self.ReportTableView.setWordWrap(False)
+        self.ReportTableView.verticalHeader().setVisible(False)
+        self.ReportTableView.verticalHeader().setMinimumSectionSize(20)
+        self.ReportTableView.verticalHeader().setDefaultSectionSize(20)
+
+        self.verticalLayout.addWidget(self.ReportTableView)
+
+
+        self.retranslateUi(PerformanceReportWidget)
+
+        QMetaObject.connectSlotsByName(PerformanceReportWidget)
+    # setupUi
+
+    def retranslateUi(self, PerformanceReportWidget):
+        PerformanceReportWidget.setWindowTitle(QCoreApplication.translate("PerformanceReportWidget", u"Performance", None))
+        self.ReportAccountLbl.setText(QCoreApplication.translate("PerformanceReportWidget", u"Account:", None))
+        self.ReportCurrencyLbl.setText(QCoreApplication.translate("PerformanceReportWidget", u"Currency:", None))
+        self.MoneyWeightedReturnLbl.setText("")
+    # retranslateUi
+
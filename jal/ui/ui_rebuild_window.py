@@ -82,11 +82,10 @@ class Ui_ReBuildDialog(object):
 
         self.verticalLayout.addWidget(self.TypeGroup)
 
-        self.FastAndDirty = QCheckBox(ReBuildDialog)
-        self.FastAndDirty.setObjectName(u"FastAndDirty")
-        self.FastAndDirty.setChecked(True)
+        self.Parallel = QCheckBox(ReBuildDialog)
+        self.Parallel.setObjectName(u"Parallel")
 
-        self.verticalLayout.addWidget(self.FastAndDirty)
+        self.verticalLayout.addWidget(self.Parallel)
 
         self.DialogButtonBox = QDialogButtonBox(ReBuildDialog)
         self.DialogButtonBox.setObjectName(u"DialogButtonBox")
@@ -113,6 +112,6 @@ class Ui_ReBuildDialog(object):
         self.FrontierDateLabel.setText(QCoreApplication.translate("ReBuildDialog", u"FrontierDate", None))
         self.DateRadionButton.setText(QCoreApplication.translate("ReBuildDialog", u"Since &Date:", None))
         self.CustomDateEdit.setDisplayFormat(QCoreApplication.translate("ReBuildDialog", u"dd/MM/yyyy", None))
-        self.FastAndDirty.setText(QCoreApplication.translate("ReBuildDialog", u"Fast, &unreliable", None))
+        self.Parallel.setText(QCoreApplication.translate("ReBuildDialog", u"&Parallel, by accounts", None))
     # retranslateUi
 
@@ -0,0 +1,53 @@
+BEGIN TRANSACTION;
+--------------------------------------------------------------------------------
+PRAGMA foreign_keys = 0;
+--------------------------------------------------------------------------------
+-- Cache of monthly account valuation
+DROP TABLE IF EXISTS valuation_series;
+CREATE TABLE valuation_series (
+    id         INTEGER PRIMARY KEY
+                       UNIQUE
+                       NOT NULL,
+    account_id INTEGER NOT NULL
+                       REFERENCES accounts (id) ON DELETE CASCADE
+                                                ON UPDATE CASCADE,
+    period     INTEGER NOT NULL,
+    transfer   REAL    NOT NULL,
+    assets     REAL    NOT NULL,
+    result     REAL    NOT NULL,
+    profit     REAL    NOT NULL,
+    dividend   REAL    NOT NULL,
+    tax_fee    REAL    NOT NULL
+);
+DROP INDEX IF EXISTS valuation_series_by_account_period;
+CREATE UNIQUE INDEX valuation_series_by_account_period ON valuation_series (account_id, period);
+--------------------------------------------------------------------------------
+DROP TRIGGER IF EXISTS quotes_after_delete;
+CREATE TRIGGER quotes_after_delete
+      AFTER DELETE ON quotes
+      FOR EACH ROW
+BEGIN
+    DELETE FROM valuation_series WHERE period >= OLD.timestamp;
+END;
+
+DROP TRIGGER IF EXISTS quotes_after_insert;
+CREATE TRIGGER quotes_after_insert
+      AFTER INSERT ON quotes
+      FOR EACH ROW
+BEGIN
+    DELETE FROM valuation_series WHERE period >= NEW.timestamp;
+END;
+
+DROP TRIGGER IF EXISTS quotes_after_update;
+CREATE TRIGGER quotes_after_update
+      AFTER UPDATE OF timestamp, asset_id, quote ON quotes
+      FOR EACH ROW
+BEGIN
+    DELETE FROM valuation_series WHERE period >= OLD.timestamp OR period >= NEW.timestamp;
+END;
+--------------------------------------------------------------------------------
+PRAGMA foreign_keys = 1;
+--------------------------------------------------------------------------------
+-- Set new DB schema version
+UPDATE settings SET value=32 WHERE name='SchemaVersion';
+COMMIT;
@@ -0,0 +1,78 @@
+BEGIN TRANSACTION;
+--------------------------------------------------------------------------------
+PRAGMA foreign_keys = 0;
+--------------------------------------------------------------------------------
+DELETE FROM ledger;  -- to rebuild all as deals are re-created
+--------------------------------------------------------------------------------
+-- Keep fees, profit and corporate action flag of deals calculated by ledger
+DROP TABLE deals;
+CREATE TABLE deals (
+    id              INTEGER PRIMARY KEY
+                            UNIQUE
+                            NOT NULL,
+    account_id      INTEGER NOT NULL,
+    asset_id        INTEGER NOT NULL,
+    open_op_type    INTEGER NOT NULL,
+    open_op_id      INTEGER NOT NULL,
+    open_timestamp  INTEGER NOT NULL,
+    open_price      REAL    NOT NULL,
+    close_op_type   INTEGER NOT NULL,
+    close_op_id     INTEGER NOT NULL,
+    close_timestamp INTEGER NOT NULL,
+    close_price     REAL    NOT NULL,
+    qty             REAL    NOT NULL,
+    open_fee        REAL    NOT NULL
+                            DEFAULT (0),
+    close_fee       REAL    NOT NULL
+                            DEFAULT (0),
+    profit          REAL    NOT NULL
+                            DEFAULT (0),
+    rel_profit      REAL    NOT NULL
+                            DEFAULT (0),
+    corp_action     INTEGER
+);
+
+DROP INDEX IF EXISTS deals_by_account_close;
+CREATE INDEX deals_by_account_close ON deals (account_id, close_timestamp);
+
+CREATE TRIGGER on_deal_delete
+         AFTER DELETE
+            ON deals
+    FOR EACH ROW
+    WHEN (SELECT value FROM settings WHERE id = 1)
+BEGIN
+    UPDATE open_trades
+       SET remaining_qty = remaining_qty + OLD.qty
+     WHERE op_type=OLD.open_op_type AND operation_id=OLD.open_op_id AND account_id=OLD.account_id AND asset_id = OLD.asset_id;
+END;
+--------------------------------------------------------------------------------
+-- deals_ext view only decodes names now
+DROP VIEW IF EXISTS deals_ext;
+CREATE VIEW deals_ext AS
+    SELECT d.account_id,
+           ac.name AS account,
+           d.asset_id,
+           at.name AS asset,
+           open_timestamp,
+           close_timestamp,
+           open_price,
+           close_price,
+           d.qty AS qty,
+           d.open_fee + d.close_fee AS fee,
+           d.profit,
+           d.rel_profit,
+           d.corp_action
+    FROM deals AS d
+          -- "Decode" account and asset
+           LEFT JOIN accounts AS ac ON d.account_id = ac.id
+           LEFT JOIN assets AS at ON d.asset_id = at.id
+     -- drop cases where deal was opened and closed with corporate action
+     WHERE NOT (d.open_op_type = 5 AND d.close_op_type = 5)
+     ORDER BY close_timestamp, open_timestamp;
+--------------------------------------------------------------------------------
+PRAGMA foreign_keys = 1;
+--------------------------------------------------------------------------------
+-- Set new DB schema version
+UPDATE settings SET value=33 WHERE name='SchemaVersion';
+INSERT OR REPLACE INTO settings(id, name, value) VALUES (7, 'RebuildDB', 1);
+COMMIT;
@@ -0,0 +1,13 @@
+BEGIN TRANSACTION;
+--------------------------------------------------------------------------------
+PRAGMA foreign_keys = 0;
+--------------------------------------------------------------------------------
+-- Index for as-of quote lookups
+DROP INDEX IF EXISTS quotes_by_asset_timestamp;
+CREATE INDEX quotes_by_asset_timestamp ON quotes (asset_id, timestamp);
+--------------------------------------------------------------------------------
+PRAGMA foreign_keys = 1;
+--------------------------------------------------------------------------------
+-- Set new DB schema version
+UPDATE settings SET value=34 WHERE name='SchemaVersion';
+COMMIT;
@@ -0,0 +1,14 @@
+BEGIN TRANSACTION;
+--------------------------------------------------------------------------------
+PRAGMA foreign_keys = 0;
+--------------------------------------------------------------------------------
+-- Scratch tables aren't used anymore - reports keep intermediate data in memory
+DROP TABLE IF EXISTS t_last_assets;
+DROP TABLE IF EXISTS t_last_dates;
+DROP TABLE IF EXISTS t_last_quotes;
+--------------------------------------------------------------------------------
+PRAGMA foreign_keys = 1;
+--------------------------------------------------------------------------------
+-- Set new DB schema version
+UPDATE settings SET value=35 WHERE name='SchemaVersion';
+COMMIT;
@@ -0,0 +1,25 @@
+BEGIN TRANSACTION;
+--------------------------------------------------------------------------------
+PRAGMA foreign_keys = 0;
+--------------------------------------------------------------------------------
+-- Indices that allow to read operations from every table in time order (used by ledger rebuild)
+DROP INDEX IF EXISTS action_details_by_pid;
+CREATE INDEX action_details_by_pid ON action_details (pid);
+DROP INDEX IF EXISTS actions_by_timestamp;
+CREATE INDEX actions_by_timestamp ON actions (timestamp);
+DROP INDEX IF EXISTS dividends_by_timestamp;
+CREATE INDEX dividends_by_timestamp ON dividends (timestamp);
+DROP INDEX IF EXISTS corp_actions_by_timestamp;
+CREATE INDEX corp_actions_by_timestamp ON corp_actions (timestamp);
+DROP INDEX IF EXISTS trades_by_timestamp;
+CREATE INDEX trades_by_timestamp ON trades (timestamp);
+DROP INDEX IF EXISTS transfers_by_withdrawal;
+CREATE INDEX transfers_by_withdrawal ON transfers (withdrawal_timestamp);
+DROP INDEX IF EXISTS transfers_by_deposit;
+CREATE INDEX transfers_by_deposit ON transfers (deposit_timestamp);
+--------------------------------------------------------------------------------
+PRAGMA foreign_keys = 1;
+--------------------------------------------------------------------------------
+-- Set new DB schema version
+UPDATE settings SET value=36 WHERE name='SchemaVersion';
+COMMIT;
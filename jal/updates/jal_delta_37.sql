@@ -0,0 +1,24 @@
+BEGIN TRANSACTION;
+--------------------------------------------------------------------------------
+PRAGMA foreign_keys = 0;
+--------------------------------------------------------------------------------
+-- MOEX engine, market, board and security id of assets to download quotes without asset lookup
+DROP TABLE IF EXISTS asset_moex_id;
+CREATE TABLE asset_moex_id (
+    asset_id  INTEGER      PRIMARY KEY
+                           UNIQUE
+                           NOT NULL
+                           REFERENCES assets (id) ON DELETE CASCADE
+                                                  ON UPDATE CASCADE,
+    secid     VARCHAR (20) NOT NULL,
+    engine    VARCHAR (20) NOT NULL,
+    market    VARCHAR (20) NOT NULL,
+    board     VARCHAR (20) NOT NULL,
+    timestamp INTEGER      NOT NULL
+);
+--------------------------------------------------------------------------------
+PRAGMA foreign_keys = 1;
+--------------------------------------------------------------------------------
+-- Set new DB schema version
+UPDATE settings SET value=37 WHERE name='SchemaVersion';
+COMMIT;
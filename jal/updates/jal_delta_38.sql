@@ -0,0 +1,47 @@
+BEGIN TRANSACTION;
+--------------------------------------------------------------------------------
+PRAGMA foreign_keys = 0;
+--------------------------------------------------------------------------------
+-- Version of cached valuation - it is changed every time when cached series are dropped
+INSERT INTO settings(name, value) SELECT 'ValuationVersion', 0
+WHERE NOT EXISTS(SELECT id FROM settings WHERE name='ValuationVersion');
+
+-- Cached valuation is dropped by period for all accounts
+DROP INDEX IF EXISTS valuation_series_by_period;
+CREATE INDEX valuation_series_by_period ON valuation_series (period);
+
+DROP TRIGGER IF EXISTS quotes_after_delete;
+CREATE TRIGGER quotes_after_delete
+      AFTER DELETE ON quotes
+      FOR EACH ROW
+      WHEN (SELECT value FROM settings WHERE id = 1)
+BEGIN
+    DELETE FROM valuation_series WHERE period >= OLD.timestamp;
+    UPDATE settings SET value=value+1 WHERE name='ValuationVersion';
+END;
+
+DROP TRIGGER IF EXISTS quotes_after_insert;
+CREATE TRIGGER quotes_after_insert
+      AFTER INSERT ON quotes
+      FOR EACH ROW
+      WHEN (SELECT value FROM settings WHERE id = 1)
+BEGIN
+    DELETE FROM valuation_series WHERE period >= NEW.timestamp;
+    UPDATE settings SET value=value+1 WHERE name='ValuationVersion';
+END;
+
+DROP TRIGGER IF EXISTS quotes_after_update;
+CREATE TRIGGER quotes_after_update
+      AFTER UPDATE OF timestamp, asset_id, quote ON quotes
+      FOR EACH ROW
+      WHEN (SELECT value FROM settings WHERE id = 1)
+BEGIN
+    DELETE FROM valuation_series WHERE period >= OLD.timestamp OR period >= NEW.timestamp;
+    UPDATE settings SET value=value+1 WHERE name='ValuationVersion';
+END;
+--------------------------------------------------------------------------------
+PRAGMA foreign_keys = 1;
+--------------------------------------------------------------------------------
+-- Set new DB schema version
+UPDATE settings SET value=38 WHERE name='SchemaVersion';
+COMMIT;
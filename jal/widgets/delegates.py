@@ -5,7 +5,7 @@ from PySide6.QtCore import Qt, QModelIndex, QEvent, QLocale, QDateTime, QDate, Q
 from PySide6.QtGui import QDoubleValidator, QBrush, QKeyEvent
 from jal.constants import CustomColor
 from jal.widgets.reference_selector import AssetSelector, PeerSelector, CategorySelector, TagSelector
-from jal.db.helpers import readSQL
+from jal.db.cache import reference_cache
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -242,8 +242,7 @@ class LookupSelectorDelegate(QStyledItemDelegate):
         QStyledItemDelegate.__init__(self, parent)
 
     def displayText(self, value, locale):
-        item_name = readSQL(f"SELECT {self._field} FROM {self._table} WHERE id=:id", [(":id", value)])
-        return item_name
+        return reference_cache().value(self._table, value, self._field)
 
     def createEditor(self, aParent, option, index):
         if self._type == self.Category:
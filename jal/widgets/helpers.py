@@ -1,3 +1,4 @@
+import importlib.util
 from datetime import time, datetime, timedelta, timezone
 from PySide6.QtCore import QCoreApplication
 
@@ -17,12 +18,14 @@ def decodeError(orginal_msg):
 
 # -----------------------------------------------------------------------------------------------------------------------
 # Returns True if all modules from module_list are present in the system
+# Modules are only searched but not imported in order not to slow down application start-up
 def dependency_present(module_list):
     result = True
     for module in module_list:
         try:
-            __import__(module)
-        except ImportError:
+            if importlib.util.find_spec(module) is None:
+                result = False
+        except (ImportError, ValueError):
             result = False
     return result
 
@@ -10,7 +10,6 @@ from PySide6.QtWidgets import QApplication, QMainWindow, QMessageBox, QProgressB
 from jal import __version__
 from jal.ui.ui_main_window import Ui_JAL_MainWindow
 from jal.widgets.operations_widget import OperationsWidget
-from jal.widgets.tax_widget import TaxWidget
 from jal.widgets.helpers import dependency_present
 from jal.widgets.reference_dialogs import AccountTypeListDialog, AccountListDialog, AssetListDialog, TagsListDialog,\
     CategoryListDialog, CountryListDialog, QuotesListDialog, PeerListDialog
@@ -19,11 +18,10 @@ from jal.db.backup_restore import JalBackup
 from jal.db.helpers import get_app_path, get_dbfilename, load_icon
 from jal.db.db import JalDB
 from jal.db.settings import JalSettings
-from jal.net.downloader import QuoteDownloader
 from jal.db.ledger import Ledger
 from jal.data_import.statements import Statements
+from jal.profiling import trace_span
 from jal.reports.reports import Reports
-from jal.data_import.slips import ImportSlipDialog
 
 
 #-----------------------------------------------------------------------------------------------------------------------
@@ -50,7 +48,8 @@ class MainWindow(QMainWindow, Ui_JAL_MainWindow):
 
         self.currentLanguage = language
 
-        self.downloader = QuoteDownloader()
+        self.downloader = None      # Downloader, tax and slip import widgets (with pandas and network stack behind them)
+        self.tax_widget = None      # are loaded on first use in order not to slow down application start-up
         self.statements = Statements(self)
         self.reports = Reports(self, self.mdiArea)
         self.backup = JalBackup(self, get_dbfilename(get_app_path()))
@@ -84,7 +83,7 @@ class MainWindow(QMainWindow, Ui_JAL_MainWindow):
         self.langGroup.triggered.connect(self.onLanguageChanged)
         self.statementGroup.triggered.connect(self.statements.load)
         self.reportsGroup.triggered.connect(self.reports.show)
-        self.action_LoadQuotes.triggered.connect(partial(self.downloader.showQuoteDownloadDialog, self))
+        self.action_LoadQuotes.triggered.connect(self.loadQuotes)
         self.actionImportSlipRU.triggered.connect(self.importSlip)
         self.actionBackup.triggered.connect(self.backup.create)
         self.actionRestore.triggered.connect(self.backup.restore)
@@ -97,9 +96,11 @@ class MainWindow(QMainWindow, Ui_JAL_MainWindow):
         self.actionTags.triggered.connect(partial(self.onDataDialog, "tags"))
         self.actionCountries.triggered.connect(partial(self.onDataDialog, "countries"))
         self.actionQuotes.triggered.connect(partial(self.onDataDialog, "quotes"))
-        self.PrepareTaxForms.triggered.connect(partial(self.mdiArea.addSubWindow, TaxWidget(self), maximized=True))
-        self.downloader.download_completed.connect(self.updateWidgets)
+        self.PrepareTaxForms.triggered.connect(self.showTaxWidget)
         self.ledger.updated.connect(self.updateWidgets)
+        self.statements.progress.connect(self.onStatementProgress)
+        self.statements.load_completed.connect(self.onStatementFinished)
+        self.statements.load_failed.connect(self.onStatementFinished)
         self.statements.load_completed.connect(self.onStatementImport)
 
     @Slot()
@@ -199,8 +200,24 @@ class MainWindow(QMainWindow, Ui_JAL_MainWindow):
         self.centralwidget.setEnabled(not visible)
         self.MainMenu.setEnabled(not visible)
 
+    @Slot()
+    def loadQuotes(self):
+        if self.downloader is None:
+            from jal.net.downloader import QuoteDownloader
+            self.downloader = QuoteDownloader()
+            self.downloader.download_completed.connect(self.updateWidgets)
+        self.downloader.showQuoteDownloadDialog(self)
+
+    @Slot()
+    def showTaxWidget(self):
+        if self.tax_widget is None:
+            from jal.widgets.tax_widget import TaxWidget
+            self.tax_widget = TaxWidget(self)
+        self.mdiArea.addSubWindow(self.tax_widget, maximized=True)
+
     @Slot()
     def importSlip(self):
+        from jal.data_import.slips import ImportSlipDialog
         dialog = ImportSlipDialog(self)
         dialog.finished.connect(self.onSlipImportFinished)
         dialog.open()
@@ -233,7 +250,22 @@ class MainWindow(QMainWindow, Ui_JAL_MainWindow):
     @Slot()
     def updateWidgets(self):
         for window in self.mdiArea.subWindowList():
-            window.widget().refresh()
+            with trace_span("MainWindow.refresh", widget=type(window.widget()).__name__):
+                window.widget().refresh()
+
+    # Shows stage of statement import in status bar with busy indicator, new import isn't allowed until completion
+    @Slot()
+    def onStatementProgress(self, text):
+        self.StatusBar.showMessage(text)
+        self.ProgressBar.setRange(0, 0)
+        self.ProgressBar.setVisible(True)
+        self.menuStatement.setEnabled(False)
+
+    @Slot()
+    def onStatementFinished(self):
+        self.StatusBar.clearMessage()
+        self.ProgressBar.setVisible(False)
+        self.menuStatement.setEnabled(True)
 
     @Slot()
     def onStatementImport(self, timestamp, totals):
@@ -1,6 +1,7 @@
 from math import log10, floor, ceil
 
-from PySide6.QtCore import Qt, QMargins, QDateTime
+import numpy as np
+from PySide6.QtCore import Qt, Slot, QMargins, QDateTime, QPointF
 from PySide6.QtWidgets import QWidget, QHBoxLayout
 from PySide6.QtCharts import QChartView, QLineSeries, QScatterSeries, QDateTimeAxis, QValueAxis
 from jal.db.db import JalDB
@@ -9,27 +10,70 @@ from jal.db.helpers import executeSQL, readSQL, readSQLrecord
 from jal.widgets.mdi import MdiWidget
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+# Reduces series (x, y) to 'threshold' points with Largest-Triangle-Three-Buckets algorithm: first and last points are
+# kept and from every bucket of points in between the point that forms the largest triangle with the point selected
+# from the previous bucket and the average of the next bucket is taken. Shape of the line (including local
+# extremes) is preserved so result looks the same if there are at least ~2 points per pixel.
+# Returns indices of selected points
+def lttb_indices(x, y, threshold):
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, size - 1, threshold - 1).astype(np.int64)    # buckets between first and last point
+    selected = np.zeros(threshold, dtype=np.int64)
+    selected[-1] = size - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x, next_y = x[end:edges[i + 2]].mean(), y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) -
+                      (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Returns numpy arrays of quote timestamps (in seconds) and values of given asset within [begin, end] interval
+def load_quotes(asset_id, begin, end):
+    quotes = []
+    query = executeSQL("SELECT timestamp, quote FROM quotes "
+                       "WHERE asset_id=:asset_id AND timestamp>:begin AND timestamp<=:end AND quote IS NOT NULL "
+                       "ORDER BY timestamp", [(":asset_id", asset_id), (":begin", begin), (":end", end)])
+    while query.next():
+        quotes.append(readSQLrecord(query))
+    return np.array([x[0] for x in quotes], dtype=np.int64), np.array([x[1] for x in quotes], dtype=np.float64)
+
+
 class ChartWidget(QWidget):
+    POINTS_PER_PIXEL = 2     # Density of downsampled quotes line that keeps it visually the same as original one
+
     def __init__(self, parent, quotes, trades, data_range, currency_name):
         QWidget.__init__(self, parent)
 
         self.quotes_series = QLineSeries()
-        for point in quotes:            # Conversion to 'float' in order not to get 'int' overflow on some platforms
-            self.quotes_series.append(float(point['timestamp']), point['quote'])
-
+        self.quotes = (np.array([], dtype=np.int64), np.array([]))   # Quotes line before downsampling
+        self.points = 0                                               # Number of points of downsampled line
         self.trade_series = QScatterSeries()
-        for point in trades:            # Conversion to 'float' in order not to get 'int' overflow on some platforms
-            self.trade_series.append(float(point['timestamp']), point['price'])
+        # Conversion to 'float' in order not to get 'int' overflow on some platforms, timestamps are shown in ms
+        self.trade_series.replace([QPointF(float(t) * 1000, float(p)) for t, p in zip(trades[0], trades[1])])
         self.trade_series.setMarkerSize(5)
         self.trade_series.setBorderColor(CustomColor.LightRed)
         self.trade_series.setBrush(CustomColor.DarkRed)
 
-        axisX = QDateTimeAxis()
-        axisX.setTickCount(11)
-        axisX.setRange(QDateTime().fromSecsSinceEpoch(data_range[0]), QDateTime().fromSecsSinceEpoch(data_range[1]))
-        axisX.setFormat("yyyy/MM/dd")
-        axisX.setLabelsAngle(-90)
-        axisX.setTitleText("Date")
+        self.axisX = QDateTimeAxis()
+        self.axisX.setTickCount(11)
+        self.axisX.setRange(QDateTime().fromSecsSinceEpoch(data_range[0]),
+                            QDateTime().fromSecsSinceEpoch(data_range[1]))
+        self.axisX.setFormat("yyyy/MM/dd")
+        self.axisX.setLabelsAngle(-90)
+        self.axisX.setTitleText("Date")
 
         axisY = QValueAxis()
         axisY.setTickCount(11)
@@ -37,14 +81,15 @@ class ChartWidget(QWidget):
         axisY.setTitleText("Price, " + currency_name)
 
         self.chartView = QChartView()
+        self.chartView.setRubberBand(QChartView.HorizontalRubberBand)   # Zoom in with mouse, right click to zoom out
         self.chartView.chart().addSeries(self.quotes_series)
         self.chartView.chart().addSeries(self.trade_series)
-        self.chartView.chart().addAxis(axisX, Qt.AlignBottom)
-        self.chartView.chart().setAxisX(axisX, self.quotes_series)
-        self.chartView.chart().setAxisX(axisX, self.trade_series)
+        self.chartView.chart().addAxis(self.axisX, Qt.AlignBottom)
+        self.quotes_series.attachAxis(self.axisX)
+        self.trade_series.attachAxis(self.axisX)
         self.chartView.chart().addAxis(axisY, Qt.AlignLeft)
-        self.chartView.chart().setAxisY(axisY, self.quotes_series)
-        self.chartView.chart().setAxisY(axisY, self.trade_series)
+        self.quotes_series.attachAxis(axisY)
+        self.trade_series.attachAxis(axisY)
         self.chartView.chart().legend().hide()
         self.chartView.setViewportMargins(0, 0, 0, 0)
         self.chartView.chart().layout().setContentsMargins(0, 0, 0, 0)  # To remove extra spacing around chart
@@ -56,6 +101,32 @@ class ChartWidget(QWidget):
         self.layout.addWidget(self.chartView)
         self.setLayout(self.layout)
 
+        self.setQuotes(*quotes)
+        self.chartView.chart().plotAreaChanged.connect(self.onPlotAreaChanged)
+
+    # Replaces all points of quotes line with given ones downsampled to the width of the chart
+    def setQuotes(self, timestamps, quotes):
+        self.quotes = (timestamps, quotes)
+        self.points = 0
+        self.showQuotes()
+
+    # Chart width is changed when widget is shown or resized - line is downsampled again for the new width
+    @Slot()
+    def onPlotAreaChanged(self, _plot_area):
+        self.showQuotes()
+
+    def showQuotes(self):
+        width = int(self.chartView.chart().plotArea().width())
+        if width <= 0:    # Chart isn't laid out yet, take widget width instead
+            width = max(self.chartView.width(), 1)
+        points = width * self.POINTS_PER_PIXEL
+        if points == self.points:
+            return
+        self.points = points
+        timestamps, quotes = self.quotes
+        idx = lttb_indices(timestamps, quotes, points)
+        self.quotes_series.replace([QPointF(float(t) * 1000, float(q)) for t, q in zip(timestamps[idx], quotes[idx])])
+
 
 class ChartWindow(MdiWidget):
     def __init__(self, account_id, asset_id, _asset_qty, parent=None):
@@ -64,14 +135,16 @@ class ChartWindow(MdiWidget):
         self.account_id = account_id
         self.asset_id = asset_id
         self.asset_name = JalDB().get_asset_name(self.asset_id)
-        self.quotes = []
-        self.trades = []
+        self.start_time = 0
+        self.quotes = (np.array([], dtype=np.int64), np.array([]))
+        self.trades = (np.array([], dtype=np.int64), np.array([]), np.array([]))
         self.currency_name = ''
         self.range = [0, 0, 0, 0]
 
         self.prepare_chart_data()
 
         self.chart = ChartWidget(self, self.quotes, self.trades, self.range, self.currency_name)
+        self.chart.axisX.rangeChanged.connect(self.onRangeChange)
 
         self.layout = QHBoxLayout(self)
         self.layout.setContentsMargins(0, 0, 0, 0)  # Remove extra space around layout
@@ -84,46 +157,52 @@ class ChartWindow(MdiWidget):
 
     def prepare_chart_data(self):
         self.currency_name = JalDB().get_asset_name(JalDB().get_account_currency(self.account_id))
-        start_time = readSQL("SELECT MAX(ts) FROM "  # Take either last "empty" timestamp
-                             "(SELECT coalesce(MAX(timestamp), 0) AS ts "
-                             "FROM ledger WHERE account_id=:account_id AND asset_id=:asset_id "
-                             "AND book_account=:assets_book AND amount_acc==0 "
-                             "UNION "  # or first timestamp where position started to appear
-                             "SELECT coalesce(MIN(timestamp), 0) AS ts "
-                             "FROM ledger WHERE account_id=:account_id AND asset_id=:asset_id "
-                             "AND book_account=:assets_book AND amount_acc!=0)",
-                             [(":account_id", self.account_id), (":asset_id", self.asset_id),
-                              (":assets_book", BookAccount.Assets)])
-        # Get quotes quotes
-        query = executeSQL("SELECT timestamp, quote FROM quotes WHERE asset_id=:asset_id AND timestamp>:last",
-                           [(":asset_id", self.asset_id), (":last", start_time)])
-        while query.next():
-            quote = readSQLrecord(query, named=True)
-            self.quotes.append({'timestamp': quote['timestamp'] * 1000, 'quote': quote['quote']})  # timestamp to ms
-        min_price = min([x['quote'] for x in self.quotes])
-        max_price = max([x['quote'] for x in self.quotes])
-        min_ts = min([x['timestamp'] for x in self.quotes]) / 1000
-        max_ts = max([x['timestamp'] for x in self.quotes]) / 1000
+        self.start_time = readSQL("SELECT MAX(ts) FROM "  # Take either last "empty" timestamp
+                                  "(SELECT coalesce(MAX(timestamp), 0) AS ts "
+                                  "FROM ledger WHERE account_id=:account_id AND asset_id=:asset_id "
+                                  "AND book_account=:assets_book AND amount_acc==0 "
+                                  "UNION "  # or first timestamp where position started to appear
+                                  "SELECT coalesce(MIN(timestamp), 0) AS ts "
+                                  "FROM ledger WHERE account_id=:account_id AND asset_id=:asset_id "
+                                  "AND book_account=:assets_book AND amount_acc!=0)",
+                                  [(":account_id", self.account_id), (":asset_id", self.asset_id),
+                                   (":assets_book", BookAccount.Assets)])
+        self.quotes = load_quotes(self.asset_id, self.start_time, np.iinfo(np.int64).max)
 
         # Get deals quotes
+        trades = []
         query = executeSQL("SELECT timestamp, price, qty FROM trades "
                            "WHERE account_id=:account_id AND asset_id=:asset_id AND timestamp>=:last",
-                           [(":account_id", self.account_id), (":asset_id", self.asset_id), (":last", start_time)])
+                           [(":account_id", self.account_id), (":asset_id", self.asset_id),
+                            (":last", self.start_time)])
         while query.next():
-            trade = readSQLrecord(query, named=True)
-            self.trades.append({'timestamp': trade['timestamp'] * 1000, 'price': trade['price'], 'qty': trade['qty']})
-        min_price = min(min_price, min([x['price'] for x in self.trades]))
-        max_price = max(max_price, max([x['price'] for x in self.trades]))
-        min_ts = min(min_ts, min([x['timestamp'] for x in self.trades]) / 1000)
-        max_ts = max(max_ts, max([x['timestamp'] for x in self.trades]) / 1000)
+            trades.append(readSQLrecord(query))
+        self.trades = (np.array([x[0] for x in trades], dtype=np.int64),
+                       np.array([x[1] for x in trades], dtype=np.float64),
+                       np.array([x[2] for x in trades], dtype=np.float64))
+
+        timestamps = np.concatenate([self.quotes[0], self.trades[0]])
+        prices = np.concatenate([self.quotes[1], self.trades[1]])
+        if not timestamps.size:
+            return
+        min_price, max_price = float(prices.min()), float(prices.max())
+        min_ts, max_ts = int(timestamps.min()), int(timestamps.max())
 
         # Round min/max values to near "round" values in order to have 10 nice intervals
-        step = 10 ** floor(log10(max_price - min_price))
-        min_price = floor(min_price / step) * step
-        max_price = ceil(max_price / step) * step
+        if max_price > min_price:
+            step = 10 ** floor(log10(max_price - min_price))
+            min_price = floor(min_price / step) * step
+            max_price = ceil(max_price / step) * step
 
         # Add a gap at the beginning and end
         min_ts = int(min_ts - 86400 * 3)
         max_ts = int(max_ts + 86400 * 3)
 
         self.range = [min_ts, max_ts, min_price, max_price]
+
+    # Quotes of visible range are downsampled again on zoom in order to show them with more details
+    @Slot()
+    def onRangeChange(self, begin, end):
+        first = np.searchsorted(self.quotes[0], begin.toSecsSinceEpoch(), side='left')
+        last = np.searchsorted(self.quotes[0], end.toSecsSinceEpoch(), side='right')
+        self.chart.setQuotes(self.quotes[0][first:last], self.quotes[1][first:last])
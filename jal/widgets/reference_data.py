@@ -7,6 +7,7 @@ from PySide6.QtWidgets import QDialog, QMessageBox, QMenu, QWidgetAction, QLabel
 from jal.ui.ui_reference_data_dlg import Ui_ReferenceDataDialog
 from jal.widgets.helpers import decodeError
 from jal.db.helpers import load_icon
+from jal.db.cache import reference_cache
 
 
 # --------------------------------------------------------------------------------------------------------------
@@ -105,6 +106,8 @@ class ReferenceDataDialog(QDialog, Ui_ReferenceDataDialog):
     # Overload ancestor method to activate/deactivate filters for table view
     def exec(self, enable_selection=False, selected=0):
         self.selection_enabled = enable_selection
+        if self.tree_view:    # Tree model keeps data in memory so it should be re-loaded as data might be changed
+            self.model.select()
         self.setFilter()
         if enable_selection:
             self.locateItem(selected)
@@ -176,6 +179,7 @@ class ReferenceDataDialog(QDialog, Ui_ReferenceDataDialog):
                     return
             logging.fatal(self.tr("Submit failed: ") + decodeError(self.model.lastError().text()))
             return
+        reference_cache().invalidate(self.model.tableName())
         self.CommitBtn.setEnabled(False)
         self.RevertBtn.setEnabled(False)
 
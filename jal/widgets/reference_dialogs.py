@@ -1,7 +1,8 @@
 from PySide6.QtCore import Qt, QAbstractItemModel, QModelIndex
 from PySide6.QtSql import QSqlTableModel, QSqlRelationalTableModel, QSqlRelation, QSqlRelationalDelegate
 from PySide6.QtWidgets import QHeaderView
-from jal.db.helpers import db_connection, executeSQL, readSQL
+from jal.db.helpers import db_connection, executeSQL, readSQL, readSQLrecord
+from jal.db.cache import reference_cache
 from jal.widgets.delegates import TimestampDelegate, BoolDelegate, FloatDelegate, \
     PeerSelectorDelegate, AssetSelectorDelegate
 from jal.widgets.reference_data import ReferenceDataDialog
@@ -307,6 +308,11 @@ class AssetListDialog(ReferenceDataDialog):
 
 
 # ----------------------------------------------------------------------------------------------------------------------
+# Tree model of a table that has 'id' and 'pid' (parent id) fields. Whole table is loaded into memory by select() and
+# all model requests are served from there: records are kept in self._nodes (id -> record dictionary) and children
+# ids of every node are kept in self._children (pid -> list of ids ordered by id).
+# Modifications are written into DB (inside a transaction that is finished by submitAll() / revertAll()) and applied
+# to in-memory tree at the same time.
 class SqlTreeModel(QAbstractItemModel):
     ROOT_PID = 0
 
@@ -320,47 +326,72 @@ class SqlTreeModel(QAbstractItemModel):
         self._view = parent_view
         self._default_name = "name"
         self._stretch = None
+        self._nodes = None
+        self._children = {}
+        self._rows = {}      # id -> row number of the node among its siblings
         # This is auxiliary 'plain' model of the same table - to be given as QCompleter source of data
         self._completion_model = QSqlTableModel(parent=parent_view, db=db_connection())
         self._completion_model.setTable(self._table)
         self._completion_model.select()
 
+    # Returns SQL query that gives all records of the tree (or one record if 'single' is True)
+    def selectQuery(self, single=False):
+        return f"SELECT * FROM {self._table}" + (" WHERE id=:id" if single else "")
+
+    # (Re-)loads whole tree from DB
+    def select(self):
+        self.beginResetModel()
+        self._nodes = {}
+        self._children = {}
+        self._rows = {}
+        query = executeSQL(self.selectQuery() + " ORDER BY id")
+        while query.next():
+            self._addNode(readSQLrecord(query, named=True))
+        self.endResetModel()
+
+    def _tree(self):
+        if self._nodes is None:
+            self.select()
+        return self._nodes
+
+    def _addNode(self, record):
+        self._nodes[record['id']] = record
+        siblings = self._children.setdefault(record['pid'], [])
+        self._rows[record['id']] = len(siblings)
+        siblings.append(record['id'])
+
+    # Returns list of ids of the node and all its children
+    def _subtree(self, node_id):
+        ids = [node_id]
+        for child_id in self._children.get(node_id, []):
+            ids += self._subtree(child_id)
+        return ids
+
+    def _childrenOf(self, parent):
+        parent_id = parent.internalId() if parent.isValid() else self.ROOT_PID
+        self._tree()
+        return parent_id, self._children.get(parent_id, [])
+
     def index(self, row, column, parent=None):
         if parent is None:
             return QModelIndex()
-        if not parent.isValid():
-            parent_id = self.ROOT_PID
-        else:
-            parent_id = parent.internalId()
-        child_id = readSQL(f"SELECT id FROM {self._table} WHERE pid=:pid LIMIT 1 OFFSET :row_n",
-                           [(":pid", parent_id), (":row_n", row)])
-        if child_id:
-            return self.createIndex(row, column, id=child_id)
+        _parent_id, children = self._childrenOf(parent)
+        if 0 <= row < len(children):
+            return self.createIndex(row, column, id=children[row])
         return QModelIndex()
 
     def parent(self, index):
         if not index.isValid():
             return QModelIndex()
-        child_id = index.internalId()
-        parent_id = readSQL(f"SELECT pid FROM {self._table} WHERE id=:id", [(":id", child_id)])
+        parent_id = self._tree()[index.internalId()]['pid']
         if parent_id == self.ROOT_PID:
             return QModelIndex()
-        row = readSQL(f"SELECT row_number FROM ("
-                      f"SELECT ROW_NUMBER() OVER (ORDER BY id) AS row_number, id, pid "
-                      f"FROM {self._table} WHERE pid IN (SELECT pid FROM {self._table} WHERE id=:id)) "
-                      f"WHERE id=:id", [(":id", parent_id)])
-        return self.createIndex(row-1, 0, id=parent_id)
+        return self.createIndex(self._rows[parent_id], 0, id=parent_id)
 
     def rowCount(self, parent=None):
-        if not parent.isValid():
-            parent_id = self.ROOT_PID
-        else:
-            parent_id = parent.internalId()
-        count = readSQL(f"SELECT COUNT(id) FROM {self._table} WHERE pid=:pid", [(":pid", parent_id)])
-        if count:
-            return int(count)
-        else:
+        if parent.isValid() and parent.column() > 0:
             return 0
+        return len(self._childrenOf(parent)[1])
 
     def columnCount(self, parent=None):
         return len(self._columns)
@@ -373,11 +404,10 @@ class SqlTreeModel(QAbstractItemModel):
     def data(self, index, role=Qt.DisplayRole):
         if not index.isValid():
             return None
-        item_id = index.internalId()
         if role == Qt.DisplayRole:
             col = index.column()
             if (col >= 0) and (col < len(self._columns)):
-                return readSQL(f"SELECT {self._columns[col][0]} FROM {self._table} WHERE id=:id", [(":id", item_id)])
+                return self._tree()[index.internalId()].get(self._columns[col][0])
             else:
                 return None
         return None
@@ -392,6 +422,7 @@ class SqlTreeModel(QAbstractItemModel):
         db_connection().transaction()
         _ = executeSQL(f"UPDATE {self._table} SET {self._columns[col][0]}=:value WHERE id=:id",
                        [(":id", item_id), (":value", value)])
+        self._tree()[item_id][self._columns[col][0]] = value
         self.dataChanged.emit(index, index, Qt.DisplayRole | Qt.EditRole)
         return True
 
@@ -429,45 +460,50 @@ class SqlTreeModel(QAbstractItemModel):
             self.getFieldValue(item_id, self._default_name)
 
     def getFieldValue(self, item_id, field_name):
-        return readSQL(f"SELECT {field_name} FROM {self._table} WHERE id=:id", [(":id", item_id)])
-
-    def deleteWithChilderen(self, parent_id: int) -> None:
-        query = executeSQL(f"SELECT id FROM {self._table} WHERE pid=:pid", [(":pid", parent_id)])
-        while query.next():
-            self.deleteWithChilderen(query.value(0))
-        _ = executeSQL(f"DELETE FROM {self._table} WHERE id=:id", [(":id", parent_id)])
+        record = self._tree().get(item_id)
+        if record is None or field_name not in record:
+            return readSQL(f"SELECT {field_name} FROM {self._table} WHERE id=:id", [(":id", item_id)])
+        return record[field_name]
 
     def insertRows(self, row, count, parent=None):
         if parent is None:
             return False
-        if not parent.isValid():
-            parent_id = self.ROOT_PID
-        else:
-            parent_id = parent.internalId()
+        parent_id, children = self._childrenOf(parent)
 
-        self.beginInsertRows(parent, row, row + count - 1)
+        # New records have the biggest ids so they are always added at the end of the parent's children list
+        self.beginInsertRows(parent, len(children), len(children) + count - 1)
         db_connection().transaction()
-        _ = executeSQL(f"INSERT INTO {self._table}(pid, name) VALUES (:pid, '')", [(":pid", parent_id)])
+        for i in range(count):
+            query = executeSQL(f"INSERT INTO {self._table}(pid, name) VALUES (:pid, '')", [(":pid", parent_id)])
+            record = readSQL(self.selectQuery(single=True), [(":id", query.lastInsertId())], named=True)
+            self._addNode(record)
         self.endInsertRows()
-        self.layoutChanged.emit()
         return True
 
     def removeRows(self, row, count, parent=None):
         if parent is None:
             return False
-        if not parent.isValid():
-            parent_id = self.ROOT_PID
-        else:
-            parent_id = parent.internalId()
+        parent_id, children = self._childrenOf(parent)
+        if row < 0 or row + count > len(children):
+            return False
 
-        self.beginRemoveRows(parent, row, row + count - 1)
+        removed = [x for item_id in children[row:row + count] for x in self._subtree(item_id)]
         db_connection().transaction()
-        query = executeSQL(f"SELECT id FROM {self._table} WHERE pid=:pid LIMIT :row_c OFFSET :row_n",
-                           [(":pid", parent_id), (":row_c", count), (":row_n", row)])
-        while query.next():
-            self.deleteWithChilderen(query.value(0))
+        deleted = True
+        for item_id in reversed(removed):   # children are deleted before parents
+            deleted = deleted and executeSQL(f"DELETE FROM {self._table} WHERE id=:id", [(":id", item_id)]) is not None
+        if not deleted:   # Some records are still in DB - tree should be re-loaded to reflect actual state
+            self.select()
+            return True
+        self.beginRemoveRows(parent, row, row + count - 1)
+        for item_id in removed:
+            self._children.pop(item_id, None)
+            del self._nodes[item_id]
+            del self._rows[item_id]
+        del children[row:row + count]
+        for i, item_id in enumerate(children):
+            self._rows[item_id] = i
         self.endRemoveRows()
-        self.layoutChanged.emit()
         return True
 
     def addElement(self, index, in_group=0):  # in_group is used for plain model only, not tree
@@ -484,12 +520,12 @@ class SqlTreeModel(QAbstractItemModel):
 
     def submitAll(self):
         _ = executeSQL("COMMIT")
-        self.layoutChanged.emit()
         return True
 
     def revertAll(self):
         _ = executeSQL("ROLLBACK")
-        self.layoutChanged.emit()
+        reference_cache().invalidate(self._table)
+        self.select()
 
     # expand all parent elements for tree element with given index
     def expand_parent(self, index):
@@ -500,13 +536,9 @@ class SqlTreeModel(QAbstractItemModel):
 
     # find item by ID and make it selected in associated self._view
     def locateItem(self, item_id):
-        row = readSQL(f"SELECT row_number FROM ("
-                      f"SELECT ROW_NUMBER() OVER (ORDER BY id) AS row_number, id, pid "
-                      f"FROM {self._table} WHERE pid IN (SELECT pid FROM {self._table} WHERE id=:id)) "
-                      f"WHERE id=:id", [(":id", item_id)])
-        if row is None:
+        if item_id not in self._tree():
             return
-        item_idx = self.createIndex(row-1, 0, id=item_id)
+        item_idx = self.createIndex(self._rows[item_id], 0, id=item_id)
         self.expand_parent(item_idx)
         self._view.setCurrentIndex(item_idx)
 
@@ -524,17 +556,9 @@ class PeerTreeModel(SqlTreeModel):
         self._int_delegate = None
         self._grid_delegate = None
 
-    def data(self, index, role=Qt.DisplayRole):
-        if not index.isValid():
-            return None
-        item_id = index.internalId()
-        if role == Qt.DisplayRole:
-            if index.column() == 2:
-                return readSQL("SELECT COUNT(d.id) FROM agents AS p "
-                               "LEFT JOIN actions AS d ON d.peer_id=p.id WHERE p.id=:id", [(":id", item_id)])
-            else:
-                return super().data(index, role)
-        return None
+    def selectQuery(self, single=False):
+        return "SELECT p.*, COUNT(d.id) AS actions_count FROM agents AS p " \
+               "LEFT JOIN actions AS d ON d.peer_id=p.id" + (" WHERE p.id=:id" if single else "") + " GROUP BY p.id"
 
     def configureView(self):
         super().configureView()
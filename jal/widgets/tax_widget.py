@@ -7,7 +7,7 @@ from PySide6.QtWidgets import QFileDialog
 from jal.ui.ui_tax_export_widget import Ui_TaxWidget
 from jal.widgets.mdi import MdiWidget
 from jal.data_export.taxes import TaxesRus
-from jal.data_export.xlsx import XLSX
+from jal.data_export.tax_batch import tax_report_parameters, save_tax_report
 from jal.data_export.dlsg import DLSG
 
 
@@ -80,29 +80,8 @@ class TaxWidget(MdiWidget, Ui_TaxWidget):
         taxes = TaxesRus()
         tax_report = taxes.prepare_tax_report(self.year, self.account, use_settlement=(not self.no_settelement))
 
-        reports_xls = XLSX(self.xls_filename)
-        templates = {
-            "Дивиденды": "tax_rus_dividends.json",
-            "Акции": "tax_rus_trades.json",
-            "Облигации": "tax_rus_bonds.json",
-            "ПФИ": "tax_rus_derivatives.json",
-            "Корп.события": "tax_rus_corporate_actions.json",
-            "Комиссии": "tax_rus_fees.json",
-            "Проценты": "tax_rus_interests.json"
-        }
-        parameters = {
-            "period": f"{datetime.utcfromtimestamp(taxes.year_begin).strftime('%d.%m.%Y')}"
-                      f" - {datetime.utcfromtimestamp(taxes.year_end - 1).strftime('%d.%m.%Y')}",
-            "account": f"{taxes.account_number} ({taxes.account_currency})",
-            "currency": taxes.account_currency,
-            "broker_name": taxes.broker_name,
-            "broker_iso_country": taxes.broker_iso_cc
-        }
-        for section in tax_report:
-            if section not in templates:
-                continue
-            reports_xls.output_data(tax_report[section], templates[section], parameters)
-        reports_xls.save()
+        parameters = tax_report_parameters(taxes)
+        save_tax_report(self.xls_filename, tax_report, parameters)
 
         logging.info(self.tr("Tax report saved to file ") + f"'{self.xls_filename}'")
 
@@ -37,9 +37,9 @@ setup(
         "Operating System :: OS Independent",
         "Programming Language :: Python"
     ],
-    install_requires=["lxml", "pandas", "PySide6>=6.2.0", "requests", "XlsxWriter", "jsonschema"],
+    install_requires=["lxml", "numpy", "pandas", "PySide6>=6.2.0", "requests", "XlsxWriter", "jsonschema"],
     entry_points={
-        'console_scripts': ['jal=jal.jal:main', ]
+        'console_scripts': ['jal=jal.jal:main', 'jal-cli=jal.cli:main']
     },
     include_package_data=True,
     package_data={
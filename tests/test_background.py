@@ -0,0 +1,36 @@
+from PySide6.QtCore import QCoreApplication, QEventLoop, QTimer
+
+from tests.fixtures import project_root, data_path, prepare_db, prepare_db_fifo
+from jal.constants import Setup
+from jal.db.background import ReportRunner, fetch_rows
+from jal.db.helpers import executeSQL, readSQLrecord
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_report_runner(monkeypatch, prepare_db_fifo):
+    app = QCoreApplication.instance() or QCoreApplication([])
+    monkeypatch.setattr(Setup, 'REPORT_CHUNK_SIZE', 2)
+    expected = []
+    query = executeSQL("SELECT id, name FROM assets ORDER BY id")
+    while query.next():
+        expected.append(tuple(readSQLrecord(query)))
+    assert len(expected) > 2
+
+    runner = ReportRunner()
+    portions = []
+    results = []
+    busy = []
+    loop = QEventLoop()
+    runner.busy.connect(busy.append)
+    runner.portion.connect(lambda columns, rows: portions.append((columns, rows)))
+    runner.finished.connect(results.append)
+    runner.finished.connect(loop.quit)
+    runner.submit(fetch_rows, "SELECT id FROM assets WHERE id<0", [])    # this request is superseded by next one
+    runner.submit(fetch_rows, "SELECT id, name FROM assets ORDER BY id", [])
+    QTimer.singleShot(5000, loop.quit)
+    loop.exec()
+
+    assert results == [len(expected)]       # Only the last request is reported
+    assert busy[0] and not busy[-1] and not runner.isBusy()
+    assert all([columns == ['id', 'name'] and len(rows) <= 2 for columns, rows in portions])
+    assert [row for _columns, rows in portions for row in rows] == expected
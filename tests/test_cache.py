@@ -0,0 +1,35 @@
+from tests.fixtures import project_root, data_path, prepare_db, prepare_db_fifo
+from tests.helpers import create_stocks
+from constants import PredefinedAsset
+from jal.db.settings import JalSettings
+from jal.db.db import JalDB
+from jal.db.cache import reference_cache, modified_table
+from jal.db.helpers import executeSQL
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_reference_cache(prepare_db_fifo):
+    assert modified_table("INSERT OR REPLACE INTO settings(id, name, value) VALUES (1, 'a', 1)") == 'settings'
+    assert modified_table(" update Assets SET name='X'") == 'assets'
+    assert modified_table("DELETE FROM ledger WHERE timestamp>=0") == 'ledger'
+    assert modified_table("SELECT * FROM assets") is None
+
+    create_stocks([(4, 'A', 'A SHARE')])
+    assert JalDB().get_asset_name(4) == 'A'
+    assert JalDB().get_asset_type(4) == PredefinedAsset.Stock
+    assert JalDB().get_account_currency(1) == 2
+    assert JalDB().get_account_name(1) == 'Inv. Account'
+    assert reference_cache().record('assets', 4)['full_name'] == 'A SHARE'
+
+    # Modification of any reference table drops cached copy of it
+    assert executeSQL("UPDATE assets SET name='B' WHERE id=4") is not None
+    assert JalDB().get_asset_name(4) == 'B'
+    assert executeSQL("UPDATE accounts SET currency_id=1 WHERE id=1") is not None
+    assert JalDB().get_account_currency(1) == 1
+    assert JalDB().get_asset_name(5) is None
+    create_stocks([(5, 'C', 'C SHARE')])
+    assert JalDB().get_asset_name(5) == 'C'
+
+    assert JalSettings().getValue('CacheTest', 'none') == 'none'
+    JalSettings().setValue('CacheTest', 'value')
+    assert JalSettings().getValue('CacheTest') == 'value'
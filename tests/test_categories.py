@@ -0,0 +1,94 @@
+import os
+from PySide6.QtCore import QModelIndex
+
+from tests.fixtures import project_root, data_path, prepare_db
+from constants import Setup
+from jal.db.helpers import executeSQL, readSQL
+from jal.widgets.reference_dialogs import CategoryTreeModel, PeerTreeModel
+from jal.data_import.category_recognizer import CategoryClassifier, recognize_categories, model_path
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_category_recognition(prepare_db):
+    mappings = [
+        ("Молоко 3,2% 1л", 5), ("Молоко ультрапастеризованное 950мл", 5), ("Кефир 1% 900 гр", 5),
+        ("Хлеб бородинский 400г", 5), ("Батон нарезной", 5),
+        ("Бензин АИ-95", 6), ("Бензин АИ-92 (40 x 52.10)", 6), ("Дизельное топливо", 6),
+        ("Парацетамол 500мг 20шт", 8), ("Ибупрофен таблетки 200мг", 8)
+    ]
+    for value, category in mappings:
+        assert executeSQL("INSERT INTO map_category (value, mapped_to) VALUES (:value, :category)",
+                          [(":value", value), (":category", category)], commit=True) is not None
+
+    categories, probabilities = recognize_categories(["Молоко пастеризованное 2,5% 1л", "Бензин АИ-95 (30 x 50)",
+                                                      "Ибупрофен 400мг 10шт"])
+    assert categories == [5, 6, 8]
+    assert all([0.5 < x <= 1 for x in probabilities])
+
+    # Model is saved and re-used while mappings are the same
+    model = CategoryClassifier.load(model_path(Setup.CATEGORY_MODEL))
+    assert model is not None
+    assert model.last_id == len(mappings)
+    assert sorted(model.categories) == [5, 6, 8]
+    assert model.samples.sum() == len(mappings)
+
+    # New mapping is added to existing model
+    assert executeSQL("INSERT INTO map_category (value, mapped_to) VALUES ('Сок яблочный 1л', 7)", commit=True)
+    categories, _probabilities = recognize_categories(["Сок яблочный"])
+    assert categories == [7]
+    model = CategoryClassifier.load(model_path(Setup.CATEGORY_MODEL))
+    assert model.last_id == len(mappings) + 1
+    assert model.samples.sum() == len(mappings) + 1
+
+    # Model is re-trained from scratch if existing mappings are changed
+    assert executeSQL("DELETE FROM map_category WHERE mapped_to=8", commit=True) is not None
+    categories, _probabilities = recognize_categories(["Ибупрофен 400мг 10шт"])
+    assert categories != [8]
+    model = CategoryClassifier.load(model_path(Setup.CATEGORY_MODEL))
+    assert sorted(model.categories) == [5, 6, 7]
+    assert model.samples.sum() == len(mappings) - 1
+
+    os.remove(model_path(Setup.CATEGORY_MODEL))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_category_tree_model(prepare_db):
+    model = CategoryTreeModel("categories", None)
+
+    def check_tree(parent=QModelIndex()):   # Compares in-memory tree with DB, returns number of nodes
+        parent_id = parent.internalId() if parent.isValid() else 0
+        children = readSQL("SELECT COUNT(id) FROM categories WHERE pid=:pid", [(":pid", parent_id)])
+        assert model.rowCount(parent) == children
+        count = 0
+        for row in range(children):
+            index = model.index(row, 0, parent)
+            assert model.parent(index) == parent
+            assert model.data(index) == readSQL("SELECT name FROM categories WHERE id=:id",
+                                                [(":id", index.internalId())])
+            count += 1 + check_tree(index)
+        return count
+
+    total = readSQL("SELECT COUNT(id) FROM categories")
+    assert check_tree() == total
+
+    parent = model.index(1, 0, QModelIndex())
+    model.insertRows(0, 1, parent)
+    child = model.index(model.rowCount(parent) - 1, 0, parent)
+    assert model.setData(child, "New category")
+    assert model.submitAll()
+    assert check_tree() == total + 1
+    assert model.getFieldValue(child.internalId(), "name") == "New category"
+
+    model.removeRows(child.row(), 1, parent)
+    assert check_tree() == total
+    model.revertAll()
+    assert check_tree() == total + 1
+
+    peers = PeerTreeModel("agents", None)
+    assert executeSQL("INSERT INTO agents (pid, name) VALUES (0, 'Shop'), (0, 'Bank')") is not None
+    assert executeSQL("INSERT INTO accounts (type_id, name, currency_id, active) VALUES (1, 'Wallet', 1, 1)") is not None
+    assert executeSQL("INSERT INTO actions (timestamp, account_id, peer_id) "
+                      "VALUES (1604221200, 1, 1), (1604221300, 1, 1)") is not None
+    peers.select()
+    assert peers.rowCount(QModelIndex()) == 2
+    assert [peers.data(peers.index(row, peers.fieldIndex("actions_count"), QModelIndex())) for row in range(2)] == [2, 0]
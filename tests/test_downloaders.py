@@ -2,9 +2,12 @@ import pandas as pd
 from datetime import datetime
 from pandas._testing import assert_frame_equal
 
-from tests.fixtures import project_root, data_path, prepare_db, prepare_db_moex
-from jal.db.helpers import readSQL
-from jal.constants import PredefinedAsset
+from tests.fixtures import project_root, data_path, prepare_db, prepare_db_moex, prepare_db_fifo
+from tests.helpers import create_stocks, create_quotes, create_trades
+from jal.db.helpers import readSQL, executeSQL
+from jal.constants import PredefinedAsset, MarketDataFeed
+from jal.db.ledger import Ledger
+from jal.db.valuation import AccountValuation, valuation_version
 from jal.net.helpers import isEnglish
 from jal.net.downloader import QuoteDownloader
 from jal.data_import.slips_tax import SlipsTaxAPI
@@ -122,6 +125,51 @@ def test_MOEX_downloader(prepare_db_moex):
 
     quotes_downloaded = downloader.MOEX_DataReader(8, 'ЗПИФ ПНК', 'RU000A1013V9', 1639353600, 1639440000, update_symbol=False)
     assert_frame_equal(etf_quotes, quotes_downloaded)
+    assert readSQL("SELECT secid, engine, market, board FROM asset_moex_id WHERE asset_id=6") == \
+           ['SU26238RMFS4', 'stock', 'bonds', 'TQOB']
+    assert readSQL("SELECT secid, engine, market, board FROM asset_moex_id WHERE asset_id=7") == \
+           ['RU000A1014H6', 'stock', 'bonds', 'TQCB']
+    assert readSQL("SELECT COUNT(*) FROM asset_moex_id WHERE asset_id=8") == 0
+
+def test_MOEX_stored_security(monkeypatch, prepare_db_moex):
+    history = "<document><data id='history'><rows>" \
+              "<row TRADEDATE='2021-04-13' CLOSE='287.95'/><row TRADEDATE='2021-04-14' CLOSE='287.18'/>" \
+              "</rows></data></document>"
+    requests = []
+    def web_data(url):
+        requests.append(url)
+        return history
+    monkeypatch.setattr("jal.net.downloader.get_web_data", web_data)
+    now = int(datetime.now().timestamp())
+    assert executeSQL("INSERT INTO asset_moex_id (asset_id, secid, engine, market, board, timestamp) "
+                      "VALUES (4, 'SBER', 'stock', 'shares', 'TQBR', :now)", [(":now", now)]) is not None
+
+    quotes_downloaded = QuoteDownloader().MOEX_DataReader(4, 'SBER', 'RU0009029540', 1618272000, 1618358400)
+    assert requests == ["http://iss.moex.com/iss/history/engines/stock/markets/shares/boards/TQBR/securities/SBER.xml"
+                        "?from=2021-04-13&till=2021-04-14"]
+    assert list(quotes_downloaded['Close']) == [287.95, 287.18]
+
+def test_quotes_update_valuation(monkeypatch, prepare_db_fifo):
+    create_stocks([(4, 'A', 'A SHARE')])
+    create_quotes(2, [(1609459200, 70.0)])
+    create_quotes(4, [(1609459200, 90.0)])
+    create_trades(1, [(1609567200, 1609653600, 4, 10.0, 100.0, 1.0)])
+    assert executeSQL("UPDATE assets SET src_id=:feed WHERE id=4", [(":feed", MarketDataFeed.US)]) is not None
+    Ledger().rebuild(from_timestamp=0)
+    AccountValuation(1).update(1609459200, 1614556800)
+    assert readSQL("SELECT COUNT(*) FROM valuation_series") == 3
+
+    quotes = pd.DataFrame({'Close': [150.0, 160.0], 'Date': [datetime(2021, 2, 1), datetime(2021, 2, 2)]})
+    monkeypatch.setattr(QuoteDownloader, "PrepareRussianCBReader", lambda self: None)
+    monkeypatch.setattr(QuoteDownloader, "CBR_DataReader", lambda self, *args: None)
+    monkeypatch.setattr(QuoteDownloader, "Yahoo_Downloader", lambda self, *args: quotes.set_index('Date'))
+    version = valuation_version()
+    QuoteDownloader().UpdateQuotes(1612137600, 1612310400)
+    assert readSQL("SELECT COUNT(*) FROM quotes WHERE asset_id=4") == 3
+    assert readSQL("SELECT COUNT(*) FROM valuation_series") == 1    # Dropped once since the first new quote
+    assert readSQL("SELECT period FROM valuation_series") == 1609459200
+    assert valuation_version() == version + 1
+    assert readSQL("SELECT value FROM settings WHERE name='TriggersEnabled'") == 1
 
 def test_Yahoo_downloader():
     quotes = pd.DataFrame({'Close': [134.429993, 132.029999],
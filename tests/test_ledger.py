@@ -1,11 +1,20 @@
+import os
+import json
+import threading
 from pytest import approx
 
 from tests.fixtures import project_root, data_path, prepare_db, prepare_db_fifo, prepare_db_ledger
 from tests.helpers import create_stocks, create_actions, create_trades, create_quotes, \
-    create_corporate_actions, create_stock_dividends
+    create_corporate_actions, create_stock_dividends, create_dividends
 from constants import TransactionType, BookAccount
-from jal.db.ledger import Ledger
-from jal.db.helpers import readSQL, executeSQL, readSQLrecord
+from jal.constants import Setup
+from jal.db.ledger import Ledger, LedgerAmounts, OperationsStream
+from jal.db.operations_model import OperationsModel
+from jal.db.settings import JalSettings
+from jal.db.valuation import AccountValuation, valuation_version
+from jal.db.helpers import readSQL, executeSQL, readSQLrecord, SqlProfiler, sql_profiler_start, sql_profiler_stop, \
+    sql_profiler_dump, db_connection, read_connection, release_read_connection
+from jal.profiling import trace_start, trace_stop, trace_span
 
 
 #-----------------------------------------------------------------------------------------------------------------------
@@ -347,3 +356,313 @@ def test_fifo(prepare_db_fifo):
         else:
             assert row['amount_acc'] == 0
         assert row['value_acc'] == 0
+
+
+def test_valuation(prepare_db_fifo):
+    create_stocks([(4, 'A', 'A SHARE')])
+    create_quotes(2, [(1609459200, 70.0)])
+    create_quotes(4, [(1609459200, 90.0), (1612137600, 150.0)])
+    create_trades(1, [(1609567200, 1609653600, 4, 10.0, 100.0, 1.0), (1609729200, 1609815600, 4, -7.0, 200.0, 5.0)])
+
+    ledger = Ledger()
+    ledger.rebuild(from_timestamp=0)
+
+    # period, transfer, assets, result, profit, dividend, tax_fee
+    expected_series = [
+        [1609459200, 0.0, 700000.0, 694.0, 700.0, 0.0, -6.0],
+        [1612137600, 0.0, 728030.0, 0.0, 0.0, 0.0, 0.0]
+    ]
+    months = AccountValuation(1).update(1609459200, 1612137600)
+    assert months == [1609459200, 1612137600]
+    query = executeSQL("SELECT period, transfer, assets, result, profit, dividend, tax_fee FROM valuation_series "
+                       "WHERE account_id=1 ORDER BY period")
+    series = []
+    while query.next():
+        series.append(readSQLrecord(query))
+    assert len(series) == len(expected_series)
+    for row, expected_row in zip(series, expected_series):
+        assert row == approx(expected_row)
+
+    # New quote should drop cached valuation for months after it
+    create_quotes(2, [(1612137600, 75.0)])
+    assert readSQL("SELECT COUNT(*) FROM valuation_series") == 1
+    AccountValuation(1).update(1609459200, 1612137600)
+    assert readSQL("SELECT assets FROM valuation_series WHERE period=1612137600") == approx(780000.0)
+
+    # Series calculated before data modification shouldn't be stored after it
+    version = valuation_version()
+    series = AccountValuation(1).calculate([1609459200, 1612137600])
+    create_quotes(2, [(1612137600, 80.0)])
+    assert valuation_version() != version
+    assert not AccountValuation(1).store([1609459200, 1612137600], series, version=version)
+    assert readSQL("SELECT COUNT(*) FROM valuation_series") == 1
+    version = valuation_version()
+    ledger.rebuild(from_timestamp=0)
+    assert valuation_version() != version
+    assert AccountValuation(1).store([1609459200, 1612137600], series, version=valuation_version())
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_sql_profiler(tmp_path, monkeypatch, prepare_db_fifo):
+    create_stocks([(4, 'A', 'A SHARE')])
+    create_trades(1, [(1609567200, 1609653600, 4, 10.0, 100.0, 1.0), (1609653600, 1609740000, 4, -5.0, 110.0, 1.0)])
+
+    log_file = str(tmp_path) + os.sep + "sql.log"
+    monkeypatch.setattr(Setup, "SQL_SLOW_QUERY_TIME", 0)     # Log every query as slow one
+    profiler = sql_profiler_start(log_file)
+    ledger = Ledger()
+    ledger.rebuild(from_timestamp=0)
+    assert readSQL("SELECT COUNT(*) FROM deals WHERE account_id=1") == 1
+    sql_profiler_dump()
+    assert sql_profiler_stop() == profiler
+
+    ledger_insert = [x for x in profiler.stats if x.startswith("INSERT INTO ledger")]
+    assert ledger_insert
+    assert profiler.stats[ledger_insert[0]][SqlProfiler.CALLS] > 0
+    deals_count = profiler.stats["SELECT COUNT(*) FROM deals WHERE account_id=1"]
+    assert deals_count[SqlProfiler.CALLS] == 1 and deals_count[SqlProfiler.ROWS] == 1
+    with open(log_file, 'r', encoding='utf-8') as log:
+        text = log.read()
+    assert "Slow SQL" in text and "Query plan:" in text and "SQL profile summary" in text
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_trace(tmp_path, prepare_db_fifo):
+    create_stocks([(4, 'A', 'A SHARE')])
+    create_trades(1, [(1609567200, 1609653600, 4, 10.0, 100.0, 1.0), (1609653600, 1609740000, 4, -5.0, 110.0, 1.0)])
+
+    trace_file = str(tmp_path) + os.sep + "trace.json"
+    tracer = trace_start(trace_file)
+    with trace_span("test", case="rebuild") as attributes:
+        ledger = Ledger()
+        ledger.rebuild(from_timestamp=0)
+        attributes['deals'] = readSQL("SELECT COUNT(*) FROM deals WHERE account_id=1")
+    assert trace_stop() == tracer
+    with trace_span("ignored"):    # tracing is off
+        pass
+
+    with open(trace_file, 'r', encoding='utf-8') as json_file:
+        events = {x['name']: x for x in json.load(json_file)['traceEvents']}
+    assert set(events) == {"test", "Ledger.rebuild", "Ledger.updated"}
+    assert all([x['ph'] == 'X' for x in events.values()])
+    assert events['test']['args'] == {"case": "rebuild", "deals": 1}
+    rebuild = events['Ledger.rebuild']
+    assert events['test']['ts'] <= rebuild['ts'] and \
+           rebuild['ts'] + rebuild['dur'] <= events['test']['ts'] + events['test']['dur']
+    assert rebuild['args']['processTrade.count'] == 2
+    assert rebuild['args']['operations'] == sum([v for k, v in rebuild['args'].items() if k.endswith(".count")])
+    assert rebuild['args']['failed'] is False
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_parallel_rebuild(prepare_db_fifo):
+    assert executeSQL("INSERT INTO accounts (type_id, name, currency_id, active, number, organization_id) "
+                      "VALUES (4, 'Inv. Account 2', 2, 1, 'U1234567', 1)") is not None
+    create_actions([(1604221200, 2, 1, [(7, 5000.0)])])
+    create_stocks([(4, 'A', 'A SHARE'), (5, 'B', 'B SHARE')])
+    create_trades(1, [(1609567200, 1609653600, 4, 10.0, 100.0, 1.0), (1609653600, 1609740000, 5, 20.0, 50.0, 1.0),
+                      (1612245600, 1612332000, 4, -5.0, 110.0, 1.0), (1614664800, 1614751200, 5, -25.0, 60.0, 2.0)])
+    create_trades(2, [(1609567200, 1609653600, 4, 30.0, 100.0, 1.0), (1612245600, 1612332000, 4, -10.0, 90.0, 1.0),
+                      (1614664800, 1614751200, 4, -20.0, 120.0, 1.0)])
+    assert executeSQL("INSERT INTO transfers (withdrawal_timestamp, withdrawal_account, withdrawal, "
+                      "deposit_timestamp, deposit_account, deposit, fee_account, fee, asset) "
+                      "VALUES (1612000000, 1, 1000.0, 1612000000, 2, 1000.0, 1, 5.0, NULL)") is not None
+
+    tables = {
+        "ledger": "SELECT timestamp, op_type, operation_id, book_account, asset_id, account_id, amount, value, "
+                  "amount_acc, value_acc, peer_id, category_id, tag_id FROM ledger ORDER BY account_id, id",
+        "ledger_totals": "SELECT op_type, operation_id, timestamp, book_account, asset_id, account_id, amount_acc, "
+                         "value_acc FROM ledger_totals ORDER BY account_id, op_type, operation_id, book_account",
+        "deals": "SELECT account_id, asset_id, open_op_type, open_op_id, close_op_type, close_op_id, qty, "
+                 "open_fee, close_fee, profit, corp_action FROM deals ORDER BY account_id, id",
+        "open_trades": "SELECT timestamp, op_type, operation_id, account_id, asset_id, price, remaining_qty "
+                       "FROM open_trades ORDER BY account_id, timestamp, op_type, operation_id"
+    }
+
+    def ledger_state():
+        state = {}
+        for table in tables:
+            state[table] = []
+            query = executeSQL(tables[table])
+            while query.next():
+                state[table].append(readSQLrecord(query))
+        return state
+
+    ledger = Ledger()
+    ledger.rebuild(from_timestamp=0)
+    expected = ledger_state()
+    assert len(expected['deals']) == 4
+
+    ledger.rebuild(from_timestamp=0, parallel=True)
+    assert ledger_state() == expected
+    ledger.rebuild(from_timestamp=1612245600, parallel=True)    # state before frontier should be taken into account
+    assert ledger_state() == expected
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_rebuild_checkpoint(monkeypatch, prepare_db_fifo):
+    create_stocks([(4, 'A', 'A SHARE')])
+    create_trades(1, [(1609567200 + i * 86400, 1609653600 + i * 86400, 4, 10.0 if i % 2 == 0 else -5.0, 100.0 + i, 1.0)
+                      for i in range(10)])
+
+    def ledger_state():
+        state = []
+        for table in ["ledger", "ledger_totals", "deals", "open_trades"]:
+            query = executeSQL(f"SELECT * FROM {table} ORDER BY id")
+            while query.next():
+                state.append(readSQLrecord(query)[1:])
+        return state
+
+    ledger = Ledger()
+    ledger.rebuild(from_timestamp=0)
+    expected = ledger_state()
+    assert JalSettings().getValue('RebuildDB') == 0
+
+    monkeypatch.setattr(Setup, "REBUILD_CHUNK_SIZE", 3)
+    process_trade = Ledger.processTrade
+    trades = []
+
+    def failing_trade(self):
+        trades.append(self.current['id'])
+        if len(trades) == 8:
+            raise RuntimeError("Interrupted")
+        process_trade(self)
+
+    monkeypatch.setattr(Ledger, "processTrade", failing_trade)
+    ledger = Ledger()
+    ledger.rebuild(from_timestamp=0)    # Fails at 9th operation (1 action + 8 trades) after 2 committed chunks
+    assert JalSettings().getValue('RebuildDB') == 1
+    assert readSQL("SELECT COUNT(*) FROM ledger WHERE op_type=3 AND operation_id>5") == 0
+
+    trades.clear()
+    ledger = Ledger()
+    ledger.rebuild()                   # Continues from the 6th operation
+    assert trades == [6, 7, 8, 9, 10]
+    assert ledger_state() == expected
+    assert JalSettings().getValue('RebuildDB') == 0
+    assert JalSettings().getValue('RebuildCheckpoint') == ''
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_ledger_amounts_preload(prepare_db_fifo):
+    create_stocks([(4, 'A', 'A SHARE')])
+    create_trades(1, [(1609567200, 1609653600, 4, 10.0, 100.0, 1.0), (1609653600, 1609740000, 4, -5.0, 110.0, 1.0)])
+    ledger = Ledger()
+    ledger.rebuild(from_timestamp=0)
+    expected = readSQL("SELECT amount_acc, value_acc FROM ledger WHERE book_account=:assets ORDER BY id DESC LIMIT 1",
+                       [(":assets", BookAccount.Assets)])
+
+    amounts = LedgerAmounts()
+    assert amounts[(BookAccount.Assets, 1, 4)] == expected      # Value is read from DB
+    amounts.load()
+    assert amounts[(BookAccount.Assets, 1, 4)] == expected
+    assert amounts[(BookAccount.Money, 1, 2)][LedgerAmounts.AMOUNT] == approx(10000.0 - 1001.0 + 549.0)
+
+    # Partial rebuild takes all balances before the frontier with one query
+    profiler = sql_profiler_start()
+    ledger.rebuild(from_timestamp=1609653600)
+    sql_profiler_stop()
+    assert not [x for x in profiler.stats if "ORDER BY id DESC LIMIT 1" in x]
+    assert readSQL("SELECT amount_acc, value_acc FROM ledger WHERE book_account=:assets ORDER BY id DESC LIMIT 1",
+                   [(":assets", BookAccount.Assets)]) == expected
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_operations_stream(prepare_db_fifo):
+    assert executeSQL("INSERT INTO accounts (type_id, name, currency_id, active, number, organization_id) "
+                      "VALUES (4, 'Inv. Account 2', 2, 1, 'U1234567', 1)") is not None
+    create_stocks([(4, 'A', 'A SHARE'), (5, 'B', 'B SHARE')])
+    create_actions([(1609567200, 2, 1, [(7, 500.0)]), (1609567200, 1, 1, [(5, -10.0), (6, -20.0)])])
+    create_trades(1, [(1609567200, 1609653600, 4, 10.0, 100.0, 1.0), (1609567200, 1609653600, 5, -5.0, 50.0, 1.0),
+                      (1609653600, 1609740000, 4, -5.0, 110.0, 1.0)])
+    create_dividends([(1609567200, 1, 4, 10.0, 1.0, "Dividend"), (1609740000, 2, 4, 5.0, 0.0, "Dividend")])
+    create_corporate_actions(1, [(1609653600, 1, 4, 5.0, 5, 5.0, 1.0, "Symbol change")])
+    assert executeSQL("INSERT INTO transfers (withdrawal_timestamp, withdrawal_account, withdrawal, "
+                      "deposit_timestamp, deposit_account, deposit, fee_account, fee, asset) "
+                      "VALUES (1609567200, 1, 100.0, 1609653600, 2, 100.0, 1, 1.0, NULL), "
+                      "(1609567200, 2, 50.0, 1609567200, 1, 50.0, NULL, NULL, NULL)") is not None
+
+    for frontier, account_id in [(0, None), (1609653600, None), (0, 1), (1609567200, 2)]:
+        expected = []
+        sql_text = "SELECT type, id, timestamp, subtype, account, currency, asset, amount, category, price, " \
+                   "fee_tax, peer, tag FROM all_transactions WHERE timestamp >= :frontier"
+        params = [(":frontier", frontier)]
+        if account_id is not None:
+            sql_text += " AND account = :account_id"
+            params.append((":account_id", account_id))
+        query = executeSQL(sql_text, params)
+        while query.next():
+            expected.append(readSQLrecord(query, named=True))
+        operations = list(OperationsStream(frontier, account_id))
+        for operation in expected + operations:   # category of operation with several details is undefined in view
+            if operation['type'] == TransactionType.Action and abs(operation['subtype']) > 1:
+                operation['category'] = operation['tag'] = None
+        assert operations == expected
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_read_connection(prepare_db_fifo):
+    assert readSQL("PRAGMA journal_mode") == 'wal'
+    assert readSQL("SELECT COUNT(*) FROM agents") == 1
+
+    def reader(results):
+        db = read_connection()
+        assert read_connection().connectionName() == db.connectionName()    # the same connection for the thread
+        results.append(readSQL("SELECT COUNT(*) FROM agents", db=db))
+        results.append(executeSQL("INSERT INTO agents (pid, name) VALUES (0, 'Reader')", db=db))
+        release_read_connection()
+
+    # Reader sees last committed state of the database while writer has active transaction and can't write itself
+    db_connection().transaction()
+    assert executeSQL("INSERT INTO agents (pid, name) VALUES (0, 'Writer')") is not None
+    results = []
+    thread = threading.Thread(target=reader, args=(results,))
+    thread.start()
+    thread.join()
+    assert results == [1, None]
+    db_connection().commit()
+
+    results = []
+    thread = threading.Thread(target=reader, args=(results,))
+    thread.start()
+    thread.join()
+    assert results == [2, None]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_batch_operations(prepare_db_ledger):
+    actions = [
+        (1638349200, 1, 1, [(5, -100.0)]),
+        (1638352800, 1, 1, [(6, -30.0), (8, 55.0)]),
+        (1638356400, 1, 1, [(7, 84.0)])
+    ]
+    create_actions(actions)
+    assert executeSQL("INSERT INTO agents (pid, name) VALUES (0, 'Bank')") is not None
+    assert executeSQL("INSERT INTO tags (tag) VALUES ('Batch')") is not None
+    peer_id = readSQL("SELECT id FROM agents WHERE name='Bank'")
+    tag_id = readSQL("SELECT id FROM tags WHERE tag='Batch'")
+    ledger = Ledger()
+    ledger.rebuild(from_timestamp=0)
+
+    model = OperationsModel(None)
+    model.setDateRange(1638349200, 1638356400)
+    assert model.rowCount() == 3
+    rows = [row for row in range(3) if model.get_operation(row)[1] in [2, 3]]
+
+    # Ledger is invalidated once from the earliest modified operation and triggers are enabled back
+    assert model.recategorizeRows(rows, 9)
+    assert readSQL("SELECT COUNT(*) FROM action_details WHERE pid IN (2, 3) AND category_id=9") == 3
+    assert readSQL("SELECT MAX(timestamp) FROM ledger") < 1638352800
+    assert readSQL("SELECT value FROM settings WHERE name='TriggersEnabled'") == 1
+    assert model.retagRows(rows, tag_id)
+    assert readSQL("SELECT COUNT(*) FROM action_details WHERE tag_id=:tag", [(":tag", tag_id)]) == 3
+    assert model.changePeerRows(rows, peer_id)
+    assert readSQL("SELECT COUNT(*) FROM actions WHERE peer_id=:peer", [(":peer", peer_id)]) == 2
+
+    ledger.rebuild(from_timestamp=0)
+    assert model.deleteRows(rows)
+    assert model.rowCount() == 1
+    assert readSQL("SELECT COUNT(*) FROM actions") == 1
+    assert readSQL("SELECT COUNT(*) FROM action_details") == 1
+    assert readSQL("SELECT MAX(timestamp) FROM ledger") < 1638352800
+    assert readSQL("SELECT value FROM settings WHERE name='TriggersEnabled'") == 1
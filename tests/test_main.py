@@ -1,10 +1,12 @@
 import os
+import sys
+import subprocess
 from shutil import copyfile
 import sqlite3
 
 from tests.fixtures import project_root
 from constants import Setup
-from jal.db.helpers import init_and_check_db, get_dbfilename, LedgerInitError
+from jal.db.helpers import init_and_check_db, get_dbfilename, LedgerInitError, init_db_from_sql
 from jal.db.backup_restore import JalBackup
 
 
@@ -72,3 +74,77 @@ def test_backup_load(tmp_path, project_root):
 
     os.remove(target_path)  # Clean db init script
     os.remove(get_dbfilename(str(tmp_path) + os.sep))  # Clean db file
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_plugins_manifest(project_root):
+    import jal.widgets.reference_dialogs   # the same import order of widgets as application has
+    from jal.plugins import PluginManifest
+    assert PluginManifest.load() == PluginManifest.generate()   # Manifest file should match actual plugin modules
+
+    # Lists of reports and statements are loaded without import of plugin modules
+    script = "import sys\n" \
+             "from PySide6.QtWidgets import QApplication\n" \
+             "from jal.plugins import PluginManifest\n" \
+             "app = QApplication([])\n" \
+             "items = PluginManifest().items(PluginManifest.REPORTS) + " \
+             "PluginManifest().items(PluginManifest.STATEMENTS)\n" \
+             "assert len(items) == 11\n" \
+             "assert not [x for x in sys.modules if x.startswith('jal.reports.') or " \
+             "x.startswith('jal.data_import.broker_statements.')]\n" \
+             "assert 'pandas' not in sys.modules and 'xlsxwriter' not in sys.modules\n"
+    result = subprocess.run([sys.executable, "-c", script], cwd=project_root, capture_output=True, text=True,
+                            env=dict(os.environ, QT_QPA_PLATFORM="offscreen"))
+    assert result.returncode == 0, result.stderr
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_startup_imports(project_root):
+    # Main window is loaded without heavy dependencies that are required for imports, reports and downloads only
+    script = "import sys\n" \
+             "from jal.profiling import ImportProfiler\n" \
+             "profiler = ImportProfiler()\n" \
+             "profiler.start()\n" \
+             "import jal.widgets.main_window\n" \
+             "profiler.stop()\n" \
+             "assert 'jal.widgets.main_window' in [x[0] for x in profiler.timings]\n" \
+             "assert len(profiler.report(10)) == 11\n" \
+             "heavy = ['pandas', 'requests', 'jsonschema', 'lxml', 'xlsxwriter', 'PySide6.QtWebEngineCore']\n" \
+             "assert not [x for x in heavy if x in sys.modules], [x for x in heavy if x in sys.modules]\n"
+    result = subprocess.run([sys.executable, "-c", script], cwd=project_root, capture_output=True, text=True,
+                            env=dict(os.environ, QT_QPA_PLATFORM="offscreen"))
+    assert result.returncode == 0, result.stderr
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_cli(tmp_path, project_root):
+    databases = []
+    for name in ['first.sqlite', 'second.sqlite']:
+        databases.append(str(tmp_path) + os.sep + name)
+        init_db_from_sql(databases[-1], project_root + os.sep + 'jal' + os.sep + Setup.INIT_SCRIPT_PATH)
+        db = sqlite3.connect(databases[-1])
+        db.execute("INSERT INTO agents (pid, name) VALUES (0, 'Peer')")
+        db.execute("INSERT INTO accounts (type_id, name, currency_id, active, number, organization_id) "
+                   "VALUES (4, 'Account', 2, 1, 'N1', 1)")
+        db.execute("INSERT INTO actions (timestamp, account_id, peer_id) VALUES (1604221200, 1, 1)")
+        db.execute("INSERT INTO action_details (pid, category_id, amount, note) VALUES (1, 4, 100.0, '')")
+        db.commit()
+        db.close()
+
+    def run_cli(*args):
+        return subprocess.run([sys.executable, "-m", "jal.cli"] + list(args), cwd=project_root, capture_output=True,
+                              text=True, env=dict(os.environ, QT_QPA_PLATFORM="offscreen"))
+
+    result = run_cli("--db", databases[0], "--db", databases[1], "rebuild", "--full")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "first.sqlite: 100%" in result.stdout and "second.sqlite: 100%" in result.stdout
+    for database in databases:
+        db = sqlite3.connect(database)
+        assert db.execute("SELECT COUNT(*) FROM ledger").fetchone()[0] > 0
+        db.close()
+
+    result = run_cli("--db", databases[0], "import", "unknown", "statement.xml")
+    assert result.returncode == 1
+    assert "Unknown statement format 'unknown'" in result.stdout
+    result = run_cli("--db", str(tmp_path) + os.sep + "missing.sqlite", "rebuild")
+    assert result.returncode == 1
@@ -0,0 +1,43 @@
+from pytest import approx
+
+from tests.fixtures import project_root, data_path, prepare_db, prepare_db_fifo
+from tests.helpers import create_stocks, create_trades, create_quotes
+from jal.db.ledger import Ledger
+from jal.db.performance import PortfolioPerformance, quote_matrix, money_weighted_return
+from jal.db.helpers import executeSQL
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_portfolio_performance(prepare_db_fifo):
+    create_stocks([(4, 'A', 'A SHARE')])
+    create_quotes(4, [(1604307600, 100.0), (1604394000, 110.0)])
+    create_quotes(2, [(1604188800, 75.0)])
+    create_trades(1, [(1604307600, 1604307600, 4, 10.0, 100.0, 0.0)])
+    assert executeSQL("INSERT INTO accounts (type_id, name, currency_id, active, number, organization_id) "
+                      "VALUES (2, 'Bank', 2, 1, 'B1', 1)") is not None
+    assert executeSQL("INSERT INTO transfers (withdrawal_timestamp, withdrawal_account, withdrawal, deposit_timestamp, "
+                      "deposit_account, deposit) VALUES (1604484000, 2, 1000.0, 1604484000, 1, 1000.0)") is not None
+    assert executeSQL("INSERT INTO transfers (withdrawal_timestamp, withdrawal_account, withdrawal, deposit_timestamp, "
+                      "deposit_account, deposit, fee_account, fee) "
+                      "VALUES (1604484000, 1, 500.0, 1604484000, 2, 500.0, 1, 10.0)") is not None   # Fee is a cost
+    ledger = Ledger()
+    ledger.rebuild(from_timestamp=0)
+
+    quotes = quote_matrix([4, 2], [1604188800, 1604307600, 1604480400])
+    assert quotes[0, 0] != quotes[0, 0]     # NaN before the first quote
+    assert quotes[1:, 0].tolist() == [100.0, 110.0]
+    assert quotes[:, 1].tolist() == [75.0, 75.0, 75.0]
+
+    series = PortfolioPerformance([1], 2).calculate(1604221200, 1604484000)
+    assert series['day'].tolist() == [1604188800, 1604275200, 1604361600, 1604448000]
+    assert series['nav'].tolist() == approx([10000.0, 10000.0, 10100.0, 10590.0])
+    assert series['flow'].tolist() == approx([0.0, 0.0, 0.0, 500.0])
+    assert series['return'].tolist() == approx([0.0, 0.0, 0.01, 10590.0 / 10600.0 - 1])
+    assert series['twr'].tolist() == approx([0.0, 0.0, 0.01, 1.01 * 10590.0 / 10600.0 - 1])
+    mwr = money_weighted_return(series['day'], series['nav'], series['flow'])
+    assert 10000.0 * (1 + mwr) ** (3 / 365) + 500.0 * (1 + mwr) ** (1 / 365) == approx(10590.0)
+
+    # Values are converted with cross-rate of account currency
+    series = PortfolioPerformance([1], 1).calculate(1604221200, 1604484000)
+    assert series['nav'].tolist() == approx([750000.0, 750000.0, 757500.0, 794250.0])
+    assert series['twr'][-1] == approx(1.01 * 10590.0 / 10600.0 - 1)
@@ -0,0 +1,21 @@
+import numpy as np
+
+from tests.fixtures import project_root, data_path, prepare_db, prepare_db_fifo
+from tests.helpers import create_stocks, create_quotes
+from jal.widgets.price_chart import lttb_indices, load_quotes
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_price_downsampling(prepare_db_fifo):
+    create_stocks([(4, 'A', 'A SHARE')])
+    create_quotes(4, [(1604188800 + i * 86400, 100.0 + (i % 7) - (50.0 if i == 500 else 0.0)) for i in range(1000)])
+    timestamps, quotes = load_quotes(4, 1604188800 + 99 * 86400, 1604188800 + 999 * 86400)
+    assert len(timestamps) == len(quotes) == 900
+    assert timestamps[0] == 1604188800 + 100 * 86400 and quotes[0] == 102.0
+
+    idx = lttb_indices(timestamps, quotes, 100)
+    assert len(idx) == 100
+    assert idx[0] == 0 and idx[-1] == 899
+    assert (np.diff(idx) > 0).all()
+    assert 400 in idx     # Local extreme is always kept
+    assert lttb_indices(timestamps[:50], quotes[:50], 100).tolist() == list(range(50))
@@ -2,6 +2,7 @@ import json
 
 from tests.fixtures import project_root, data_path, prepare_db, prepare_db_ibkr, prepare_db_xls
 from data_import.broker_statements.ibkr import StatementIBKR
+from data_import.statements import parse_statement
 from data_import.broker_statements.uralsib import StatementUKFU
 from data_import.broker_statements.kit import StatementKIT
 from data_import.broker_statements.psb import StatementPSB
@@ -18,6 +19,17 @@ def test_statement_ibkr(tmp_path, project_root, data_path, prepare_db_ibkr):
     assert IBKR._data == statement
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+def test_statement_parse_worker(tmp_path, project_root, data_path, prepare_db_ibkr):
+    with open(data_path + 'ibkr.json', 'r') as json_file:
+        statement = json.load(json_file)
+
+    data, error, _records = parse_statement("data_import.broker_statements.ibkr", "StatementIBKR",
+                                            data_path + 'ibkr.xml')
+    assert error == ''
+    assert data == statement
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 def test_statement_uralsib(tmp_path, project_root, data_path, prepare_db_xls):
     with open(data_path + 'ukfu.json', 'r') as json_file:
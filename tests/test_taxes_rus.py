@@ -1,5 +1,7 @@
 import json
 import os
+import pandas
+import openpyxl
 
 from tests.fixtures import project_root, data_path, prepare_db, prepare_db_taxes
 from data_import.broker_statements.ibkr import StatementIBKR
@@ -8,6 +10,8 @@ from tests.helpers import create_assets, create_quotes, create_dividends, create
 from jal.db.ledger import Ledger
 from jal.data_export.taxes import TaxesRus
 from jal.data_export.xlsx import XLSX
+from jal.data_export.tax_batch import export_tax_reports, save_tax_report, tax_report_parameters
+from jal.db.helpers import get_dbfilename, readSQL
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -148,3 +152,72 @@ def test_taxes_rus_bonds(tmp_path, project_root, data_path, prepare_db_taxes):
     #         continue
     #     reports_xls.output_data(tax_report[section], templates[section], parameters)
     # reports_xls.save()
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_xlsx_streamed_merges(tmp_path):
+    template = XLSX.load_template("tax_rus_trades.json")['trade']
+    data = []
+    for i in range(3):
+        trade = {'report_template': 'trade'}
+        for row, row_template in enumerate(template['rows']):
+            for col, key in enumerate(row_template):
+                if key is not None:     # Text, timestamp or number depending on the field format
+                    trade[key] = {'T': f"{key}_{i}", 'D': 1609459200 + i * 86400}.get(template['formats'][row][col][0],
+                                                                                     100 * i + col + row / 10)
+        data.append(trade)
+    parameters = {"period": "01.01.2021 - 31.12.2021", "account": "U7654321 (USD)", "currency": "USD"}
+    for file_name, constant_memory in [("normal.xlsx", False), ("streamed.xlsx", True)]:
+        report = XLSX(str(tmp_path) + os.sep + file_name, constant_memory=constant_memory)
+        report.output_data(data, "tax_rus_trades.json", parameters)
+        report.save()
+
+    normal = openpyxl.load_workbook(str(tmp_path) + os.sep + "normal.xlsx")["Акции"]
+    streamed = openpyxl.load_workbook(str(tmp_path) + os.sep + "streamed.xlsx")["Акции"]
+    values = [cell.value for row in streamed.iter_rows() for cell in row if cell.value is not None]
+    for trade in data:   # Every value is present in streamed report, including ones in the second row of each trade
+        assert all(trade[key] in values for key in trade if key != 'report_template' and type(trade[key]) != int)
+    assert [[cell.value for cell in row] for row in streamed.iter_rows()] == \
+           [[cell.value for cell in row] for row in normal.iter_rows()]
+    merges = sorted(str(x) for x in streamed.merged_cells.ranges)
+    assert merges == sorted(str(x) for x in normal.merged_cells.ranges)
+    assert len(merges) == 8 * len(data)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_taxes_rus_batch(tmp_path, data_path, prepare_db_taxes):
+    usd_rates = [
+        (1632441600, 72.7245), (1629936000, 73.7428), (1631664000, 72.7171), (1622073600, 73.4737),
+        (1621987200, 73.3963), (1621900800, 73.5266), (1621641600, 73.5803), (1632528000, 73.0081)
+    ]
+    create_quotes(2, usd_rates)
+
+    IBKR = StatementIBKR()
+    IBKR.load(data_path + 'ibkr_bond.xml')
+    IBKR.validate_format()
+    IBKR.match_db_ids(verbal=False)
+    IBKR.import_into_db()
+    create_assets([("GE", "General Electric Company", "US3696043013", 2, 2)])
+    stock_id = readSQL("SELECT id FROM assets WHERE isin='US3696043013'")
+    create_trades(1, [(1621987200, 1621987200, stock_id, 10, 100.0, 1.0, "B01"),      # Stock trade is reported
+                      (1632441600, 1632441600, stock_id, -10, 110.0, 1.0, "S01")])    # with vertical merges
+    ledger = Ledger()
+    ledger.rebuild(from_timestamp=0)
+
+    taxes = TaxesRus()
+    tax_report = taxes.prepare_tax_report(2021, 1)
+    assert tax_report["Акции"]
+    save_tax_report(str(tmp_path) + os.sep + "expected.xlsx", tax_report, tax_report_parameters(taxes))
+
+    saved = export_tax_reports(get_dbfilename(str(tmp_path) + os.sep), [1], [2020, 2021], str(tmp_path), max_workers=2)
+    assert sorted(saved.keys()) == [(1, 2020), (1, 2021)]
+    expected = pandas.read_excel(str(tmp_path) + os.sep + "expected.xlsx", sheet_name=None, header=None)
+    batch = pandas.read_excel(saved[(1, 2021)], sheet_name=None, header=None)
+    assert list(batch.keys()) == list(expected.keys())
+    for sheet in expected:
+        assert batch[sheet].equals(expected[sheet])
+    expected = openpyxl.load_workbook(str(tmp_path) + os.sep + "expected.xlsx")
+    batch = openpyxl.load_workbook(saved[(1, 2021)])
+    for sheet in expected.sheetnames:
+        assert sorted(str(x) for x in batch[sheet].merged_cells.ranges) == \
+               sorted(str(x) for x in expected[sheet].merged_cells.ranges)